@@ -3,10 +3,12 @@ from . import export
 from . import lookup
 from . import list as list_cmd
 from . import build_clueweb_warc_indexes
+from . import build_docstore_filter
 from . import build_download_cache
 from . import build_c4_checkpoints
 from . import clean
 from . import generate_metadata
+from . import serve
 
 COMMANDS = {
 	'doc_fifos': doc_fifos.main,
@@ -15,7 +17,9 @@ COMMANDS = {
     'list': list_cmd.main,
     'build_clueweb_warc_indexes': build_clueweb_warc_indexes.main,
     'build_c4_checkpoints': build_c4_checkpoints.main,
+    'build_docstore_filter': build_docstore_filter.main,
     'build_download_cache': build_download_cache.main,
     'clean': clean.main,
     'generate_metadata': generate_metadata.main,
+    'serve': serve.main,
 }
@@ -0,0 +1,25 @@
+import sys
+import argparse
+import ir_datasets
+
+
+_logger = ir_datasets.log.easy()
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog='ir_datasets build_docstore_filter', description='Builds the filter of doc_ids that lets docstore lookups skip doc_ids that are not in the corpus (e.g., for ClueWeb and GOV2).')
+    parser.add_argument('dataset')
+    args = parser.parse_args(args)
+    dataset = ir_datasets.load(args.dataset)
+    if not dataset.has_docs():
+        sys.stderr.write(f'{args.dataset} does not provide docs\n')
+        sys.exit(1)
+    docstore = dataset.docs_handler().docs_store()
+    if not hasattr(docstore, 'build_filter') or not docstore.build_filter():
+        sys.stderr.write(f'{args.dataset} does not support a doc_id filter\n')
+        sys.exit(1)
+    _logger.info(f'doc_id filter built for {args.dataset}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,53 @@
+import os
+import sys
+import argparse
+import ir_datasets
+
+
+_logger = ir_datasets.log.easy()
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog='ir_datasets serve', description='Serves the docstores of datasets over a Unix domain socket, '
+        'so that the processes on a machine share a single warm copy of each docstore. Clients use the server when '
+        'IR_DATASETS_DOCSTORE_SERVER is set to the socket path.')
+    parser.add_argument('datasets', nargs='+', help='dataset IDs to serve')
+    parser.add_argument('--socket', help='path of the socket (default: IR_DATASETS_DOCSTORE_SERVER or docstore.sock in IR_DATASETS_HOME)')
+    parser.add_argument('--no-build', action='store_true', help='do not build (or open) the docstores before serving')
+
+    args = parser.parse_args(args)
+    env_path = os.environ.pop('IR_DATASETS_DOCSTORE_SERVER', None) # this process opens the docstores itself
+    path = args.socket or env_path or str(ir_datasets.util.home_path() / 'docstore.sock')
+
+    datasets = {}
+    for dataset_id in args.datasets:
+        try:
+            dataset = ir_datasets.load(dataset_id)
+        except KeyError:
+            sys.stderr.write(f"Dataset {dataset_id} not found.\n")
+            sys.exit(1)
+        if not dataset.has_docs():
+            sys.stderr.write(f"Dataset {dataset_id} does not have docs.\n")
+            sys.exit(1)
+        # clients ask for the docstore of their dataset's corpus (e.g., msmarco-passage for msmarco-passage/dev/small)
+        datasets[ir_datasets.docs_parent_id(dataset_id)] = dataset
+
+    server = ir_datasets.indices.DocstoreServer(path, datasets)
+    try:
+        if not args.no_build:
+            for dataset_id in datasets:
+                docstore = server.docstore(dataset_id)
+                if hasattr(docstore, 'build'):
+                    with _logger.duration(f'preparing {dataset_id} docstore'):
+                        docstore.build()
+        _logger.info(f'serving {", ".join(datasets)} at {path}')
+        sys.stderr.write(f'To use the server, run:\nexport IR_DATASETS_DOCSTORE_SERVER={path}\n')
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,6 +1,10 @@
+import os
+import random
 import pkgutil
 import contextlib
 import itertools
+import multiprocessing
+from threading import Semaphore
 from pathlib import Path
 import ir_datasets
 from ir_datasets.formats import BaseQueries, BaseQrels, BaseScoredDocs, BaseDocPairs
@@ -13,12 +17,15 @@ class Dataset:
     def __init__(self, *constituents):
         self._constituents = [c for c in constituents if c is not None]
         self._beta_apis = {}
+        self._docstore_caches = {}
 
     def __getstate__(self):
         return self._constituents
 
     def __setstate__(self, state):
         self._constituents = state
+        self._beta_apis = {}
+        self._docstore_caches = {}
 
     def __getattr__(self, attr):
         if attr == 'docs' and self.has_docs():
@@ -45,11 +52,69 @@ class Dataset:
             if 'qlogs' not in self._beta_apis:
                 self._beta_apis['qlogs'] = _BetaPythonApiQlogs(self)
             return self._beta_apis['qlogs']
+        if attr == 'docs_store' and any(os.environ.get(v) for v in ('IR_DATASETS_DOCSTORE_CACHE', 'IR_DATASETS_DOCSTORE_SERVER', 'IR_DATASETS_DOCSTORE_FORMAT')):
+            return self._cached_docs_store
         for cons in self._constituents:
             if hasattr(cons, attr):
                 return getattr(cons, attr)
         raise AttributeError(attr)
 
+    def _cached_docs_store(self, *args, **kwargs):
+        # When IR_DATASETS_DOCSTORE_CACHE is set (to a number of documents or a size, like 512MB), keep recently
+        # used documents in memory. Repeated calls to docs_store() share the same cache.
+        # When IR_DATASETS_DOCSTORE_SERVER is set (to the socket of `ir_datasets serve`), look up documents through
+        # the server rather than opening the docstore in this process (if the server has the dataset's corpus).
+        # When IR_DATASETS_DOCSTORE_FORMAT selects arrow or parquet for this dataset, use an ArrowDocstore in place
+        # of a PickleLz4FullStore (see ir_datasets.indices.arrow_docstore.parse_format_spec).
+        key = (args, tuple(sorted(kwargs.items())))
+        if key not in self._docstore_caches:
+            server = os.environ.get('IR_DATASETS_DOCSTORE_SERVER')
+            docstore = None
+            if server and not args and not kwargs and hasattr(self, 'dataset_id'):
+                docstore = self._remote_docs_store(server)
+            if docstore is None:
+                docstore = self._raw_docs_store(*args, **kwargs)
+                if docstore is None:
+                    raise AttributeError('docs_store')
+                fmt = None
+                if os.environ.get('IR_DATASETS_DOCSTORE_FORMAT'):
+                    dataset_id = self.dataset_id() if hasattr(self, 'dataset_id') else None
+                    fmt = ir_datasets.indices.arrow_docstore.parse_format_spec(os.environ['IR_DATASETS_DOCSTORE_FORMAT'], dataset_id)
+                if fmt is not None and isinstance(docstore, ir_datasets.indices.PickleLz4FullStore):
+                    docstore = ir_datasets.indices.ArrowDocstore.from_store(docstore, fmt)
+            if os.environ.get('IR_DATASETS_DOCSTORE_CACHE'):
+                max_docs, max_bytes = ir_datasets.indices.lru_docstore.parse_cache_size(os.environ['IR_DATASETS_DOCSTORE_CACHE'])
+                docstore = ir_datasets.indices.LruDocstore(docstore, max_docs=max_docs, max_bytes=max_bytes)
+            self._docstore_caches[key] = docstore
+        return self._docstore_caches[key]
+
+    def _raw_docs_store(self, *args, **kwargs):
+        # docs_store() of the constituents, without the wrappers of _cached_docs_store (which are only added by the
+        # outermost Dataset); None if none of them have one
+        for cons in self._constituents:
+            if isinstance(cons, Dataset):
+                docstore = cons._raw_docs_store(*args, **kwargs)
+                if docstore is not None:
+                    return docstore
+            elif hasattr(cons, 'docs_store'):
+                return cons.docs_store(*args, **kwargs)
+        return None
+
+    def _remote_docs_store(self, server):
+        # the docstore of this dataset's corpus on the server, or None if the server doesn't serve it
+        try:
+            corpus_id = ir_datasets.docs_parent_id(self.dataset_id())
+        except KeyError:
+            corpus_id = self.dataset_id() # not a registered dataset
+        docstore = ir_datasets.indices.RemoteDocstore(server, corpus_id, self.docs_cls())
+        try:
+            if docstore.served():
+                return docstore
+            _logger.info(f'{corpus_id} is not served at {server}; using the local docstore')
+        except OSError as ex:
+            _logger.warn(f'docstore server at {server} is unavailable ({ex}); using the local docstore')
+        return None
+
     def __repr__(self):
         supplies = []
         if self.has_docs():
@@ -98,6 +163,30 @@ class Dataset:
         return self.has(ir_datasets.EntityType.qlogs)
 
 
+def _init_iter_worker(handler):
+    global _iter_handler
+    _iter_handler = handler
+
+
+def _iter_chunk(bounds):
+    start, stop = bounds
+    return list(_iter_handler.docs_iter()[start:stop])
+
+
+def _shuffle_buffer(it, buffer_size, rng):
+    # yields the items of it in a shuffled order, keeping up to buffer_size of them in memory
+    buffer = []
+    for item in it:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+        else:
+            i = rng.randrange(buffer_size)
+            yield buffer[i]
+            buffer[i] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
 class _BetaPythonApiDocs:
     def __init__(self, handler):
         self._handler = handler
@@ -108,6 +197,10 @@ class _BetaPythonApiDocs:
     def __iter__(self):
         return self._handler.docs_iter()
 
+    def iter_batches(self, batch_size=1024, fields=None):
+        # yields column-oriented batches ({field: [values...]}); see ir_datasets.util.iter_batches
+        return ir_datasets.util.iter_batches(self._handler.docs_iter(), self.type, batch_size, fields)
+
     def __len__(self):
         return self._handler.docs_count()
 
@@ -117,6 +210,98 @@ class _BetaPythonApiDocs:
     def __repr__(self):
         return f'BetaPythonApiDocs({repr(self._handler)})'
 
+    def iter_parallel(self, workers=None, ordered=True, chunk_size=10000, max_in_flight=None):
+        """
+        Iterates over the documents with a pool of worker processes (default: one per CPU), each of which reads
+        contiguous chunks of chunk_size documents (through docs_iter()[start:stop]). With ordered=False, the
+        documents of each chunk are yielded as soon as it is finished, rather than in corpus order. At most
+        max_in_flight chunks (default: 2 per worker) are held in memory at a time.
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 1:
+            yield from self._handler.docs_iter()
+            return
+        # if slices come from the docstore, it's built here, rather than having every worker try to build it
+        it, count = self._docs_iter_for_slicing()
+        if count is None or not ir_datasets.util.is_seekable(it):
+            _logger.info('docs_iter does not support slicing (or docs_count is unknown); iterating in this process')
+            yield from it
+            return
+        semaphore = Semaphore(max_in_flight or workers * 2)
+        stopped = False
+        def it_chunks():
+            # pool.imap is greedy; only release a chunk when there's room for it
+            for start in range(0, count, chunk_size):
+                semaphore.acquire()
+                if stopped:
+                    return
+                yield start, min(start + chunk_size, count)
+
+        with multiprocessing.Pool(workers, initializer=_init_iter_worker, initargs=(self._handler,)) as pool:
+            try:
+                for docs in (pool.imap if ordered else pool.imap_unordered)(_iter_chunk, it_chunks()):
+                    semaphore.release()
+                    yield from docs
+            finally:
+                stopped = True
+                semaphore.release() # in case chunks are waiting on the semaphore
+
+    def iter_shuffled(self, seed=None, block_size=1024, buffer_size=16384, rank=0, world_size=1):
+        """
+        Iterates over the documents in a shuffled order that keeps reads near-sequential: the corpus is split into
+        contiguous blocks of block_size documents that are read (through docs_iter()[start:stop]) in a random
+        order, and the documents pass through a shuffle buffer of buffer_size documents. The order is determined by
+        seed. With world_size > 1, rank gets a disjoint share of the blocks; all the ranks must use the same seed.
+        """
+        assert 0 <= rank < world_size, "rank must be between 0 and world_size-1"
+        assert world_size == 1 or seed is not None, "a seed is required to split the blocks across ranks"
+        # the blocks depend on the count, so if slices come from the docstore, it's built first (otherwise the blocks
+        # would differ between runs before and after it's built)
+        it, count = self._docs_iter_for_slicing()
+        if count is None or not ir_datasets.util.is_seekable(it):
+            # blocks can only be read in corpus order
+            _logger.info('docs_iter does not support slicing (or docs_count is unknown); only shuffling within the buffer')
+            blocks = (block for block in iter(lambda: list(itertools.islice(it, block_size)), []))
+            docs = itertools.chain.from_iterable(itertools.islice(blocks, rank, None, world_size))
+        else:
+            starts = list(range(0, count, block_size))
+            random.Random(seed).shuffle(starts)
+            docs = itertools.chain.from_iterable(it[start:start+block_size] for start in starts[rank::world_size])
+        # each rank shuffles its documents differently
+        yield from _shuffle_buffer(docs, buffer_size, random.Random(f'{seed}:{rank}' if seed is not None else None))
+
+    def _docs_iter_for_slicing(self):
+        # docs_iter() and docs_count(), with the docstore built if docs_iter() slices from it
+        it = self._handler.docs_iter()
+        count = None
+        if isinstance(it, ir_datasets.util.DocstoreSplitter):
+            it.docs_store.build()
+            if hasattr(it.docs_store, 'count'):
+                count = it.docs_store.count()
+        if count is None:
+            count = self._handler.docs_count()
+        return it, count
+
+    def sample(self, k, seed=None, replace=False, in_sample_order=False):
+        """
+        Returns a list of k documents drawn uniformly at random (with replacement if replace=True). The documents
+        are read in one pass in corpus order (see ir_datasets.util.take_ordinals; docstores read them through their
+        indices and WARC/C4 sources skip ahead with their checkpoints), and are returned in corpus order, or in the
+        order they were drawn with in_sample_order=True.
+        """
+        count = self._handler.docs_count()
+        if count is None:
+            count = sum(1 for _ in self._handler.docs_iter())
+        rng = random.Random(seed)
+        if replace:
+            ordinals = [rng.randrange(count) for _ in range(k)] if count > 0 else []
+        else:
+            ordinals = rng.sample(range(count), k)
+        unique_ordinals = sorted(set(ordinals))
+        docs = dict(zip(unique_ordinals, ir_datasets.util.take_ordinals(self._handler.docs_iter(), unique_ordinals)))
+        return [docs[o] for o in (ordinals if in_sample_order else sorted(ordinals))]
+
     def lookup(self, doc_ids):
         if self._docstore is None:
             self._docstore = self._handler.docs_store()
@@ -147,6 +332,10 @@ class _BetaPythonApiQueries:
     def __iter__(self):
         return self._handler.queries_iter()
 
+    def iter_batches(self, batch_size=1024, fields=None):
+        # yields column-oriented batches ({field: [values...]}); see ir_datasets.util.iter_batches
+        return ir_datasets.util.iter_batches(self._handler.queries_iter(), self.type, batch_size, fields)
+
     def __repr__(self):
         return f'BetaPythonApiQueries({repr(self._handler)})'
 
@@ -192,6 +381,10 @@ class _BetaPythonApiQrels:
     def __iter__(self):
         return self._handler.qrels_iter()
 
+    def iter_batches(self, batch_size=1024, fields=None):
+        # yields column-oriented batches ({field: [values...]}); see ir_datasets.util.iter_batches
+        return ir_datasets.util.iter_batches(self._handler.qrels_iter(), self.type, batch_size, fields)
+
     def __repr__(self):
         return f'BetaPythonApiQrels({repr(self._handler)})'
 
@@ -223,6 +416,10 @@ class _BetaPythonApiScoreddocs:
     def __iter__(self):
         return self._handler.scoreddocs_iter()
 
+    def iter_batches(self, batch_size=1024, fields=None):
+        # yields column-oriented batches ({field: [values...]}); see ir_datasets.util.iter_batches
+        return ir_datasets.util.iter_batches(self._handler.scoreddocs_iter(), self.type, batch_size, fields)
+
     def __repr__(self):
         return f'BetaPythonApiScoreddocs({repr(self._handler)})'
 
@@ -247,6 +444,10 @@ class _BetaPythonApiDocpairs:
     def __iter__(self):
         return self._handler.docpairs_iter()
 
+    def iter_batches(self, batch_size=1024, fields=None):
+        # yields column-oriented batches ({field: [values...]}); see ir_datasets.util.iter_batches
+        return ir_datasets.util.iter_batches(self._handler.docpairs_iter(), self.type, batch_size, fields)
+
     def __repr__(self):
         return f'BetaPythonApiDocpairs({repr(self._handler)})'
 
@@ -271,6 +472,10 @@ class _BetaPythonApiQlogs:
     def __iter__(self):
         return self._handler.qlogs_iter()
 
+    def iter_batches(self, batch_size=1024, fields=None):
+        # yields column-oriented batches ({field: [values...]}); see ir_datasets.util.iter_batches
+        return ir_datasets.util.iter_batches(self._handler.qlogs_iter(), self.type, batch_size, fields)
+
     def __repr__(self):
         return f'BetaPythonApiQlogs({repr(self._handler)})'
 
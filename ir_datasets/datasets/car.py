@@ -56,6 +56,7 @@ class CarDocs(BaseDocs):
             lookup_field=field,
             index_fields=['doc_id'],
             count_hint=self._count_hint,
+            block_size=32,
         )
 
     def docs_count(self):
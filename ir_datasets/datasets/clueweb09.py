@@ -4,7 +4,7 @@ from pathlib import Path
 from typing import NamedTuple, Tuple
 from glob import glob
 import ir_datasets
-from ir_datasets.util import GzipExtract, Lazy, DownloadConfig, TarExtract, Cache, Bz2Extract, ZipExtract, TarExtractAll
+from ir_datasets.util import GzipExtract, Lazy, DownloadConfig, TarExtract, Cache, Bz2Extract, ZipExtract, TarExtractAll, Migrator
 from ir_datasets.formats import TrecQrels, TrecDocs, TrecXmlQueries, WarcDocs, GenericDoc, GenericQuery, TrecQrel, TrecSubQrels, TrecSubQrel, TrecSubtopic, TrecPrel, TrecPrels, TrecColonQueries, BaseQrels
 from ir_datasets.datasets.base import Dataset, FilteredQueries, FilteredQrels, YamlDocumentation
 from ir_datasets.indices import Docstore, CacheDocstore
@@ -103,6 +103,14 @@ class ClueWeb09Docs(WarcDocs):
             self._docs_warc_file_counts_cache = result
         return self._docs_warc_file_counts_cache
 
+    def _docs_ids_iter(self):
+        # doc_ids are numbered sequentially within each source file, e.g., clueweb09-en0000-00-00000 (checked against
+        # the file's checkpoints)
+        for source_file, count in sorted(self._docs_warc_file_counts().items()):
+            sec = os.path.basename(os.path.dirname(source_file))
+            part = os.path.basename(source_file)[:-len('.warc.gz')]
+            yield from self._docs_checked_ids(source_file, [f'clueweb09-{sec}-{part}-{i:05d}' for i in range(count)])
+
     def docs_namespace(self):
         return NAME
 
@@ -136,18 +144,22 @@ def _init():
 
     docs_dlc = dlc['docs']
     chk_dlc = TarExtractAll(dlc['docs.chk'], base_path/'corpus.chk')
-    collection = ClueWeb09Docs(docs_dlc, chk_dlc, lang=None) # multiple langs
-    collection_ar = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Arabic_1'], lang='ar')
-    collection_zh = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Chinese_1', 'ClueWeb09_Chinese_2', 'ClueWeb09_Chinese_3', 'ClueWeb09_Chinese_4'], lang='zh')
-    collection_en = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_English_1', 'ClueWeb09_English_2', 'ClueWeb09_English_3', 'ClueWeb09_English_4', 'ClueWeb09_English_5', 'ClueWeb09_English_6', 'ClueWeb09_English_7', 'ClueWeb09_English_8', 'ClueWeb09_English_9', 'ClueWeb09_English_10'], lang='en')
-    collection_fr = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_French_1'], lang='fr')
-    collection_de = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_German_1'], lang='de')
-    collection_it = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Italian_1'], lang='it')
-    collection_ja = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Japanese_1', 'ClueWeb09_Japanese_2'], lang='ja')
-    collection_ko = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Korean_1'], lang='ko')
-    collection_pt = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Portuguese_1'], lang='pt')
-    collection_es = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Spanish_1', 'ClueWeb09_Spanish_2'], lang='es')
-    collection_catb = ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_English_1'], lang='en')
+    # the document cache moved from corpus.cache to corpus.colcache (with a different layout), so remove the old one
+    migrator = Migrator(base_path/'irds_version.txt', 'v2',
+        affected_files=[base_path/'corpus.cache'],
+        message='Removing the old document cache (corpus.cache); documents are now cached in corpus.colcache')
+    collection = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, lang=None)) # multiple langs
+    collection_ar = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Arabic_1'], lang='ar'))
+    collection_zh = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Chinese_1', 'ClueWeb09_Chinese_2', 'ClueWeb09_Chinese_3', 'ClueWeb09_Chinese_4'], lang='zh'))
+    collection_en = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_English_1', 'ClueWeb09_English_2', 'ClueWeb09_English_3', 'ClueWeb09_English_4', 'ClueWeb09_English_5', 'ClueWeb09_English_6', 'ClueWeb09_English_7', 'ClueWeb09_English_8', 'ClueWeb09_English_9', 'ClueWeb09_English_10'], lang='en'))
+    collection_fr = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_French_1'], lang='fr'))
+    collection_de = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_German_1'], lang='de'))
+    collection_it = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Italian_1'], lang='it'))
+    collection_ja = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Japanese_1', 'ClueWeb09_Japanese_2'], lang='ja'))
+    collection_ko = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Korean_1'], lang='ko'))
+    collection_pt = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Portuguese_1'], lang='pt'))
+    collection_es = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_Spanish_1', 'ClueWeb09_Spanish_2'], lang='es'))
+    collection_catb = migrator(ClueWeb09Docs(docs_dlc, chk_dlc, dirs=['ClueWeb09_English_1'], lang='en'))
     base = Dataset(collection, documentation('_'))
 
     subsets['ar'] = Dataset(collection_ar, documentation('ar'))
@@ -7,7 +7,7 @@ from typing import NamedTuple, Tuple
 from glob import glob
 from pathlib import Path
 import ir_datasets
-from ir_datasets.util import DownloadConfig, TarExtract, TarExtractAll, Cache, Bz2Extract, ZipExtract, IterStream
+from ir_datasets.util import DownloadConfig, TarExtract, TarExtractAll, Cache, Bz2Extract, ZipExtract, IterStream, Migrator
 from ir_datasets.formats import TrecQrels, TrecSubQrels, TrecDocs, TrecXmlQueries, WarcDocs, GenericDoc, GenericQuery, TrecQrel, TrecSubQrel, NtcirQrels, TrecSubtopic
 from ir_datasets.datasets.base import Dataset, FilteredQueries, FilteredQrels, YamlDocumentation
 from ir_datasets.indices import Docstore, CacheDocstore
@@ -201,6 +201,20 @@ class ClueWeb12Docs(WarcDocs):
             self._docs_warc_file_counts_cache = result
         return self._docs_warc_file_counts_cache
 
+    def _docs_ids_iter(self):
+        if isinstance(self.docs_dlc, ClueWeb12b13Extractor):
+            return None # B13 keeps the doc_ids of the full collection, so they are not sequential in its files
+        if self.chk_dlc is None:
+            return None # no checkpoints to check the numbering against
+        return self._docs_ids_iter_sequential()
+
+    def _docs_ids_iter_sequential(self):
+        # doc_ids are numbered sequentially within each source file, e.g., clueweb12-0000tw-00-00000 (checked against
+        # the file's checkpoints)
+        for source_file, count in sorted(self._docs_warc_file_counts().items()):
+            sec, part = os.path.basename(source_file)[:-len('.warc.gz')].split('-')
+            yield from self._docs_checked_ids(source_file, [f'clueweb12-{sec}-{part}-{i:05d}' for i in range(count)])
+
     def docs_namespace(self):
         return NAME
 
@@ -261,8 +275,12 @@ def _init():
     docs_chk_dlc = TarExtractAll(dlc['docs.chk'], base_path/'corpus.chk')
     b13_dlc = Bz2Extract(Cache(TarExtract(dlc['cw12b-info'], 'ClueWeb12-CreateB13/software/CreateClueWeb12B13Dataset.jar'), base_path/'CreateClueWeb12B13Dataset.jar'))
 
-    collection = ClueWeb12Docs(docs_dlc, docs_chk_dlc)
-    collection_b13 = ClueWeb12Docs(ClueWeb12b13Extractor(docs_dlc, b13_dlc))
+    # the document caches moved from corpus[-b13].cache to corpus[-b13].colcache (with a different layout), so remove the old ones
+    migrator = Migrator(base_path/'irds_version.txt', 'v2',
+        affected_files=[base_path/'corpus.cache', base_path/'corpus-b13.cache'],
+        message='Removing the old document caches (corpus[-b13].cache); documents are now cached in corpus[-b13].colcache')
+    collection = migrator(ClueWeb12Docs(docs_dlc, docs_chk_dlc))
+    collection_b13 = migrator(ClueWeb12Docs(ClueWeb12b13Extractor(docs_dlc, b13_dlc)))
 
     base = Dataset(collection, documentation('_'))
 
@@ -1,3 +1,4 @@
+import functools
 import re
 import io
 import os
@@ -9,7 +10,7 @@ from pathlib import Path
 from typing import NamedTuple
 from glob import glob
 import ir_datasets
-from ir_datasets.util import DownloadConfig, GzipExtract, TarExtract
+from ir_datasets.util import DownloadConfig, GzipExtract, TarExtract, Migrator
 from ir_datasets.formats import TrecQrels, TrecQueries, TrecColonQueries, BaseDocs, GenericQuery, BaseQrels, TrecPrels
 from ir_datasets.datasets.base import Dataset, YamlDocumentation
 from ir_datasets.indices import Docstore
@@ -205,7 +206,17 @@ class Gov2Docs(BaseDocs):
 
     def docs_store(self):
         docstore = Gov2Docstore(self)
-        return ir_datasets.indices.CacheDocstore(docstore, f'{self.docs_path(force=False)}.cache')
+        # split the large fields into their own columns, so reading url or doc_id from the cache doesn't decompress the body
+        cache_cls = functools.partial(ir_datasets.indices.Lz4ColumnLookup, column_groups=[('doc_id', 'url', 'body_content_type'), ('http_headers',), ('body',)])
+        return ir_datasets.indices.CacheDocstore(docstore, f'{self.docs_path(force=False)}.colcache', cache_cls=cache_cls, init_iter_fn=self.docs_iter, valid_ids_fn=self._docs_ids_iter, valid_ids_count=self.docs_count)
+
+    def _docs_ids_iter(self):
+        # all doc_ids, as listed in the url-to-id mapping that comes with the corpus
+        docs_urls_path = os.path.join(self.docs_dlc.path(), 'GOV2_extras/url2id.gz')
+        with gzip.open(docs_urls_path, 'rt') as fin:
+            for line in fin:
+                url, doc_id = line.rstrip().split()
+                yield doc_id
 
     def docs_count(self):
         return sum(self._docs_file_counts().values())
@@ -298,7 +309,11 @@ def _init():
 
     docs_dlc = dlc['docs']
     doccount_dlc = Gov2DocCountFile(os.path.join(base_path, 'corpus.doccounts'), docs_dlc)
-    collection = Gov2Docs(docs_dlc, doccount_dlc)
+    # the document cache moved from corpus.cache to corpus.colcache (with a different layout), so remove the old one
+    migrator = Migrator(base_path/'irds_version.txt', 'v2',
+        affected_files=[base_path/'corpus.cache'],
+        message='Removing the old document cache (corpus.cache); documents are now cached in corpus.colcache')
+    collection = migrator(Gov2Docs(docs_dlc, doccount_dlc))
     base = Dataset(collection, documentation('_'))
 
     subsets['trec-tb-2004'] = Dataset(
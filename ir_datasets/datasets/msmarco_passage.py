@@ -162,7 +162,7 @@ def _init():
         affected_files=[base_path/'collection.tsv', base_path/'collection.tsv.pklz4'],
         message=f'Migrating {NAME} (fixing passage encoding)')
 
-    collection = TsvDocs(Cache(FixEncoding(TarExtract(dlc['collectionandqueries'], 'collection.tsv')), base_path/'collection.tsv'), namespace='msmarco', lang='en', docstore_size_hint=14373971970, count_hint=ir_datasets.util.count_hint(NAME))
+    collection = TsvDocs(Cache(FixEncoding(TarExtract(dlc['collectionandqueries'], 'collection.tsv')), base_path/'collection.tsv'), namespace='msmarco', lang='en', docstore_size_hint=14373971970, count_hint=ir_datasets.util.count_hint(NAME), docstore_block_size=32)
     collection = migrator(collection)
     subsets = {}
 
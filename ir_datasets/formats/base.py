@@ -366,6 +366,18 @@ class SourceDocIter:
         self.slice = slice(self.slice.start + (self.slice.step or 1), self.slice.stop, self.slice.step)
         return result
 
+    def take(self, ordinals):
+        # yields the documents at the (sorted) ordinals of this slice in one pass, seeking ahead within sources
+        it = SourceDocIter(self.docs, self.slice)
+        step = self.slice.step or 1
+        for ordinal in ordinals:
+            it.slice = slice(self.slice.start + ordinal * step, self.slice.stop, step)
+            result = next(it, StopIteration)
+            if result is StopIteration:
+                break
+            yield result
+        it.close()
+
     def close(self):
         if self.current_iter is not None:
             self.current_iter.close()
@@ -2,11 +2,12 @@ import sys
 import codecs
 import contextlib
 import json
+import itertools
 from typing import Tuple
 import io
 import ir_datasets
 from .base import GenericDoc, GenericQuery, GenericDocPair, BaseDocs, BaseQueries, BaseDocPairs
-from ir_datasets.indices import PickleLz4FullStore
+from ir_datasets.indices import PickleLz4FullStore, LineOffsetIndex
 
 
 class _JsonlBase:
@@ -23,12 +24,88 @@ class _JsonlBase:
     def _path(self, force=True):
         return self._dlcs[0].path(force)
 
+    def _line_indices(self):
+        # see LineOffsetIndex.for_dlc (enabled by IR_DATASETS_LINE_INDEX); only used if every file can be indexed
+        line_indices = [LineOffsetIndex.for_dlc(dlc) for dlc in self._dlcs]
+        return None if None in line_indices else line_indices
+
     def _iter(self):
-        for dlc in self._dlcs:
-            with dlc.stream() as f:
-                for line in f:
-                    data = json.loads(line)
-                    yield self._cls(**{dockey: data[datakey] for dockey, datakey in self._mapping.items()})
+        return JsonlIter(self._dlcs, self._cls, self._mapping, self._line_indices())
+
+
+class JsonlIter:
+    def __init__(self, dlcs, cls, mapping, line_indices=None, slice=None):
+        self.dlcs = dlcs
+        self.cls = cls
+        self.mapping = mapping
+        # line_indices: a LineOffsetIndex of each of dlcs, which allows slicing (e.g., it[1000:2000])
+        self.line_indices = line_indices
+        self.slice = slice
+        self.lines = None
+
+    def _iter_data(self):
+        if self.slice is None:
+            for dlc in self.dlcs:
+                with dlc.stream() as f:
+                    for line in f:
+                        yield json.loads(line)
+            return
+        start, stop, step = self.slice.start, self.slice.stop, self.slice.step or 1
+        file_start = 0
+        for line_index in self.line_indices:
+            file_stop = file_start + len(line_index)
+            if start < min(stop, file_stop):
+                with open(line_index.path, 'rb') as f:
+                    f.seek(line_index[start - file_start])
+                    while start < min(stop, file_stop):
+                        yield json.loads(f.readline())
+                        start += step
+                        if step != 1 and start < file_stop:
+                            f.seek(line_index[start - file_start])
+            file_start = file_stop
+
+    @property
+    def seekable(self):
+        return self.line_indices is not None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.lines is None:
+            self.lines = self._iter_data()
+        data = next(self.lines)
+        return self.cls(**{dockey: data[datakey] for dockey, datakey in self.mapping.items()})
+
+    def iter_batches(self, batch_size=1024, fields=None):
+        # see ir_datasets.util.iter_batches; values go straight from the parsed json into the batches
+        fields = list(fields or self.cls._fields)
+        keys = [self.mapping[f] for f in fields]
+        if self.lines is None:
+            self.lines = self._iter_data()
+        while True:
+            batch = list(itertools.islice(self.lines, batch_size))
+            if not batch:
+                return
+            yield {field: [data[key] for data in batch] for field, key in zip(fields, keys)}
+
+    def __getitem__(self, key):
+        if self.line_indices is None:
+            raise TypeError('slicing requires a line index (see IR_DATASETS_LINE_INDEX)')
+        orig_slice = self.slice or slice(0, sum(len(i) for i in self.line_indices), 1)
+        if isinstance(key, slice):
+            # it[start:stop:step]
+            new_slice = ir_datasets.util.apply_sub_slice(orig_slice, key)
+            return JsonlIter(self.dlcs, self.cls, self.mapping, self.line_indices, new_slice)
+        elif isinstance(key, int):
+            # it[index]
+            new_slice = ir_datasets.util.slice_idx(orig_slice, key)
+            new_it = JsonlIter(self.dlcs, self.cls, self.mapping, self.line_indices, new_slice)
+            try:
+                return next(new_it)
+            except StopIteration as e:
+                raise IndexError(e)
+        raise TypeError('key must be int or slice')
 
 
 class JsonlDocs(_JsonlBase, BaseDocs):
@@ -67,6 +144,9 @@ class JsonlDocs(_JsonlBase, BaseDocs):
     def docs_count(self):
         if self.docs_store().built():
             return self.docs_store().count()
+        line_indices = self._line_indices()
+        if line_indices is not None:
+            return sum(len(i) for i in line_indices)
         return None
 
     def docs_lang(self):
@@ -3,12 +3,17 @@ from typing import Tuple
 import io
 import ir_datasets
 from .base import GenericDoc, GenericQuery, GenericDocPair, BaseDocs, BaseQueries, BaseDocPairs
-from ir_datasets.indices import PickleLz4FullStore
+from ir_datasets.indices import PickleLz4FullStore, LineOffsetIndex
+
+
+SEEK_MIN_LINES = 64 # with a line index, seek rather than read ahead when skipping more lines than this
 
 
 class FileLineIter:
-    def __init__(self, dlc, start=None, stop=None, step=1):
+    def __init__(self, dlc, start=None, stop=None, step=1, line_index=None):
         self.dlc = dlc
+        # line_index: a LineOffsetIndex of dlc (with skip_blank=True), used to seek directly to lines
+        self.line_index = line_index
         self.stream_idx = 0
         self.stream = None
         self.pos = -1
@@ -21,7 +26,16 @@ class FileLineIter:
         if self.stop is not None and self.start >= self.stop:
             self.ctxt.close()
             raise StopIteration
-        if self.stream is None:
+        if self.line_index is not None and (self.stream is None or self.start - self.pos > SEEK_MIN_LINES):
+            if self.start >= len(self.line_index):
+                self.ctxt.close()
+                raise StopIteration
+            self.ctxt.close()
+            f = self.ctxt.enter_context(open(self.line_index.path, 'rb'))
+            f.seek(self.line_index[self.start])
+            self.stream = io.TextIOWrapper(f)
+            self.pos = self.start - 1
+        elif self.stream is None:
             if isinstance(self.dlc, list):
                 self.stream = io.TextIOWrapper(self.ctxt.enter_context(self.dlc[self.stream_idx].stream()))
             else:
@@ -37,12 +51,19 @@ class FileLineIter:
                     self.stream = io.TextIOWrapper(self.ctxt.enter_context(self.dlc[self.stream_idx].stream()))
                     line = self.stream.readline()
                 else:
+                    self.stop = self.start # exhausted; don't read again if called again
                     raise StopIteration()
             else:
+                self.stop = self.start
                 raise StopIteration()
         self.start += self.step
         return line
 
+    @property
+    def seekable(self):
+        # whether slices start reading at their first line (rather than reading the lines before it)
+        return self.line_index is not None
+
     def __iter__(self):
         return self
 
@@ -52,32 +73,8 @@ class FileLineIter:
     def __getitem__(self, key):
         if not isinstance(key, slice):
             raise TypeError('key must be slice')
-        start, stop, step = self.start, self.stop, self.step
-        if key.start is not None:
-            if not isinstance(key.start, int):
-                raise TypeError('start must be int')
-            if key.start < 0:
-                if stop is None:
-                    raise ValueError('start cannot be negative with unknown size')
-                start = stop + key.start
-            else:
-                start = start + key.start
-        if key.stop is not None:
-            if not isinstance(key.stop, int):
-                raise TypeError('stop must be int')
-            if key.stop < 0:
-                if stop is None:
-                    raise ValueError('stop cannot be negative with unknown size')
-                stop = stop + (key.stop + 1)
-            else:
-                stop = key.stop
-        if key.step is not None:
-            if not isinstance(key.step, int):
-                raise TypeError('step must be int')
-            if key.step <= 0:
-                raise ValueError('step must be a positive')
-            step = self.step * key.step
-        return FileLineIter(self.dlc, start, stop, step)
+        new_slice = ir_datasets.util.apply_sub_slice(slice(self.start, self.stop, self.step), key)
+        return FileLineIter(self.dlc, new_slice.start, new_slice.stop, new_slice.step, self.line_index)
 
 
 class TsvIter:
@@ -89,6 +86,9 @@ class TsvIter:
         return self
 
     def __next__(self):
+        return self.cls(*self._next_cols())
+
+    def _next_cols(self):
         line = next(self.line_iter)
         cols = line.rstrip('\n').split('\t')
         num_cols = len(self.cls._fields)
@@ -104,9 +104,35 @@ class TsvIter:
         else:
             if len(cols) != len(self.cls._fields):
                 raise RuntimeError(f'expected {len(self.cls._fields)} fields, got {len(cols)}')
-        return self.cls(*cols)
+        return cols
+
+    def iter_batches(self, batch_size=1024, fields=None):
+        # see ir_datasets.util.iter_batches; the parsed columns go straight into the batches
+        fields = list(fields or self.cls._fields)
+        field_idxs = [self.cls._fields.index(f) for f in fields]
+        exhausted = False
+        while not exhausted:
+            rows = []
+            for _ in range(batch_size):
+                try:
+                    rows.append(self._next_cols())
+                except StopIteration:
+                    exhausted = True # don't call it again (not all line iterators support that)
+                    break
+            if rows:
+                yield ir_datasets.util.batch_columns(rows, fields, field_idxs)
+
+    @property
+    def seekable(self):
+        return getattr(self.line_iter, 'seekable', False)
 
     def __getitem__(self, key):
+        if isinstance(key, int):
+            # it[index]
+            try:
+                return next(TsvIter(self.cls, self.line_iter[key:]))
+            except StopIteration as e:
+                raise IndexError(e)
         return TsvIter(self.cls, self.line_iter[key])
 
 
@@ -121,22 +147,30 @@ class _TsvBase:
     def _path(self, force=True):
         return self._dlc.path(force)
 
+    def _line_index(self):
+        # see LineOffsetIndex.for_dlc (enabled by IR_DATASETS_LINE_INDEX)
+        return LineOffsetIndex.for_dlc(self._dlc, skip_blank=True)
+
     def _iter(self):
         stop = None
-        if hasattr(self, f'{self._datatype}_count'):
-            stop = getattr(self, f'{self._datatype}_count')()
         start = 1 if self._skip_first_line else 0
-        return TsvIter(self._cls, FileLineIter(self._dlc, start=start, stop=stop, step=1))
+        line_index = self._line_index()
+        if line_index is not None:
+            stop = len(line_index)
+        elif hasattr(self, f'{self._datatype}_count'):
+            stop = getattr(self, f'{self._datatype}_count')()
+        return TsvIter(self._cls, FileLineIter(self._dlc, start=start, stop=stop, step=1, line_index=line_index))
 
 
 class TsvDocs(_TsvBase, BaseDocs):
-    def __init__(self, docs_dlc, doc_cls=GenericDoc, doc_store_index_fields=None, namespace=None, lang=None, skip_first_line=False, docstore_size_hint=None, count_hint=None):
+    def __init__(self, docs_dlc, doc_cls=GenericDoc, doc_store_index_fields=None, namespace=None, lang=None, skip_first_line=False, docstore_size_hint=None, count_hint=None, docstore_block_size=None):
         super().__init__(docs_dlc, doc_cls, "docs", skip_first_line=skip_first_line)
         self._doc_store_index_fields = doc_store_index_fields
         self._docs_namespace = namespace
         self._docs_lang = lang
         self._docstore_size_hint = docstore_size_hint
         self._count_hint = count_hint
+        self._docstore_block_size = docstore_block_size
 
     def docs_path(self, force=True):
         return self._path(force)
@@ -158,6 +192,7 @@ class TsvDocs(_TsvBase, BaseDocs):
             index_fields=fields,
             size_hint=self._docstore_size_hint,
             count_hint=self._count_hint,
+            block_size=self._docstore_block_size,
         )
 
     def docs_namespace(self):
@@ -166,6 +201,9 @@ class TsvDocs(_TsvBase, BaseDocs):
     def docs_count(self):
         if self.docs_store().built():
             return self.docs_store().count()
+        line_index = self._line_index()
+        if line_index is not None:
+            return len(line_index) - (1 if self._skip_first_line else 0)
         return None
 
     def docs_lang(self):
@@ -1,3 +1,5 @@
+import os
+import functools
 import gzip
 import re
 from contextlib import contextmanager, ExitStack
@@ -6,6 +8,9 @@ import ir_datasets
 from ir_datasets.formats import BaseDocs
 
 
+_logger = ir_datasets.log.easy()
+
+
 class WarcDoc(NamedTuple):
     doc_id: str
     url: str
@@ -74,9 +79,31 @@ class WarcDocs(BaseDocs):
         # For Warc Docstore lookups
         return None
 
+    def _docs_ids_iter(self):
+        # All doc_ids, if they can be listed without reading the documents (for rejecting invalid doc_ids); None otherwise
+        return None
+
+    def _docs_checked_ids(self, source_file, doc_ids):
+        # doc_ids: the expected doc_ids of source_file, in order (e.g., numbered from its record count). They're checked
+        # against the doc_ids recorded in the file's checkpoints; if they don't match (or there's no checkpoint file),
+        # the doc_ids are read from source_file itself.
+        checkpoint_file = self._docs_source_file_to_checkpoint(source_file)
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            with ir_datasets.indices.WarcIndexFile(checkpoint_file, 'rb') as f_chk:
+                while f_chk:
+                    doc_id, doc_idx, _, _, _ = f_chk.read()
+                    if doc_idx >= len(doc_ids) or doc_ids[doc_idx] != doc_id:
+                        _logger.info(f'doc_ids of {source_file} are not as expected (found {doc_id} at {doc_idx}); reading them from the file')
+                        break
+                else:
+                    return doc_ids
+        return [doc.doc_id for doc in self._docs_ctxt_iter_warc(source_file)]
+
     def docs_store(self):
         docstore = ir_datasets.indices.ClueWebWarcDocstore(self)
-        return ir_datasets.indices.CacheDocstore(docstore, f'{self.docs_path(force=False)}.cache')
+        # split the large fields into their own columns, so reading url or doc_id from the cache doesn't decompress the body
+        cache_cls = functools.partial(ir_datasets.indices.Lz4ColumnLookup, column_groups=[('doc_id', 'url', 'date', 'body_content_type'), ('http_headers',), ('body',)])
+        return ir_datasets.indices.CacheDocstore(docstore, f'{self.docs_path(force=False)}.colcache', cache_cls=cache_cls, init_iter_fn=self.docs_iter, valid_ids_fn=self._docs_ids_iter, valid_ids_count=self.docs_count)
 
     def docs_cls(self):
         return WarcDoc
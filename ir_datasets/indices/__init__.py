@@ -3,5 +3,12 @@ from .indexed_tsv_docstore import IndexedTsvDocstore
 from .zpickle_docstore import ZPickleDocStore
 from .numpy_sorted_index import NumpySortedIndex, NumpyPosIndex
 from .lz4_pickle import Lz4PickleLookup, PickleLz4FullStore
+from .lz4_columns import Lz4ColumnLookup
+from .lz4_shards import Lz4ShardedLookup
+from .bloom_filter import BloomFilter
+from .line_offsets import LineOffsetIndex
 from .cache_docstore import CacheDocstore
-from .clueweb_warc import ClueWebWarcIndex, ClueWebWarcDocstore, WarcIter
+from .lru_docstore import LruDocstore
+from .arrow_docstore import ArrowDocstore
+from .remote_docstore import RemoteDocstore, DocstoreServer
+from .clueweb_warc import WarcIndexFile, ClueWebWarcIndex, ClueWebWarcDocstore, WarcIter
@@ -0,0 +1,407 @@
+import os
+import pickle
+import shutil
+import fnmatch
+import datetime
+import itertools
+from threading import Lock
+import ir_datasets
+from . import Docstore, NumpySortedIndex
+from .lz4_pickle import safe_str
+
+
+_logger = ir_datasets.log.easy()
+
+
+FORMATS = ('arrow', 'parquet')
+
+
+def parse_format_spec(spec, dataset_id):
+    """
+    Parses a docstore format specification, such as from IR_DATASETS_DOCSTORE_FORMAT. Either a format for all
+    datasets (e.g., "parquet") or comma-separated dataset_id=format pairs, where dataset_id can include
+    wildcards (e.g., "msmarco-passage*=arrow,c4/*=parquet"). Returns the format for dataset_id (or None).
+    """
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        pattern, _, fmt = entry.rpartition('=')
+        if pattern and not fnmatch.fnmatchcase(dataset_id or '', pattern):
+            continue
+        if fmt not in FORMATS + ('lz4',):
+            raise ValueError(f'invalid docstore format {fmt!r}; expected one of {FORMATS + ("lz4",)}')
+        return fmt if fmt != 'lz4' else None
+    return None
+
+
+def _arrow_type(pa, annotation):
+    return {
+        str: pa.string(),
+        bytes: pa.binary(),
+        int: pa.int64(),
+        float: pa.float64(),
+        bool: pa.bool_(),
+        datetime.datetime: pa.timestamp('us'),
+    }.get(annotation)
+
+
+class ArrowDocsIter:
+    def __init__(self, docstore, slice):
+        self.docstore = docstore
+        self.slice = slice
+        self.rows = None
+
+    def _iter_columns(self, fields):
+        # yields lists of columns for the rows in the slice, a row group at a time
+        start, stop, step = self.slice.start, self.slice.stop, self.slice.step or 1
+        group_size = self.docstore._group_size()
+        while start < stop:
+            group = start // group_size
+            group_start = group * group_size
+            end = min(group_start + group_size, stop)
+            columns = self.docstore._read_group(group, fields)
+            yield [self.docstore._decode(field, col.slice(start - group_start, end - start).to_pylist()[::step]) for field, col in zip(fields, columns)]
+            start += -(-(end - start) // step) * step # the first row past the group that's in the slice
+
+    def __next__(self):
+        if self.rows is None:
+            fields = self.docstore._doc_cls._fields
+            self.rows = (row for columns in self._iter_columns(fields) for row in zip(*columns))
+        if self.slice.start >= self.slice.stop:
+            raise StopIteration
+        result = self.docstore._doc_cls(*next(self.rows))
+        self.slice = slice(self.slice.start + (self.slice.step or 1), self.slice.stop, self.slice.step)
+        return result
+
+    def __iter__(self):
+        return self
+
+    def iter_batches(self, batch_size=1024, fields=None):
+        # see ir_datasets.util.iter_batches; only the requested columns are read
+        fields = list(fields or self.docstore._doc_cls._fields)
+        pending = {field: [] for field in fields}
+        for columns in self._iter_columns(fields):
+            for field, column in zip(fields, columns):
+                pending[field].extend(column)
+            while len(pending[fields[0]]) >= batch_size:
+                yield {field: values[:batch_size] for field, values in pending.items()}
+                pending = {field: values[batch_size:] for field, values in pending.items()}
+        if pending[fields[0]]:
+            yield pending
+
+    def take(self, ordinals):
+        # yields the documents at the (sorted) ordinals of this slice, reading each row group once
+        step = self.slice.step or 1
+        rows = [self.slice.start + o * step for o in ordinals]
+        rows = [r for r in rows if r < self.slice.stop]
+        for values in self.docstore._read_rows(rows, self.docstore._doc_cls._fields):
+            yield self.docstore._doc_cls(*values)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            # it[start:stop:step]
+            new_slice = ir_datasets.util.apply_sub_slice(self.slice, key)
+            return ArrowDocsIter(self.docstore, new_slice)
+        elif isinstance(key, int):
+            # it[index]
+            new_slice = ir_datasets.util.slice_idx(self.slice, key)
+            new_it = ArrowDocsIter(self.docstore, new_slice)
+            try:
+                return next(new_it)
+            except StopIteration as e:
+                raise IndexError(e)
+        raise TypeError('key must be int or slice')
+
+
+class ArrowDocstore(Docstore):
+    """
+    An alternative to PickleLz4FullStore that keeps documents in an Apache Arrow IPC file (format='arrow') or
+    a Parquet file (format='parquet'), in row groups of row_group_size documents, with sorted indices from the
+    values of index_fields to row numbers. Reads of some fields only touch the columns they are in.
+
+    The data file (data_path) is a regular Arrow/Parquet file, so it can also be used directly by other tools
+    (e.g., memory-mapped by HF datasets or read by Spark). Fields that Arrow can't represent are stored as
+    pickled binary columns (listed in the ir_datasets.pickled schema metadata). Tuples of simple values are stored
+    as lists, and converted back when read (ir_datasets.tuples).
+
+    Requires pyarrow.
+    """
+    def __init__(self, path, init_iter_fn, data_cls, lookup_field, index_fields, format='arrow', row_group_size=8192, count_hint=None, size_hint=None):
+        super().__init__(data_cls, lookup_field)
+        assert format in FORMATS, f"format must be one of {FORMATS}"
+        self.path = path
+        self.init_iter_fn = init_iter_fn
+        self.format = format
+        self.row_group_size = row_group_size
+        self.count_hint = count_hint
+        self.size_hint = size_hint
+        self.index_fields = list(index_fields)
+        if lookup_field not in self.index_fields:
+            self.index_fields.insert(0, lookup_field)
+        self.data_path = os.path.join(path, f'data.{format}')
+        self._reader = None
+        self._meta = None
+        self._idxs = {}
+        self._lock = Lock() # guards lazy initialization, and reads of Parquet files
+
+    @classmethod
+    def from_store(cls, store, format='arrow'):
+        # an ArrowDocstore with the same source and indices as a PickleLz4FullStore, stored alongside it
+        path = store.path[:-len('.pklz4')] if store.path.endswith('.pklz4') else store.path
+        return cls(f'{path}.{format}', store.init_iter_fn, store._doc_cls, store._id_field, store.lookup._index_fields,
+            format=format, count_hint=store.count_hint, size_hint=store.size_hint)
+
+    def _idx_path(self, field):
+        return os.path.join(self.path, f'idx.{safe_str(field)}')
+
+    def idx(self, field):
+        if field not in self._idxs:
+            with self._lock:
+                if field not in self._idxs:
+                    idx = NumpySortedIndex(self._idx_path(field), unique=field == self._id_field)
+                    idx._lazy_load()
+                    self._idxs[field] = idx
+        return self._idxs[field]
+
+    def _open(self):
+        if self._reader is None:
+            with self._lock:
+                if self._reader is None:
+                    pa = ir_datasets.lazy_libs.pyarrow()
+                    if self.format == 'arrow':
+                        reader = pa.ipc.open_file(pa.memory_map(self.data_path, 'r'))
+                        schema = reader.schema
+                        num_groups = reader.num_record_batches
+                        count = 0 if num_groups == 0 else (num_groups - 1) * int(schema.metadata[b'ir_datasets.row_group_size']) + reader.get_batch(num_groups - 1).num_rows
+                    else:
+                        reader = ir_datasets.lazy_libs.pyarrow_parquet().ParquetFile(self.data_path, memory_map=True)
+                        schema = reader.schema_arrow
+                        count = reader.metadata.num_rows
+                    self._meta = {
+                        'row_group_size': int(schema.metadata[b'ir_datasets.row_group_size']),
+                        'pickled': set(schema.metadata[b'ir_datasets.pickled'].decode().split()),
+                        'tuples': set(schema.metadata[b'ir_datasets.tuples'].decode().split()),
+                        'count': count,
+                    }
+                    self._reader = reader
+        return self._reader
+
+    def _group_size(self):
+        self._open()
+        return self._meta['row_group_size']
+
+    def _read_group(self, group, fields):
+        # returns the arrays of the fields in the row group
+        reader = self._open()
+        if self.format == 'arrow':
+            batch = reader.get_batch(group) # zero-copy from the memory mapping
+            return [batch.column(field) for field in fields]
+        with self._lock:
+            table = reader.read_row_group(group, columns=list(fields))
+        return [table.column(field) for field in fields]
+
+    def _decode(self, field, values):
+        if field in self._meta['pickled']:
+            return [pickle.loads(v) if v is not None else None for v in values]
+        if field in self._meta['tuples']:
+            return [tuple(v) if v is not None else None for v in values]
+        return values
+
+    def _read_rows(self, ordinals, fields):
+        # yields tuples of the values of fields for the sorted ordinals, reading each row group once
+        pa = ir_datasets.lazy_libs.pyarrow()
+        group_size = self._group_size()
+        for group, group_ordinals in itertools.groupby(ordinals, key=lambda o: o // group_size):
+            offsets = pa.array([o - group * group_size for o in group_ordinals], type=pa.int64())
+            columns = [self._decode(field, col.take(offsets).to_pylist()) for field, col in zip(fields, self._read_group(group, fields))]
+            yield from zip(*columns)
+
+    def _ordinals(self, idx, keys):
+        return sorted({o for o in idx[list(keys)] if o != -1})
+
+    def get_many_iter(self, doc_ids):
+        self.build()
+        for values in self._read_rows(self._ordinals(self.idx(self._id_field), doc_ids), self._doc_cls._fields):
+            yield self._doc_cls(*values)
+
+    def get_many_fields_iter(self, doc_ids, fields):
+        # only the columns of the requested fields are read
+        self.build()
+        fields = list(fields)
+        for values in self._read_rows(self._ordinals(self.idx(self._id_field), doc_ids), [self._id_field] + fields):
+            yield values[0], tuple(values[1:])
+
+    def lookup_by(self, field, values):
+        self.build()
+        if field not in self.index_fields and not os.path.exists(f'{self._idx_path(field)}.meta'):
+            with _logger.duration(f'building {field} index'):
+                self.build_index(field)
+        if isinstance(values, str):
+            values = (values,)
+        if field == self._id_field:
+            ordinals = self._ordinals(self.idx(field), values)
+        else:
+            ordinals = sorted(set(itertools.chain.from_iterable(self.idx(field).get_all(list(values)))))
+        for row in self._read_rows(ordinals, self._doc_cls._fields):
+            yield self._doc_cls(*row)
+
+    def scan(self, start=None, stop=None, prefix=None):
+        # yields the documents with ids in [start, stop) or that start with prefix, in the order they are stored
+        self.build()
+        _, ordinals = self.idx(self._id_field).scan(start, stop, prefix)
+        for row in self._read_rows(sorted(ordinals.tolist()), self._doc_cls._fields):
+            yield self._doc_cls(*row)
+
+    def build_index(self, field):
+        # indexes a field of an existing store, reading only its column
+        idx = NumpySortedIndex(self._idx_path(field), unique=False)
+        try:
+            it = ArrowDocsIter(self, slice(0, self.count(), 1))
+            ordinal = 0
+            for batch in it.iter_batches(self.row_group_size, [field]):
+                for value in batch[field]:
+                    idx.add(value, ordinal)
+                    ordinal += 1
+            idx.commit()
+        except:
+            idx.rollback()
+            raise
+        finally:
+            idx.close()
+        self.index_fields.append(field)
+
+    def build(self):
+        if self.built():
+            return
+        pa = ir_datasets.lazy_libs.pyarrow()
+        if self.size_hint:
+            ir_datasets.util.check_disk_free(self.path, self.size_hint)
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f'{self.data_path}.tmp'
+        idxs = [(self._doc_cls._fields.index(f), NumpySortedIndex(self._idx_path(f), unique=f == self._id_field)) for f in self.index_fields]
+        sink, writer, schema, pickled = None, None, None, None
+        try:
+            with _logger.duration('building docstore'):
+                count_hint = self.count_hint() if callable(self.count_hint) else self.count_hint
+                it = iter(_logger.pbar(self.init_iter_fn(), 'docs_iter', unit='doc', total=count_hint))
+                ordinal = 0
+                while True:
+                    rows = list(itertools.islice(it, self.row_group_size))
+                    if not rows and writer is not None:
+                        break
+                    columns = list(zip(*rows)) if rows else [[] for _ in self._doc_cls._fields]
+                    for field_idx, idx in idxs:
+                        for i, value in enumerate(columns[field_idx]):
+                            idx.add(value, ordinal + i)
+                    if writer is None:
+                        schema, pickled = self._schema(pa, columns)
+                        if self.format == 'arrow':
+                            sink = pa.OSFile(tmp_path, 'wb')
+                            writer = pa.ipc.new_file(sink, schema)
+                        else:
+                            writer = ir_datasets.lazy_libs.pyarrow_parquet().ParquetWriter(tmp_path, schema)
+                    if not rows:
+                        break # no documents
+                    arrays = []
+                    for field, values, field_type in zip(self._doc_cls._fields, columns, schema.types):
+                        if field in pickled:
+                            values = [pickle.dumps(v) for v in values]
+                        arrays.append(pa.array(values, type=field_type))
+                    batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+                    if self.format == 'arrow':
+                        writer.write_batch(batch)
+                    else:
+                        writer.write_table(pa.Table.from_batches([batch]), row_group_size=self.row_group_size)
+                    ordinal += len(rows)
+                writer.close()
+                writer = None
+                if sink is not None:
+                    sink.close()
+                    sink = None
+                for _, idx in idxs:
+                    idx.commit()
+                # the data file is moved into place last, so that the store is only considered built once complete
+                os.replace(tmp_path, self.data_path)
+        except:
+            if writer is not None:
+                writer.close()
+            if sink is not None:
+                sink.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            for _, idx in idxs:
+                idx.rollback()
+            raise
+        finally:
+            for _, idx in idxs:
+                idx.close()
+
+    def _schema(self, pa, columns):
+        # Arrow types come from the annotations of the fields when they are simple, otherwise they're inferred from
+        # the first row group. Fields that can't be represented exactly (anything beyond simple values and tuples of
+        # simple values) are pickled.
+        annotations = getattr(self._doc_cls, '__annotations__', {})
+        types, pickled, tuples = [], set(), set()
+        for field, values in zip(self._doc_cls._fields, columns):
+            field_type = _arrow_type(pa, annotations.get(field))
+            if field_type is None:
+                try:
+                    field_type = pa.array(values).type
+                except (pa.ArrowException, TypeError, ValueError):
+                    field_type = None
+                if pa.types.is_list(field_type) and all(type(v) is tuple for v in values if v is not None) and not pa.types.is_nested(field_type.value_type):
+                    tuples.add(field)
+                elif field_type is None or pa.types.is_nested(field_type) or pa.types.is_null(field_type):
+                    field_type = pa.binary()
+                    pickled.add(field)
+            types.append(pa.field(field, field_type))
+        metadata = {
+            'ir_datasets.row_group_size': str(self.row_group_size),
+            'ir_datasets.pickled': ' '.join(sorted(pickled)),
+            'ir_datasets.tuples': ' '.join(sorted(tuples)),
+        }
+        return pa.schema(types, metadata=metadata), pickled
+
+    def built(self):
+        return os.path.exists(self.data_path)
+
+    def handle(self):
+        self.build()
+        self._open()
+        return self
+
+    def close(self):
+        for idx in self._idxs.values():
+            idx.close()
+        self._idxs = {}
+        self._reader = None
+        self._meta = None
+
+    def __getstate__(self):
+        # see Lz4PickleLookup.__getstate__
+        state = dict(self.__dict__)
+        del state['_lock']
+        state['_reader'] = None
+        state['_meta'] = None
+        if self.built():
+            state['init_iter_fn'] = None # no longer needed, and often not picklable
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def clear_cache(self):
+        self.close()
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+
+    def __iter__(self):
+        self.build()
+        return ArrowDocsIter(self, slice(0, self.count(), 1))
+
+    def count(self):
+        self.build()
+        self._open()
+        return self._meta['count']
@@ -12,18 +12,44 @@ class Docstore:
             return result[doc_id]
         raise KeyError(f'doc_id={doc_id} not found')
 
-    def get_many(self, doc_ids, field=None):
+    def get_many(self, doc_ids, field=None, fields=None):
+        # field: return only the value of this field for each document
+        # fields: return a tuple of the values of these fields for each document
         result = {}
-        field_idx = self._doc_cls._fields.index(field) if field is not None else None
-        for doc in self.get_many_iter(doc_ids):
-            if field is not None:
-                result[doc.doc_id] = doc[field_idx]
-            else:
+        if field is not None:
+            for doc_id, values in self.get_many_fields_iter(doc_ids, [field]):
+                result[doc_id] = values[0]
+        elif fields is not None:
+            for doc_id, values in self.get_many_fields_iter(doc_ids, fields):
+                result[doc_id] = values
+        else:
+            for doc in self.get_many_iter(doc_ids):
                 result[doc.doc_id] = doc
         return result
 
     def get_many_iter(self, doc_ids):
         raise NotImplementedError()
 
+    def get_many_fields_iter(self, doc_ids, fields):
+        # yields (doc_id, (field values...)); docstores that can read individual fields should override this
+        field_idxs = [self._doc_cls._fields.index(f) for f in fields]
+        for doc in self.get_many_iter(doc_ids):
+            yield doc[self._id_field_idx], tuple(doc[i] for i in field_idxs)
+
+    def lookup_by(self, field, values):
+        # yields the documents where field (e.g., url) has any of the values; docstores that can index fields
+        # other than the id should override this
+        raise NotImplementedError(f'{type(self).__name__} does not support lookups by {field}')
+
+    def scan(self, start=None, stop=None, prefix=None):
+        # yields the documents with ids where start <= id < stop (either can be None for unbounded) or that start
+        # with prefix, in the order that's most efficient for the docstore
+        raise NotImplementedError(f'{type(self).__name__} does not support scans')
+
+    def handle(self):
+        # returns a picklable docstore to pass to other processes (e.g., data loader workers). Docstores backed by
+        # files prepare their indices here, so that the workers can attach to them cheaply.
+        return self
+
     def clear_cache(self):
         pass
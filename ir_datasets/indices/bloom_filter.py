@@ -0,0 +1,103 @@
+import os
+import math
+import hashlib
+import ir_datasets
+
+
+class BloomFilter:
+    """
+    A Bloom filter over a set of strings, stored as a bit array at path (with parameters in path.meta).
+    Membership tests never give false negatives, and give false positives at about false_positive_rate
+    (which is used when building the filter).
+    """
+    def __init__(self, path, false_positive_rate=0.01):
+        self.path = path
+        self.false_positive_rate = false_positive_rate
+        self.bits = None
+        self.num_bits = None
+        self.num_hashes = None
+        self.np = None
+
+    def built(self):
+        return os.path.exists(f'{self.path}.meta')
+
+    def build(self, keys, count=None, chunk_size=1024*1024):
+        # count: (an upper bound on) the number of keys, used to size the filter; keys are held in memory if not given
+        self._lazy_load()
+        np = self.np
+        if count is None:
+            keys = list(keys)
+            count = len(keys)
+        count = max(count, 1)
+        num_bits = max(64, math.ceil(-count * math.log(self.false_positive_rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, round(num_bits / count * math.log(2)))
+        bits = np.zeros((num_bits + 7) // 8, dtype='uint8')
+        keys = iter(keys)
+        while True:
+            chunk = [k for _, k in zip(range(chunk_size), keys)]
+            if not chunk:
+                break
+            idxs = self._bit_idxs(chunk, num_bits, num_hashes).ravel()
+            # combine the bits that go to the same byte first, since bits[...] |= ... drops repeated indices
+            byte_idxs = idxs >> np.uint64(3)
+            order = np.argsort(byte_idxs, kind='stable')
+            byte_idxs = byte_idxs[order]
+            values = (np.uint8(1) << (idxs[order] & np.uint64(7)).astype('uint8')).astype('uint8')
+            starts = np.flatnonzero(np.concatenate([[True], byte_idxs[1:] != byte_idxs[:-1]]))
+            bits[byte_idxs[starts]] |= np.bitwise_or.reduceat(values, starts)
+        with ir_datasets.util.finialized_file(self.path, 'wb') as f:
+            f.write(bits.tobytes())
+        with ir_datasets.util.finialized_file(f'{self.path}.meta', 'wt') as f:
+            f.write(f'{num_bits} {num_hashes}')
+        self.close()
+
+    def _bit_idxs(self, keys, num_bits, num_hashes):
+        # double hashing: the i-th bit of a key is (h1 + i * h2) % num_bits
+        np = self.np
+        digests = b''.join(hashlib.blake2b(k.encode('utf8'), digest_size=16).digest() for k in keys)
+        hashes = np.frombuffer(digests, dtype='<u8').reshape(-1, 2)
+        i = np.arange(num_hashes, dtype='uint64')
+        return (hashes[:, :1] + i * hashes[:, 1:]) % np.uint64(num_bits)
+
+    def _lazy_load(self):
+        if self.np is None:
+            self.np = ir_datasets.lazy_libs.numpy()
+        if self.bits is None and self.built():
+            with open(f'{self.path}.meta', 'rt') as f:
+                self.num_bits, self.num_hashes = (int(v) for v in f.read().split())
+            self.bits = self.np.memmap(self.path, dtype='uint8', mode='r')
+
+    def filter(self, keys):
+        # returns the keys that may be in the set (all keys if the filter isn't built)
+        self._lazy_load()
+        keys = list(keys)
+        if self.bits is None or not keys:
+            return keys
+        np = self.np
+        idxs = self._bit_idxs(keys, self.num_bits, self.num_hashes)
+        present = (self.bits[idxs >> np.uint64(3)] >> (idxs & np.uint64(7)).astype('uint8')) & 1
+        return [key for key, p in zip(keys, present.all(axis=1)) if p]
+
+    def __contains__(self, key):
+        return len(self.filter([key])) > 0
+
+    def close(self):
+        if self.bits is not None:
+            del self.bits
+            self.bits = None
+
+    def __getstate__(self):
+        # the bits are re-mapped lazily rather than copied
+        state = dict(self.__dict__)
+        state['bits'] = None
+        state['np'] = None
+        return state
+
+    def clear(self):
+        self.close()
+        for path in [self.path, f'{self.path}.meta']:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __del__(self):
+        self.close()
@@ -1,21 +1,40 @@
 import os
+from collections import namedtuple
 from contextlib import contextmanager
 import ir_datasets
-from . import Docstore, Lz4PickleLookup
+from . import Docstore, Lz4PickleLookup, PickleLz4FullStore, BloomFilter
+
+
+_logger = ir_datasets.log.easy()
 
 
 class CacheDocstore(Docstore):
-    def __init__(self, full_store, path, cache_cls=Lz4PickleLookup):
+    def __init__(self, full_store, path, cache_cls=Lz4PickleLookup, init_iter_fn=None, valid_ids_fn=None, valid_ids_count=None):
         super().__init__(full_store._doc_cls, full_store._id_field)
         self.full_store = full_store
         self._path = path
-        self.cache = cache_cls(path, self._doc_cls, self._id_field, [self._id_field])
+        # init_iter_fn: iterates all documents; used to build indices for lookup_by when full_store doesn't support it
+        self._init_iter_fn = init_iter_fn
+        self._field_stores = {}
+        # valid_ids_fn: returns an iterator over all doc_ids in the corpus (or None if they can't be listed cheaply).
+        #   Once build_filter() is run, they are kept in a Bloom filter, so lookups of doc_ids that are not in the
+        #   corpus skip full_store. Set IR_DATASETS_DOCSTORE_ID_FILTER=false to not use the filter.
+        # valid_ids_count: the number of doc_ids (or a function that returns it), used to size the filter
+        self._valid_ids_fn = valid_ids_fn
+        self._valid_ids_count = valid_ids_count
+        self._id_filter = None
+        if valid_ids_fn is not None and os.environ.get('IR_DATASETS_DOCSTORE_ID_FILTER', 'true').lower() != 'false':
+            self._id_filter = BloomFilter(f'{path}.ids.bloom')
+        self._id_filter_hint_logged = False
+        # the cache grows through many small transactions, so keys are added to tiers of the index
+        self.cache = cache_cls(path, self._doc_cls, self._id_field, [self._id_field], tiered_index=True)
 
     def get_many_iter(self, doc_ids):
         doc_ids_remaining = set(doc_ids)
         for doc in self.cache[doc_ids]:
             yield doc
             doc_ids_remaining.discard(doc[self._id_field_idx])
+        doc_ids_remaining = self._filter_ids(doc_ids_remaining)
         if doc_ids_remaining:
             # fall back on full_store & cache the results
             with self.cache.transaction() as trans:
@@ -23,6 +42,69 @@ class CacheDocstore(Docstore):
                     yield doc
                     trans.add(doc)
 
+    def get_many_fields_iter(self, doc_ids, fields):
+        doc_ids_remaining = set(doc_ids)
+        for doc_id, values in self.cache.get_fields(doc_ids, fields):
+            yield doc_id, values
+            doc_ids_remaining.discard(doc_id)
+        doc_ids_remaining = self._filter_ids(doc_ids_remaining)
+        if doc_ids_remaining:
+            # fall back on full_store & cache the full results
+            field_idxs = [self._doc_cls._fields.index(f) for f in fields]
+            with self.cache.transaction() as trans:
+                for doc in self.full_store.get_many_iter(doc_ids_remaining):
+                    yield doc[self._id_field_idx], tuple(doc[i] for i in field_idxs)
+                    trans.add(doc)
+
+    def _filter_ids(self, doc_ids):
+        # removes doc_ids that are certainly not in the corpus (if the filter is built)
+        if self._id_filter is None or not doc_ids:
+            return doc_ids
+        if not self._id_filter.built():
+            if not self._id_filter_hint_logged:
+                _logger.info(f'lookups of doc_ids that are not in the corpus read the source files; build_filter() '
+                             f'(or `ir_datasets build_docstore_filter <dataset_id>`) avoids this')
+                self._id_filter_hint_logged = True
+            return doc_ids
+        return set(self._id_filter.filter(doc_ids))
+
+    def build_filter(self):
+        # builds the Bloom filter of all doc_ids from valid_ids_fn (a pass over metadata such as checkpoints, but
+        # this can take a while for large corpora); returns whether the filter is built
+        if self._id_filter is None:
+            return False
+        if not self._id_filter.built():
+            valid_ids = self._valid_ids_fn()
+            if valid_ids is None:
+                self._id_filter = None # not available for this corpus
+                return False
+            count = self._valid_ids_count() if callable(self._valid_ids_count) else self._valid_ids_count
+            with _logger.duration('building doc_id filter'):
+                self._id_filter.build(_logger.pbar(valid_ids, desc='doc_ids', unit='id', total=count), count=count)
+        return True
+
+    def scan(self, start=None, stop=None, prefix=None):
+        # the cache may not have all the documents in the range
+        yield from self.full_store.scan(start, stop, prefix)
+
+    def lookup_by(self, field, values):
+        if self._init_iter_fn is None:
+            yield from self.full_store.lookup_by(field, values)
+            return
+        if field not in self._field_stores:
+            # a store of (id, field) pairs from a single pass over the documents, indexed by field
+            field_cls = namedtuple('FieldRecord', [self._id_field, field])
+            def init_iter_fn():
+                for doc in self._init_iter_fn():
+                    yield field_cls(doc[self._id_field_idx], getattr(doc, field))
+            self._field_stores[field] = PickleLz4FullStore(f'{self._path}.by_{field}', init_iter_fn, field_cls, self._id_field, [self._id_field, field])
+        doc_ids = [record[0] for record in self._field_stores[field].lookup_by(field, values)]
+        yield from self.get_many_iter(doc_ids)
+
     def clear_cache(self):
         self.cache.clear()
+        for field_store in self._field_stores.values():
+            field_store.clear_cache()
+        if self._id_filter is not None:
+            self._id_filter.clear()
         self.full_store.clear_cache()
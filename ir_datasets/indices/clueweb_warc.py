@@ -216,6 +216,18 @@ class WarcIter:
         self.slice = slice(self.slice.start + (self.slice.step or 1), self.slice.stop, self.slice.step)
         return result
 
+    def take(self, ordinals):
+        # yields the documents at the (sorted) ordinals of this slice in one pass, jumping ahead with checkpoints
+        it = WarcIter(self.warc_docs, self.slice)
+        step = self.slice.step or 1
+        for ordinal in ordinals:
+            it.slice = slice(self.slice.start + ordinal * step, self.slice.stop, step)
+            result = next(it, StopIteration)
+            if result is StopIteration:
+                break
+            yield result
+        it.close()
+
     def close(self):
         if self.current_file_source is not None:
             self.current_file_source.close()
@@ -0,0 +1,117 @@
+import os
+import json
+import array
+import ir_datasets
+
+
+_logger = ir_datasets.log.easy()
+
+
+PLAIN_CHECK_SIZE = 64 * 1024 # bytes compared between a stream and its file to check that the file isn't compressed
+
+
+def line_index_enabled():
+    return os.environ.get('IR_DATASETS_LINE_INDEX', 'false').lower() == 'true'
+
+
+class LineOffsetIndex:
+    """
+    The byte offsets of the lines of a plain (uncompressed) text file, so that it can be read from any line
+    without reading the lines before it. Built in a single pass over the file and kept alongside it
+    ({path}.lines, an array of uint64 offsets, with a .meta file), and rebuilt if the file changes.
+
+    With skip_blank=True, lines that are just a newline aren't counted (as with FileLineIter). Files with \\r
+    characters aren't indexed (they would be split differently by universal newlines), in which case the index is
+    not usable().
+    """
+    def __init__(self, path, skip_blank=False):
+        self.path = str(path)
+        self.skip_blank = skip_blank
+        self.index_path = f'{self.path}.nonblank.lines' if skip_blank else f'{self.path}.lines'
+        self._meta = None
+        self._offsets = None
+
+    @classmethod
+    def for_dlc(cls, dlc, skip_blank=False):
+        # a (built) index of the file of dlc, or None if line indices are disabled (IR_DATASETS_LINE_INDEX) or dlc
+        # doesn't stream a plain file (e.g., it's compressed or in an archive)
+        if not line_index_enabled():
+            return None
+        try:
+            path = dlc.path()
+        except (AttributeError, NotImplementedError):
+            return None
+        if not os.path.isfile(path):
+            return None
+        result = cls(path, skip_blank)
+        if not result.built():
+            with dlc.stream() as stream, open(path, 'rb') as f:
+                if stream.read(PLAIN_CHECK_SIZE) != f.read(PLAIN_CHECK_SIZE):
+                    return None
+            result.build()
+        return result if result.usable() else None
+
+    def _source_stat(self):
+        stat = os.stat(self.path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def meta(self):
+        if self._meta is None:
+            with open(f'{self.index_path}.meta', 'rt') as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    def built(self):
+        if not os.path.exists(f'{self.index_path}.meta'):
+            return False
+        meta = self.meta()
+        if meta['source'] != self._source_stat():
+            self._meta = None
+            return False # file changed since the index was built
+        return True
+
+    def usable(self):
+        return self.meta()['usable']
+
+    def build(self):
+        source_stat = self._source_stat()
+        offsets = array.array('Q')
+        usable = True
+        with _logger.duration(f'building line index of {self.path}'), open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if b'\r' in line:
+                    usable = False
+                    break
+                if not (self.skip_blank and line == b'\n'):
+                    offsets.append(offset)
+                offset += len(line)
+        if not usable:
+            offsets = array.array('Q')
+        with ir_datasets.util.finialized_file(self.index_path, 'wb') as f:
+            offsets.tofile(f)
+        with ir_datasets.util.finialized_file(f'{self.index_path}.meta', 'wt') as f:
+            json.dump({'source': source_stat, 'count': len(offsets), 'usable': usable}, f)
+        self._meta = None
+        self._offsets = None
+
+    def offsets(self):
+        if self._offsets is None:
+            np = ir_datasets.lazy_libs.numpy()
+            if self.meta()['count'] == 0:
+                self._offsets = np.zeros(0, dtype='uint64')
+            else:
+                self._offsets = np.memmap(self.index_path, dtype='uint64', mode='r')
+        return self._offsets
+
+    def __getitem__(self, idx):
+        # byte offset of line idx
+        return int(self.offsets()[idx])
+
+    def __len__(self):
+        return self.meta()['count']
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_offsets'] = None
+        return state
@@ -0,0 +1,132 @@
+import re
+from collections import OrderedDict
+from threading import Lock
+from . import Docstore
+
+
+def _doc_size(doc):
+    # approximate in-memory size of a document: its text/bytes content plus a fixed overhead
+    return 64 + sum(len(v) for v in doc if isinstance(v, (str, bytes)))
+
+
+def parse_cache_size(spec):
+    """
+    Parses a cache size specification, such as from IR_DATASETS_DOCSTORE_CACHE. Either a number of documents
+    (e.g., "10000") or a size in bytes with a unit (e.g., "512MB"). Returns (max_docs, max_bytes).
+    """
+    match = re.match(r'^\s*(\d+)\s*(B|KB|MB|GB|TB)?\s*$', spec, flags=re.IGNORECASE)
+    if not match:
+        raise ValueError(f'invalid docstore cache size {spec!r}; expected a number of documents (e.g., 10000) or size (e.g., 512MB)')
+    count, unit = match.groups()
+    if unit is None:
+        return int(count), None
+    return None, int(count) * {'B': 1, 'KB': 1000, 'MB': 1000**2, 'GB': 1000**3, 'TB': 1000**4}[unit.upper()]
+
+
+class LruDocstore(Docstore):
+    """
+    Keeps the most recently used documents from another Docstore in memory, up to max_docs documents
+    and/or max_bytes (approximate) bytes. Safe to use from multiple threads.
+
+    Other attributes (e.g., build, count) are passed through to the wrapped docstore.
+    """
+    def __init__(self, docstore, max_docs=None, max_bytes=None):
+        super().__init__(docstore._doc_cls, docstore._id_field)
+        assert max_docs is not None or max_bytes is not None, "must specify max_docs and/or max_bytes"
+        self.docstore = docstore
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, attr):
+        if attr == 'docstore':
+            raise AttributeError(attr) # not initialized yet
+        return getattr(self.docstore, attr)
+
+    def _lookup_cached(self, doc_ids):
+        # returns (cached documents, missing doc_ids)
+        found, missing = [], []
+        with self._lock:
+            for doc_id in set(doc_ids):
+                doc = self._cache.get(doc_id)
+                if doc is None:
+                    missing.append(doc_id)
+                else:
+                    self._cache.move_to_end(doc_id)
+                    found.append(doc)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def _insert(self, doc):
+        doc_id = doc[self._id_field_idx]
+        size = _doc_size(doc)
+        with self._lock:
+            if doc_id in self._cache:
+                self._cache_bytes -= _doc_size(self._cache.pop(doc_id))
+            self._cache[doc_id] = doc
+            self._cache_bytes += size
+            while self._cache and ((self.max_docs is not None and len(self._cache) > self.max_docs) or (self.max_bytes is not None and self._cache_bytes > self.max_bytes)):
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= _doc_size(evicted)
+
+    def get_many_iter(self, doc_ids):
+        found, missing = self._lookup_cached(doc_ids)
+        yield from found
+        if missing:
+            for doc in self.docstore.get_many_iter(missing):
+                self._insert(doc)
+                yield doc
+
+    def get_many_fields_iter(self, doc_ids, fields):
+        found, missing = self._lookup_cached(doc_ids)
+        field_idxs = [self._doc_cls._fields.index(f) for f in fields]
+        for doc in found:
+            yield doc[self._id_field_idx], tuple(doc[i] for i in field_idxs)
+        if missing:
+            # only partial documents are read, so these can't be cached
+            yield from self.docstore.get_many_fields_iter(missing, fields)
+
+    def scan(self, start=None, stop=None, prefix=None):
+        yield from self.docstore.scan(start, stop, prefix)
+
+    def lookup_by(self, field, values):
+        yield from self.docstore.lookup_by(field, values)
+
+    def handle(self):
+        # each process keeps its own cache
+        return LruDocstore(self.docstore.handle(), self.max_docs, self.max_bytes)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        state['_cache'] = OrderedDict()
+        state['_cache_bytes'] = 0
+        state['hits'] = state['misses'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'docs': len(self._cache),
+                'bytes': self._cache_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def clear_cache(self):
+        self.clear()
+        self.docstore.clear_cache()
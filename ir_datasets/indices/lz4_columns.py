@@ -0,0 +1,393 @@
+import os
+import itertools
+try:
+    import fcntl
+except:
+    fcntl = None # not available on Windows :shrug:
+from contextlib import contextmanager
+import ir_datasets
+from . import NumpySortedIndex, NumpyPosIndex
+from .lz4_pickle import _read_next, _encode_next, _strip_scan_bounds, _values, safe_str
+
+
+_logger = ir_datasets.log.easy()
+
+
+class Lz4ColumnIter:
+    def __init__(self, lookup, slice, groups=None):
+        self.next_index = 0
+        self.lookup = lookup
+        self.slice = slice
+        self.groups = groups if groups is not None else list(range(len(lookup._groups)))
+        self.bins = None
+        self.pos_idxs = None
+
+    def __next__(self):
+        if self.slice.start >= self.slice.stop:
+            raise StopIteration
+        if self.bins is None:
+            self.bins = [open(self.lookup._col_path(g), 'rb') for g in self.groups]
+            self.pos_idxs = [None for _ in self.groups]
+        if self.next_index != self.slice.start:
+            # Fast -- each column keeps track of position of each index
+            for i, g in enumerate(self.groups):
+                if self.pos_idxs[i] is None:
+                    self.pos_idxs[i] = NumpyPosIndex(self.lookup._col_pos_path(g))
+                self.bins[i].seek(self.pos_idxs[i][self.slice.start][0])
+            self.next_index = self.slice.start
+        values = [_read_next(f, _values) for f in self.bins]
+        result = self.lookup._assemble(self.groups, values)
+        self.next_index += 1
+        self.slice = slice(self.slice.start + (self.slice.step or 1), self.slice.stop, self.slice.step)
+        return result
+
+    def __iter__(self):
+        return self
+
+    def __del__(self):
+        if self.bins is not None:
+            for f in self.bins:
+                f.close()
+            self.bins = None
+        if self.pos_idxs is not None:
+            for pos_idx in self.pos_idxs:
+                if pos_idx is not None:
+                    pos_idx.close()
+            self.pos_idxs = None
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            # it[start:stop:step]
+            new_slice = ir_datasets.util.apply_sub_slice(self.slice, key)
+            return Lz4ColumnIter(self.lookup, new_slice, self.groups)
+        elif isinstance(key, int):
+            # it[index]
+            new_slice = ir_datasets.util.slice_idx(self.slice, key)
+            new_it = Lz4ColumnIter(self.lookup, new_slice, self.groups)
+            try:
+                return next(new_it)
+            except StopIteration as e:
+                raise IndexError(e)
+        raise TypeError('key must be int or slice')
+
+
+class Lz4ColumnLookup:
+    """
+    A column-split alternative to Lz4PickleLookup. Fields are split into groups (columns), each stored
+    in its own file of lz4-compressed pickles with its own pos index (by ordinal). The key index maps
+    keys to ordinals, so a read of some fields only touches the columns that contain them.
+
+    By default, each field is placed in its own column.
+    """
+    def __init__(self, path, doc_cls, key_field, index_fields, key_field_prefix=None, column_groups=None, tiered_index=False):
+        self._path = path
+        self._key_field = key_field
+        self._key_idx = doc_cls._fields.index(key_field)
+        self._index_fields = list(index_fields)
+        self._doc_cls = doc_cls
+        self._key_field_prefix = key_field_prefix
+        self._meta_path = os.path.join(self._path, 'bin.meta')
+        self._columns_path = os.path.join(self._path, 'bin.columns')
+        self._idx_path = os.path.join(self._path, f'idx.{safe_str(self._key_field)}')
+        self._idx = None
+        self._field_idxs = {}
+        self._tiered_index = tiered_index # see Lz4PickleLookup
+        self._bins = {}
+        self._poss = {}
+
+        # check that the fields match
+        meta_info = ' '.join(doc_cls._fields)
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'rt') as f:
+                existing_meta = f.read()
+            assert existing_meta == meta_info, f"fields do not match; you may need to re-build this store {path}"
+
+        # the layout of an existing store takes precedence over the requested one
+        if os.path.exists(self._columns_path):
+            with open(self._columns_path, 'rt') as f:
+                column_groups = [line.split() for line in f.read().split('\n') if line]
+        if column_groups is None:
+            column_groups = [(f,) for f in doc_cls._fields]
+        self._groups = [tuple(g) for g in column_groups]
+        assert sorted(f for g in self._groups for f in g) == sorted(doc_cls._fields), "column_groups must contain each field exactly once"
+        self._field_group = {}
+        for g, group in enumerate(self._groups):
+            for i, field in enumerate(group):
+                self._field_group[field] = (g, i)
+        # fields indexed after the store was built (see build_index) are kept up to date too
+        for field in doc_cls._fields:
+            if field not in self._index_fields and os.path.exists(f'{self._field_idx_path(field)}.meta'):
+                self._index_fields.append(field)
+
+    def _field_idx_path(self, field):
+        return os.path.join(self._path, f'idx.{safe_str(field)}')
+
+    def _col_path(self, group):
+        return os.path.join(self._path, f'col.{group}')
+
+    def _col_pos_path(self, group):
+        return os.path.join(self._path, f'col.{group}.pos')
+
+    def bin(self, group):
+        if group not in self._bins:
+            self._bins[group] = open(self._col_path(group), 'rb')
+        return self._bins[group]
+
+    def pos(self, group=0):
+        if group not in self._poss:
+            self._poss[group] = NumpyPosIndex(self._col_pos_path(group))
+        return self._poss[group]
+
+    def idx(self):
+        if self._idx is None:
+            self._idx = NumpySortedIndex(self._idx_path)
+        return self._idx
+
+    def field_idx(self, field):
+        # multi-valued index of a field other than the key
+        if field not in self._field_idxs:
+            self._field_idxs[field] = NumpySortedIndex(self._field_idx_path(field), unique=False)
+        return self._field_idxs[field]
+
+    def close(self):
+        if self._idx:
+            self._idx.close()
+            self._idx = None
+        for idx in self._field_idxs.values():
+            idx.close()
+        self._field_idxs = {}
+        for pos in self._poss.values():
+            pos.close()
+        self._poss = {}
+        for binf in self._bins.values():
+            binf.close()
+        self._bins = {}
+
+    def clear(self):
+        self.close()
+        for g in range(len(self._groups)):
+            for path in [self._col_path(g), self._col_pos_path(g)]:
+                if os.path.exists(path):
+                    os.remove(path)
+        if os.path.exists(self._columns_path):
+            os.remove(self._columns_path)
+        for field in self._doc_cls._fields:
+            NumpySortedIndex(self._field_idx_path(field)).clear()
+
+    def __del__(self):
+        self.close()
+
+    def preload(self):
+        # see Lz4PickleLookup.preload
+        self.idx()._lazy_load()
+        for g in range(len(self._groups)):
+            self.pos(g)._lazy_load()
+
+    def __getstate__(self):
+        # see Lz4PickleLookup.__getstate__
+        state = dict(self.__dict__)
+        state['_bins'] = {}
+        return state
+
+    def has_checkpoint(self):
+        return False
+
+    @contextmanager
+    def transaction(self, checkpoint_every=None):
+        # checkpoint_every: accepted for compatibility with Lz4PickleLookup; this layout does not support checkpoints
+        if not os.path.exists(self._path):
+            os.makedirs(self._path, exist_ok=True)
+        if not os.path.exists(self._meta_path):
+            meta_info = ' '.join(self._doc_cls._fields)
+            with open(self._meta_path, 'wt') as f:
+                f.write(meta_info)
+        if not os.path.exists(self._columns_path):
+            with open(self._columns_path, 'wt') as f:
+                f.write('\n'.join(' '.join(g) for g in self._groups))
+
+        with Lz4ColumnTransaction(self) as trans:
+            yield trans
+
+    def _assemble(self, groups, group_values):
+        # builds a record from the values of all groups
+        values = [None for _ in self._doc_cls._fields]
+        for g, group_value in zip(groups, group_values):
+            for field, value in zip(self._groups[g], group_value):
+                values[self._doc_cls._fields.index(field)] = value
+        return self._doc_cls(*values)
+
+    def _ordinals(self, values):
+        if isinstance(values, str):
+            values = (values,)
+        # for removing long doc_id prefixes
+        if self._key_field_prefix:
+            values = [v[len(self._key_field_prefix):] for v in values if v.startswith(self._key_field_prefix)]
+        ordinals = self.idx()[values]
+        return sorted(o for o in ordinals if o != -1) # go though the files in increasing order -- better for HDDs
+
+    def _read_groups(self, groups, ordinals):
+        # returns a list (by ordinal) of lists (by group) of the group values
+        result = [[] for _ in ordinals]
+        if not ordinals:
+            return result
+        for g in groups:
+            binf = self.bin(g)
+            for i, pos in enumerate(self.pos(g)[ordinals]):
+                binf.seek(pos)
+                result[i].append(_read_next(binf, _values))
+        return result
+
+    def __getitem__(self, values):
+        ordinals = self._ordinals(values)
+        groups = list(range(len(self._groups)))
+        for group_values in self._read_groups(groups, ordinals):
+            yield self._assemble(groups, group_values)
+
+    def get_fields(self, values, fields):
+        """
+        Yields (key, (field values...)) for the requested keys, reading only the columns that contain
+        the requested fields.
+        """
+        fields = list(fields)
+        groups = sorted({self._field_group[f][0] for f in fields + [self._key_field]})
+        group_idx = {g: i for i, g in enumerate(groups)}
+        key_g, key_i = self._field_group[self._key_field]
+        locs = [(group_idx[self._field_group[f][0]], self._field_group[f][1]) for f in fields]
+        for group_values in self._read_groups(groups, self._ordinals(values)):
+            key = group_values[group_idx[key_g]][key_i]
+            yield key, tuple(group_values[g][i] for g, i in locs)
+
+    def lookup_by(self, field, values):
+        """
+        Yields the records where field has any of the given values, in the order they are stored. Requires
+        an index of the field (see index_fields and build_index).
+        """
+        if field == self._key_field:
+            yield from self[values]
+            return
+        assert field in self._index_fields, f"{field} is not indexed"
+        if isinstance(values, str):
+            values = (values,)
+        ordinals = sorted(set(itertools.chain.from_iterable(self.field_idx(field).get_all(values))))
+        groups = list(range(len(self._groups)))
+        for group_values in self._read_groups(groups, ordinals):
+            yield self._assemble(groups, group_values)
+
+    def scan(self, start=None, stop=None, prefix=None):
+        # Yields the records with keys in [start, stop) or that start with prefix, in the order they are stored
+        bounds = _strip_scan_bounds(self._key_field_prefix, start, stop, prefix)
+        if bounds is None:
+            return
+        _, ordinals = self.idx().scan(*bounds)
+        groups = list(range(len(self._groups)))
+        for group_values in self._read_groups(groups, sorted(ordinals.tolist())):
+            yield self._assemble(groups, group_values)
+
+    def build_index(self, field):
+        # indexes a field of an existing store, reading only the column that contains it
+        g, i = self._field_group[field]
+        idx = NumpySortedIndex(self._field_idx_path(field), unique=False)
+        try:
+            it = Lz4ColumnIter(self, slice(0, len(self), 1), groups=[g])
+            for ordinal, record in enumerate(_logger.pbar(it, f'indexing {field}', unit='record', total=len(self))):
+                idx.add(getattr(record, field), ordinal)
+            idx.commit()
+        except:
+            idx.rollback()
+            raise
+        finally:
+            idx.close()
+        if field not in self._index_fields:
+            self._index_fields.append(field)
+        self.close()
+
+    def path(self, force=True):
+        return self._path
+
+    def __iter__(self):
+        return Lz4ColumnIter(self, slice(0, len(self), 1))
+
+    def __len__(self):
+        # number of keys
+        return len(self.pos(0))
+
+
+class Lz4ColumnTransaction:
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self.path = self.lookup.path()
+        self.bins = None
+        self.poss = None
+        self.idxs = None
+        self.start_poss = None
+        self.next_ordinal = None
+        self.source_pos = 0
+
+    def __enter__(self):
+        self.bins = [open(self.lookup._col_path(g), 'ab') for g in range(len(self.lookup._groups))]
+        if fcntl:
+            fcntl.lockf(self.bins[0], fcntl.LOCK_EX)
+        self.start_poss = [f.tell() for f in self.bins] # for rolling back
+        self.poss = [NumpyPosIndex(self.lookup._col_pos_path(g)) for g in range(len(self.lookup._groups))]
+        self.next_ordinal = len(self.poss[0])
+        self.idxs = []
+        for index_field in self.lookup._index_fields:
+            idx_path = os.path.join(self.lookup._path, f'idx.{safe_str(index_field)}')
+            self.idxs.append(NumpySortedIndex(idx_path, tiered=self.lookup._tiered_index, unique=index_field == self.lookup._key_field))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.idxs is not None:
+            if not exc_val:
+                self.commit()
+            else:
+                self.rollback()
+
+    def commit(self):
+        for pos in self.poss:
+            pos.commit()
+        self.poss = None
+        for idx in self.idxs:
+            idx.commit()
+        self.idxs = None
+        for f in self.bins:
+            f.flush()
+        self._release()
+        self.lookup.close() # any open indices are now stale
+
+    def rollback(self):
+        for f, start_pos in zip(self.bins, self.start_poss):
+            f.truncate(start_pos) # remove appended content
+        self._release()
+        for pos in self.poss:
+            pos.close()
+        self.poss = None
+        for idx in self.idxs:
+            idx.rollback()
+        self.idxs = None
+
+    def _release(self):
+        if fcntl:
+            fcntl.lockf(self.bins[0], fcntl.LOCK_UN)
+        for f in self.bins:
+            f.close()
+        self.bins = None
+
+    def add(self, record):
+        ordinal = self.next_ordinal
+        self.next_ordinal += 1
+        for f, pos, group in zip(self.bins, self.poss, self.lookup._groups):
+            pos.add(f.tell())
+            f.write(_encode_next(tuple(getattr(record, field) for field in group)))
+        for idx, field in zip(self.idxs, self.lookup._index_fields):
+            value = getattr(record, field)
+            # remove long doc_id prefixes to cut down on storage
+            if field == self.lookup._key_field and self.lookup._key_field_prefix:
+                assert value.startswith(self.lookup._key_field_prefix)
+                value = value[len(self.lookup._key_field_prefix):]
+            idx.add(value, ordinal)
+
+    def add_all(self, records, workers=None):
+        # columns are cheap to encode individually, so this layout is always built in this process
+        for record in records:
+            self.add(record)
@@ -1,6 +1,12 @@
 import io
 import os
+import json
+import mmap
+import queue
 import pickle
+import itertools
+import multiprocessing
+from threading import Lock, Semaphore, Thread, Event
 try:
     import fcntl
 except:
@@ -12,35 +18,329 @@ from . import Docstore, NumpySortedIndex, NumpyPosIndex
 
 _logger = ir_datasets.log.easy()
 
+# In block mode, positions in the indices are encoded as (block_offset << BLOCK_SLOT_BITS) | slot
+BLOCK_SLOT_BITS = 16
+BLOCK_SLOT_MASK = (1 << BLOCK_SLOT_BITS) - 1
+# lz4 only considers the last 64KB of a dictionary
+DICT_SIZE = 64 * 1024
+DICT_SAMPLE_COUNT = 8192
+READ_AHEAD = 4096 # bytes read past the start of the last frame in a coalesced read (avoids a second read for short frames)
+MAX_READ = 16 * 1024 * 1024 # approximate upper bound on the size of a coalesced read
+READAHEAD_CHUNK = 1024 * 1024 # bytes read from the bin file (and decompressed bytes queued) at a time by a readahead thread
+
 
 def _read_next(f, data_cls):
-    lz4 = ir_datasets.lazy_libs.lz4_block()
     content_length = int.from_bytes(f.read(4), 'little')
     content = f.read(content_length)
+    return _decode_next(content, data_cls)
+
+
+def _decode_next(content, data_cls):
+    lz4 = ir_datasets.lazy_libs.lz4_block()
     content = lz4.block.decompress(content)
     content = pickle.loads(content)
     return data_cls(*content)
 
 
+def _frame_buf(buf, pos):
+    # slices the length-prefixed frame at pos directly out of a buffer (e.g., a memoryview of an mmap)
+    content_length = int.from_bytes(buf[pos:pos+4], 'little')
+    return buf[pos+4:pos+4+content_length]
+
+
+def _frame_pread(fd, pos):
+    # reads the length-prefixed frame at pos with positional reads, which don't use (or move) a shared file cursor
+    content_length = int.from_bytes(os.pread(fd, 4, pos), 'little')
+    return os.pread(fd, content_length, pos + 4)
+
+
+def _coalesce(poss, max_gap, max_span=MAX_READ):
+    # groups sorted positions into runs where each starts within max_gap bytes of the previous one (and
+    # within max_span bytes of the first)
+    run = []
+    for pos in poss:
+        if run and (pos - run[-1] > max_gap or pos - run[0] > max_span):
+            yield run
+            run = []
+        run.append(pos)
+    if run:
+        yield run
+
+
 def _skip_next(f):
     content_length = int.from_bytes(f.read(4), 'little')
     f.seek(content_length, io.SEEK_CUR)
 
 
-def _write_next(f, record):
+def _encode_next(record):
     lz4 = ir_datasets.lazy_libs.lz4_block()
     content = tuple(record)
     content = pickle.dumps(content)
     content = lz4.block.compress(content, store_size=True)
     content_length = len(content)
-    f.write(content_length.to_bytes(4, 'little'))
-    f.write(content)
+    return content_length.to_bytes(4, 'little') + content
+
+
+def _write_next(f, record):
+    f.write(_encode_next(record))
+
+
+def _read_block(f, zdict):
+    content_length = int.from_bytes(f.read(4), 'little')
+    if content_length == 0:
+        return None # EOF
+    content = f.read(content_length)
+    return _decode_block(content, zdict)
+
+
+def _decode_block(content, zdict):
+    lz4 = ir_datasets.lazy_libs.lz4_block()
+    return lz4.block.decompress(content, dict=zdict)
+
+
+def _block_len(block):
+    return int.from_bytes(block[0:4], 'little')
+
+
+def _block_record(block, slot, data_cls):
+    # block layout: [count][offset_0]...[offset_count][pickled records...]
+    start = int.from_bytes(block[4+slot*4:8+slot*4], 'little')
+    end = int.from_bytes(block[8+slot*4:12+slot*4], 'little')
+    content = pickle.loads(block[start:end])
+    return data_cls(*content)
+
+
+def _encode_block(pickled_records, zdict):
+    lz4 = ir_datasets.lazy_libs.lz4_block()
+    header_length = 4 + (len(pickled_records) + 1) * 4
+    offsets = [header_length]
+    for record in pickled_records:
+        offsets.append(offsets[-1] + len(record))
+    content = len(pickled_records).to_bytes(4, 'little') + b''.join(o.to_bytes(4, 'little') for o in offsets) + b''.join(pickled_records)
+    content = lz4.block.compress(content, store_size=True, dict=zdict)
+    return len(content).to_bytes(4, 'little') + content
+
+
+def _write_block(f, pickled_records, zdict):
+    f.write(_encode_block(pickled_records, zdict))
+
+
+def _train_dict(pickled_samples, dict_size=DICT_SIZE):
+    # lz4 has no dictionary trainer (unlike zstd), but it accepts any bytes as a prefix dictionary.
+    # Fill the dictionary with records spread evenly across the sample, so that common structure
+    # (field layout, frequent terms, url prefixes, etc.) is available to every block.
+    if not pickled_samples:
+        return b''
+    avg_size = max(sum(len(s) for s in pickled_samples) // len(pickled_samples), 1)
+    stride = max(len(pickled_samples) // max(dict_size // avg_size, 1), 1)
+    result = []
+    size = 0
+    for sample in pickled_samples[::stride]:
+        if size >= dict_size:
+            break
+        result.append(sample)
+        size += len(sample)
+    return b''.join(result)[-dict_size:]
+
+
+_encode_worker_state = None
+
+
+def _init_encode_worker(field_idxs, block_size, zdict):
+    global _encode_worker_state
+    _encode_worker_state = (field_idxs, block_size, zdict)
+
+
+def _encode_batch(batch):
+    # Runs in a build worker process. Returns the index values of each record and the encoded
+    # frames (each with the number of records it contains), in the original order.
+    field_idxs, block_size, zdict = _encode_worker_state
+    values = [tuple(record[i] for i in field_idxs) for record in batch]
+    if block_size is None:
+        frames = [(_encode_next(record), 1) for record in batch]
+    else:
+        frames = []
+        for start in range(0, len(batch), block_size):
+            block = [pickle.dumps(record) for record in batch[start:start+block_size]]
+            frames.append((_encode_block(block, zdict), len(block)))
+    return values, frames
+
+
+def _parse_dense_key(value, base):
+    # only accept the canonical representation of the integer (e.g., not "007" or "+7")
+    if value.isascii() and value.isdigit() and (value == '0' or value[0] != '0'):
+        return int(value) - base
+    return -1
+
+
+def _strip_scan_bounds(key_prefix, start, stop, prefix):
+    # translates scan bounds over full keys to bounds over keys with key_prefix removed; None if no key can match
+    if not key_prefix:
+        return start, stop, prefix
+    n = len(key_prefix)
+    if prefix is not None:
+        if prefix.startswith(key_prefix):
+            return None, None, prefix[n:]
+        if key_prefix.startswith(prefix):
+            return None, None, None # matches all keys
+        return None
+    if start is not None:
+        if start.startswith(key_prefix):
+            start = start[n:]
+        elif start < key_prefix:
+            start = None
+        else:
+            return None
+    if stop is not None:
+        if stop.startswith(key_prefix):
+            stop = stop[n:]
+        elif stop > key_prefix:
+            stop = None
+        else:
+            return None
+    return start, stop, prefix
+
+
+def _dense_scan_ranges(base, count, start, stop, prefix):
+    # the ordinal ranges [lo, hi) of the dense keys base, ..., base+count-1 that are in the scan. Keys with the same
+    # number of digits sort the same as strings and as ints, so each number of digits gives one contiguous range.
+    if prefix is not None:
+        after_start = lambda key: key >= prefix
+        after_stop = lambda key: key > prefix and not key.startswith(prefix)
+    else:
+        after_start = lambda key: start is None or key >= start
+        after_stop = lambda key: stop is not None and key >= stop
+    def first(lo, hi, pred):
+        # first key in [lo, hi) for which pred holds (hi if none); pred goes from False to True over the range
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if pred(str(mid)):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+    result = []
+    end = base + count
+    digits_start = base
+    while digits_start < end:
+        digits_end = min(end, 10 ** len(str(digits_start)))
+        lo = first(digits_start, digits_end, after_start)
+        hi = first(lo, digits_end, after_stop)
+        if lo < hi:
+            result.append((lo - base, hi - base))
+        digits_start = digits_end
+    return result
+
+
+def _values(*values):
+    return values
 
 
 def safe_str(s):
     return "".join(c for c in s if c.isalnum() or c == '_')
 
 
+def _iter_frames(f, chunk_size):
+    # yields the length-prefixed frames of a file from its current position, reading chunk_size bytes at a time
+    buf, offset = b'', 0
+    while True:
+        needed = 4
+        if len(buf) - offset >= 4:
+            content_length = int.from_bytes(buf[offset:offset+4], 'little')
+            if len(buf) - offset >= 4 + content_length:
+                yield memoryview(buf)[offset+4:offset+4+content_length]
+                offset += 4 + content_length
+                continue
+            needed = 4 + content_length
+        data = f.read(max(chunk_size, needed - (len(buf) - offset)))
+        if not data:
+            return
+        buf, offset = buf[offset:] + data, 0
+
+
+class _Readahead:
+    # Reads count records of a bin file from pos on a background thread, READAHEAD_CHUNK bytes at a time, and
+    # decompresses them into a queue of up to depth chunks ahead of the consumer. lz4 releases the GIL, so the
+    # reads and decompression overlap with whatever the consumer does with the records. Unpickling is left to the
+    # consumer (it holds the GIL either way).
+    def __init__(self, lookup, pos, count, depth):
+        if lookup.block_mode():
+            pos, slot, zdict = pos >> BLOCK_SLOT_BITS, pos & BLOCK_SLOT_MASK, lookup.zdict()
+        else:
+            slot, zdict = None, None
+        self.queue = queue.Queue(depth)
+        self.stop = Event()
+        self.chunk = []
+        self.chunk_idx = 0
+        self.block = None
+        self.slot = self.end = 0
+        self.thread = Thread(target=self._run, args=(lookup._bin_path, pos, slot, zdict, count), daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False # consumer went away
+
+    def _run(self, path, pos, slot, zdict, count):
+        lz4 = ir_datasets.lazy_libs.lz4_block()
+        try:
+            with open(path, 'rb', buffering=0) as f:
+                f.seek(pos)
+                chunk, chunk_size = [], 0
+                for frame in _iter_frames(f, READAHEAD_CHUNK):
+                    if slot is None:
+                        content = lz4.block.decompress(frame)
+                        chunk.append(content)
+                        count -= 1
+                    else:
+                        if len(frame) == 0:
+                            break # EOF
+                        content = _decode_block(frame, zdict)
+                        end = min(_block_len(content), slot + count)
+                        chunk.append((content, slot, end))
+                        count -= end - slot
+                        slot = 0
+                    chunk_size += len(content) # the queue holds about depth * READAHEAD_CHUNK decompressed bytes
+                    if chunk_size >= READAHEAD_CHUNK or count <= 0:
+                        if not self._put(chunk):
+                            return
+                        chunk, chunk_size = [], 0
+                    if count <= 0:
+                        break
+                if chunk and not self._put(chunk):
+                    return
+            self._put(None)
+        except Exception as ex:
+            self._put(ex)
+
+    def next(self, data_cls):
+        if self.slot < self.end: # block mode
+            result = _block_record(self.block, self.slot, data_cls)
+            self.slot += 1
+            return result
+        if self.chunk_idx >= len(self.chunk):
+            chunk = self.queue.get()
+            if chunk is None:
+                raise StopIteration
+            if isinstance(chunk, Exception):
+                raise chunk
+            self.chunk, self.chunk_idx = chunk, 0
+        item = self.chunk[self.chunk_idx]
+        self.chunk_idx += 1
+        if isinstance(item, tuple):
+            self.block, self.slot, self.end = item
+            return self.next(data_cls)
+        return data_cls(*pickle.loads(item))
+
+    def close(self):
+        self.stop.set()
+
+
 class Lz4PickleIter:
     def __init__(self, lookup, slice):
         self.next_index = 0
@@ -48,24 +348,83 @@ class Lz4PickleIter:
         self.slice = slice
         self.bin = None
         self.pos_idx = None
+        self.block = None
+        self.block_slot = None
+        self.readahead = None
 
     def __next__(self):
+        return self._next(self.lookup._doc_cls)
+
+    def _next(self, data_cls):
         if self.slice.start >= self.slice.stop:
             raise StopIteration
-        if self.bin is None:
-            self.bin = open(self.lookup._bin_path, 'rb')
-        if self.next_index != self.slice.start:
-            # Fast -- lookup keeps track of position of each index
-            if self.pos_idx is None:
-                self.pos_idx = NumpyPosIndex(self.lookup._pos_path)
-            new_pos = self.pos_idx[self.slice.start][0]
-            self.bin.seek(new_pos) # this seek is smart -- if alrady in buffer, skips to that point
-            self.next_index = self.slice.start
-        result = _read_next(self.bin, self.lookup._doc_cls)
+        if self.bin is None and self.readahead is None:
+            if self.lookup._readahead and (self.slice.step or 1) == 1:
+                # sequential scan; records are read and decompressed ahead on a background thread
+                pos = self._pos_idx()[self.slice.start][0]
+                self.readahead = _Readahead(self.lookup, pos, self.slice.stop - self.slice.start, self.lookup._readahead)
+            else:
+                self.bin = open(self.lookup._bin_path, 'rb')
+        if self.readahead is not None:
+            result = self.readahead.next(data_cls)
+        elif self.lookup.block_mode():
+            result = self._next_block_record(data_cls)
+        else:
+            if self.next_index != self.slice.start:
+                # Fast -- lookup keeps track of position of each index
+                new_pos = self._pos_idx()[self.slice.start][0]
+                self.bin.seek(new_pos) # this seek is smart -- if alrady in buffer, skips to that point
+                self.next_index = self.slice.start
+            result = _read_next(self.bin, data_cls)
         self.next_index += 1
         self.slice = slice(self.slice.start + (self.slice.step or 1), self.slice.stop, self.slice.step)
         return result
 
+    def iter_batches(self, batch_size=1024, fields=None):
+        # see ir_datasets.util.iter_batches; the unpickled values go straight into the batches, without
+        # building a record for each
+        fields = list(fields or self.lookup._doc_cls._fields)
+        field_idxs = [self.lookup._doc_cls._fields.index(f) for f in fields]
+        exhausted = False
+        while not exhausted:
+            rows = []
+            for _ in range(batch_size):
+                try:
+                    rows.append(self._next(_values))
+                except StopIteration:
+                    exhausted = True
+                    break
+            if rows:
+                yield ir_datasets.util.batch_columns(rows, fields, field_idxs)
+
+    def take(self, ordinals):
+        # yields the records at the (sorted) ordinals of this slice, read through the pos index in file order
+        step = self.slice.step or 1
+        idxs = [self.slice.start + o * step for o in ordinals]
+        idxs = [i for i in idxs if i < self.slice.stop]
+        if idxs:
+            yield from self.lookup._read_poss(self.lookup.pos()[idxs])
+
+    def _next_block_record(self, data_cls):
+        if self.next_index != self.slice.start or self.block is None:
+            pos = self._pos_idx()[self.slice.start][0]
+            self.bin.seek(pos >> BLOCK_SLOT_BITS)
+            self.block = _read_block(self.bin, self.lookup.zdict())
+            self.block_slot = pos & BLOCK_SLOT_MASK
+            self.next_index = self.slice.start
+        elif self.block_slot >= _block_len(self.block):
+            # blocks are written back-to-back, so the next one starts where this one ended
+            self.block = _read_block(self.bin, self.lookup.zdict())
+            self.block_slot = 0
+        result = _block_record(self.block, self.block_slot, data_cls)
+        self.block_slot += 1
+        return result
+
+    def _pos_idx(self):
+        if self.pos_idx is None:
+            self.pos_idx = NumpyPosIndex(self.lookup._pos_path)
+        return self.pos_idx
+
     def __iter__(self):
         return self
 
@@ -73,9 +432,13 @@ class Lz4PickleIter:
         if self.bin is not None:
             self.bin.close()
             self.bin = None
+        if self.readahead is not None:
+            self.readahead.close()
+            self.readahead = None
         if self.pos_idx:
             self.pos_idx.close()
             self.pos_idx = None
+        self.block = None
 
     def __getitem__(self, key):
         if isinstance(key, slice):
@@ -94,20 +457,49 @@ class Lz4PickleIter:
 
 
 class Lz4PickleLookup:
-    def __init__(self, path, doc_cls, key_field, index_fields, key_field_prefix=None):
+    def __init__(self, path, doc_cls, key_field, index_fields, key_field_prefix=None, block_size=None, use_mmap=False, hash_index=False, dense_keys=False, read_gap=64*1024, tiered_index=False, readahead=0):
         self._path = path
         self._key_field = key_field
         self._key_idx = doc_cls._fields.index(key_field)
         self._index_fields = list(index_fields)
         self._doc_cls = doc_cls
         self._bin = None
+        self._bin_fd = None
         self._bin_path = os.path.join(self._path, 'bin')
+        self._lock = Lock() # guards lazy initialization of shared handles
+        self._use_mmap = use_mmap
+        # read_gap: records that start within this many bytes of one another are fetched with a single read
+        # (0 reads each one individually). Not used with use_mmap.
+        self._read_gap = read_gap
+        # readahead: when iterating over a contiguous range of records, read & decompress up to this many chunks
+        # of READAHEAD_CHUNK bytes ahead of the consumer on a background thread (0 disables).
+        self._readahead = readahead
+        self._bin_mmap = None
+        self._bin_view = None
         self._pos = None
         self._pos_path = os.path.join(self._path, 'bin.pos')
         self._idx = None
         self._idx_path = os.path.join(self._path, f'idx.{safe_str(self._key_field)}')
+        self._field_idxs = {}
+        self._hash_index = hash_index
+        # tiered_index: commit new keys to small tiers of the sorted indices rather than rewriting them (see
+        # NumpySortedIndex); better for stores that receive many small transactions, like caches.
+        self._tiered_index = tiered_index
+        # dense_keys: whether keys are the integers base, base+1, ... in insertion order (for which the
+        # position of a key can be found directly in the pos index). None: detect when building a new store,
+        # True: required, False: never. Existing stores are always read in the layout they were built with.
+        self._dense_keys = dense_keys
+        self._dense_path = os.path.join(self._path, f'idx.{safe_str(self._key_field)}.dense')
+        self._dense_base = None
         self._key_field_prefix = key_field_prefix
         self._meta_path = os.path.join(self._path, 'bin.meta')
+        self._block_path = os.path.join(self._path, 'bin.block')
+        self._dict_path = os.path.join(self._path, 'bin.dict')
+        self._checkpoint_path = os.path.join(self._path, 'bin.checkpoint')
+        self._block_size = block_size
+        self._zdict = None
+        if block_size is not None:
+            assert 0 < block_size <= BLOCK_SLOT_MASK + 1, f"block_size must be between 1 and {BLOCK_SLOT_MASK + 1}"
 
         # check that the fields match
         meta_info = ' '.join(doc_cls._fields)
@@ -116,53 +508,167 @@ class Lz4PickleLookup:
                 existing_meta = f.read()
             assert existing_meta == meta_info, f"fields do not match; you may need to re-build this store {path}"
 
+        # the layout of an existing store takes precedence over the requested one
+        if os.path.exists(self._block_path):
+            with open(self._block_path, 'rt') as f:
+                self._block_size = int(f.read())
+        elif os.path.exists(self._bin_path):
+            self._block_size = None
+        # fields indexed after the store was built (see build_index) are kept up to date too
+        for field in doc_cls._fields:
+            if field not in self._index_fields and os.path.exists(f'{self._field_idx_path(field)}.meta'):
+                self._index_fields.append(field)
+
+    def _field_idx_path(self, field):
+        return os.path.join(self._path, f'idx.{safe_str(field)}')
+
+    def block_mode(self):
+        return self._block_size is not None
+
+    def zdict(self):
+        if self._zdict is None and os.path.exists(self._dict_path):
+            with open(self._dict_path, 'rb') as f:
+                self._zdict = f.read()
+        return self._zdict
+
+    def dense_base(self):
+        # returns the first key (as an int) if this store has dense integer keys, otherwise None
+        if self._dense_base is None:
+            if os.path.exists(self._dense_path):
+                with open(self._dense_path, 'rt') as f:
+                    self._dense_base = int(f.read())
+            else:
+                self._dense_base = -1
+        return self._dense_base if self._dense_base != -1 else None
+
     def bin(self):
         if self._bin is None:
             self._bin = open(self._bin_path, 'rb')
         return self._bin
 
+    def bin_fd(self):
+        if self._bin_fd is None:
+            with self._lock:
+                if self._bin_fd is None: # repeat condition from above in thread-safe way
+                    self._bin_fd = os.open(self._bin_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        return self._bin_fd
+
+    def bin_view(self):
+        # read-only memoryview over the whole bin file; slices of it are passed directly to lz4, avoiding
+        # per-record read() calls and copies
+        if self._bin_view is None:
+            with self._lock:
+                if self._bin_view is None:
+                    with open(self._bin_path, 'rb') as f:
+                        self._bin_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._bin_view = memoryview(self._bin_mmap)
+        return self._bin_view
+
     def pos(self):
         if self._pos is None:
-            self._pos = NumpyPosIndex(self._pos_path)
+            with self._lock:
+                if self._pos is None:
+                    pos = NumpyPosIndex(self._pos_path)
+                    pos._lazy_load() # so it's fully loaded before other threads can see it
+                    self._pos = pos
         return self._pos
 
     def idx(self):
         if self._idx is None:
-            self._idx = NumpySortedIndex(self._idx_path)
+            with self._lock:
+                if self._idx is None:
+                    idx = NumpySortedIndex(self._idx_path, hash_index=self._hash_index)
+                    idx._lazy_load()
+                    self._idx = idx
         return self._idx
 
+    def field_idx(self, field):
+        # multi-valued index of a field other than the key
+        if field not in self._field_idxs:
+            with self._lock:
+                if field not in self._field_idxs:
+                    idx = NumpySortedIndex(self._field_idx_path(field), unique=False)
+                    idx._lazy_load()
+                    self._field_idxs[field] = idx
+        return self._field_idxs[field]
+
     def close(self):
         if self._idx:
             self._idx.close()
             self._idx = None
+        for idx in self._field_idxs.values():
+            idx.close()
+        self._field_idxs = {}
         if self._pos:
             self._pos.close()
             self._pos = None
         if self._bin:
             self._bin.close()
             self._bin = None
+        if self._bin_fd is not None:
+            os.close(self._bin_fd)
+            self._bin_fd = None
+        if self._bin_view is not None:
+            self._bin_view.release()
+            self._bin_view = None
+            self._bin_mmap.close()
+            self._bin_mmap = None
+        self._dense_base = None
 
     def clear(self):
         self.close()
-        if os.path.exists(self._bin_path):
-            os.remove(self._bin_path)
-        if os.path.exists(self._pos_path):
-            os.remove(self._pos_path)
-        NumpySortedIndex(self._idx_path).clear()
+        for path in [self._bin_path, self._pos_path, self._block_path, self._dict_path, self._dense_path, self._checkpoint_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        self._zdict = None
+        for field in self._doc_cls._fields:
+            NumpySortedIndex(self._field_idx_path(field)).clear()
 
     def __del__(self):
         self.close()
 
+    def preload(self):
+        # parses the metadata and opens the indices of the store up front, e.g., before it's pickled for workers
+        self.zdict()
+        self.dense_base()
+        self.pos()
+        self.idx()
+        for field in self._index_fields:
+            if field != self._key_field and os.path.exists(f'{self._field_idx_path(field)}.meta'):
+                self.field_idx(field)
+
+    def __getstate__(self):
+        # Pickles to a cheap handle over the same files (e.g., for worker processes): the parsed metadata of the
+        # store and its indices is kept, while file handles, memory maps, and the compression dictionary are
+        # re-opened lazily, so the processes share the pages through the OS page cache rather than each
+        # holding (and pickling) a copy.
+        state = dict(self.__dict__)
+        del state['_lock']
+        for attr in ['_bin', '_bin_fd', '_bin_mmap', '_bin_view', '_zdict']:
+            state[attr] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def has_checkpoint(self):
+        # whether there's an interrupted transaction that can be resumed (see Lz4PickleTransaction.checkpoint)
+        return os.path.exists(self._checkpoint_path)
+
     @contextmanager
-    def transaction(self):
+    def transaction(self, checkpoint_every=None):
         if not os.path.exists(self._path):
             os.makedirs(self._path, exist_ok=True)
         if not os.path.exists(self._meta_path):
             meta_info = ' '.join(self._doc_cls._fields)
             with open(self._meta_path, 'wt') as f:
                 f.write(meta_info)
+        if self.block_mode() and not os.path.exists(self._block_path):
+            with open(self._block_path, 'wt') as f:
+                f.write(str(self._block_size))
 
-        with Lz4PickleTransaction(self) as trans:
+        with Lz4PickleTransaction(self, checkpoint_every) as trans:
             yield trans
 
     def __getitem__(self, values):
@@ -171,16 +677,129 @@ class Lz4PickleLookup:
         # for removing long doc_id prefixes
         if self._key_field_prefix:
             values = [v[len(self._key_field_prefix):] for v in values if v.startswith(self._key_field_prefix)]
-        poss = self.idx()[values]
-        poss = sorted(poss) # go though the file in increasing order-- better for HDDs
-        binf = None
+        dense_base = self.dense_base()
+        if dense_base is not None:
+            # keys are ordinals (offset by dense_base) -- go straight to the pos index
+            poss = self.pos()[[_parse_dense_key(v, dense_base) for v in values]]
+        else:
+            poss = self.idx()[values]
+        yield from self._read_poss(poss)
+
+    def lookup_by(self, field, values):
+        """
+        Yields the records where field has any of the given values. Records are yielded in the order they
+        are stored. Requires an index of the field (see index_fields and build_index).
+        """
+        if field == self._key_field:
+            yield from self[values]
+            return
+        assert field in self._index_fields, f"{field} is not indexed"
+        if isinstance(values, str):
+            values = (values,)
+        yield from self._read_poss(set(itertools.chain.from_iterable(self.field_idx(field).get_all(values))))
+
+    def scan(self, start=None, stop=None, prefix=None):
+        """
+        Yields the records with keys where start <= key < stop (either can be None for unbounded) or that start
+        with prefix, in the order they are stored; records that are stored together are read together.
+        """
+        bounds = _strip_scan_bounds(self._key_field_prefix, start, stop, prefix)
+        if bounds is None:
+            return
+        dense_base = self.dense_base()
+        if dense_base is not None:
+            # there's no sorted key index, but the matching keys are contiguous ranges of ordinals
+            pos = self.pos()
+            poss = [p for lo, hi in _dense_scan_ranges(dense_base, len(pos), *bounds) for p in pos[lo:hi]]
+        else:
+            _, poss = self.idx().scan(*bounds)
+            poss = poss.tolist()
+        yield from self._read_poss(poss)
+
+    def build_index(self, field):
+        # indexes a field of an existing store, with a single pass over its records
+        idx = NumpySortedIndex(self._field_idx_path(field), unique=False)
+        try:
+            for record, pos in zip(_logger.pbar(iter(self), f'indexing {field}', unit='record', total=len(self)), self.pos()):
+                idx.add(getattr(record, field), int(pos))
+            idx.commit()
+        except:
+            idx.rollback()
+            raise
+        finally:
+            idx.close()
+        if field not in self._index_fields:
+            self._index_fields.append(field)
+        self.close()
+
+    def _read_poss(self, poss):
+        poss = sorted(p for p in poss if p != -1) # go though the file in increasing order-- better for HDDs
+        block_mode = self.block_mode()
+        if block_mode:
+            frames = self._read_frames(sorted({pos >> BLOCK_SLOT_BITS for pos in poss}))
+        else:
+            frames = self._read_frames(sorted(set(poss)))
+        frame_pos, content = None, None
         for pos in poss:
-            if pos == -1:
-                continue # not found
-            if binf is None:
-                binf = self.bin()
+            if block_mode:
+                if pos >> BLOCK_SLOT_BITS != frame_pos:
+                    frame_pos, frame = next(frames)
+                    content = _decode_block(frame, self.zdict())
+                yield _block_record(content, pos & BLOCK_SLOT_MASK, self._doc_cls)
+            else:
+                if pos != frame_pos:
+                    frame_pos, frame = next(frames)
+                    content = _decode_next(frame, self._doc_cls)
+                yield content
+
+    def get_fields(self, values, fields):
+        # records are stored whole, so there's nothing to gain over reading the full records here
+        field_idxs = [self._doc_cls._fields.index(f) for f in fields]
+        for doc in self[values]:
+            yield doc[self._key_idx], tuple(doc[i] for i in field_idxs)
+
+    def _read_frame_at(self, pos):
+        # Safe to call from multiple threads at once
+        if self._use_mmap:
+            return _frame_buf(self.bin_view(), pos)
+        if hasattr(os, 'pread'):
+            return _frame_pread(self.bin_fd(), pos)
+        with self._lock: # no pread (e.g., on Windows); the file cursor is shared
+            binf = self.bin()
+            binf.seek(pos)
+            content_length = int.from_bytes(binf.read(4), 'little')
+            return binf.read(content_length)
+
+    def _read_range(self, pos, length):
+        if hasattr(os, 'pread'):
+            return os.pread(self.bin_fd(), length, pos)
+        with self._lock:
+            binf = self.bin()
             binf.seek(pos)
-            yield _read_next(binf, self._doc_cls)
+            return binf.read(length)
+
+    def _read_frames(self, poss):
+        # yields (pos, frame content) for the sorted frame positions poss. Nearby frames are fetched with a
+        # single range read and sliced out of the buffer, rather than with a pair of reads each.
+        if self._use_mmap or not self._read_gap:
+            for pos in poss:
+                yield pos, self._read_frame_at(pos)
+            return
+        for run in _coalesce(poss, self._read_gap):
+            if len(run) == 1:
+                yield run[0], self._read_frame_at(run[0])
+                continue
+            start = run[0]
+            buf = self._read_range(start, run[-1] - start + READ_AHEAD)
+            for pos in run:
+                offset = pos - start
+                if offset + 4 > len(buf):
+                    buf += self._read_range(start + len(buf), offset + 4 - len(buf))
+                content_length = int.from_bytes(buf[offset:offset+4], 'little')
+                end = offset + 4 + content_length
+                if end > len(buf):
+                    buf += self._read_range(start + len(buf), end - len(buf)) # frame continues past the buffer
+                yield pos, memoryview(buf)[offset+4:end]
 
     def path(self, force=True):
         return self._path
@@ -194,13 +813,25 @@ class Lz4PickleLookup:
 
 
 class Lz4PickleTransaction:
-    def __init__(self, lookup):
+    def __init__(self, lookup, checkpoint_every=None):
         self.lookup = lookup
         self.path = self.lookup.path()
         self.bin = None
         self.pos = None
         self.idxs = None
         self.start_pos = None
+        self.zdict = None
+        self.block = None
+        self.dict_samples = None
+        self.wrote_dict = False
+        self.dense_base = None
+        self.dense_first = None
+        self.dense_next = None
+        # checkpoint_every: call checkpoint() automatically after this many records
+        self.checkpoint_every = checkpoint_every
+        self.source_pos = 0 # number of records added, including those from before a resumed checkpoint
+        self.checkpoint_pos = 0
+        self.last_checkpoint = None
 
     def __enter__(self):
         self.bin = open(self.lookup._bin_path, 'ab')
@@ -211,7 +842,27 @@ class Lz4PickleTransaction:
         self.idxs = []
         for index_field in self.lookup._index_fields:
             idx_path = os.path.join(self.lookup._path, f'idx.{safe_str(index_field)}')
-            self.idxs.append(NumpySortedIndex(idx_path))
+            is_key = index_field == self.lookup._key_field
+            hash_index = self.lookup._hash_index and is_key
+            self.idxs.append(NumpySortedIndex(idx_path, hash_index=hash_index, tiered=self.lookup._tiered_index, unique=is_key))
+        self.dense_base = self.lookup.dense_base()
+        if self.lookup.has_checkpoint():
+            # pick up where an interrupted transaction left off
+            with open(self.lookup._checkpoint_path, 'rt') as f:
+                self.last_checkpoint = json.load(f)
+            self._restore_checkpoint()
+            self.source_pos = self.checkpoint_pos = self.last_checkpoint['source_pos']
+            self.dense_first = self.last_checkpoint['dense_first']
+            self.dense_next = self.last_checkpoint['dense_next']
+        elif self.dense_base is not None:
+            self.dense_next = self.dense_base + len(self.pos)
+        elif self.lookup._dense_keys is not False and len(self.pos) == 0:
+            self.dense_next = -1 # new store; base is determined by the first key
+        if self.lookup.block_mode():
+            self.block = []
+            self.zdict = self.lookup.zdict()
+            if self.zdict is None:
+                self.dict_samples = [] # buffer records until there's enough to train a dictionary
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -222,68 +873,308 @@ class Lz4PickleTransaction:
                 self.rollback()
 
     def commit(self):
+        if self.dict_samples is not None:
+            self._train_dict()
+        if self.block:
+            self._flush_block()
         self.pos.commit()
         self.pos = None
-        for idx in self.idxs:
-            idx.commit()
+        dense = self.dense_next is not None and self.dense_next != -1
+        for idx, field in zip(self.idxs, self.lookup._index_fields):
+            if dense and field == self.lookup._key_field:
+                idx.rollback() # not needed; keys are found directly in the pos index
+            else:
+                idx.commit()
         self.idxs = None
+        if dense and self.dense_base is None:
+            with ir_datasets.util.finialized_file(self.lookup._dense_path, 'wt') as f:
+                f.write(str(self.dense_first))
         self.bin.flush()
+        if self.last_checkpoint is not None:
+            os.remove(self.lookup._checkpoint_path)
+            self.last_checkpoint = None
         if fcntl:
             fcntl.lockf(self.bin, fcntl.LOCK_UN)
         self.bin.close()
         self.bin = None
+        self.lookup.close() # any open indices are now stale
 
     def rollback(self):
-        self.bin.truncate(self.start_pos) # remove appended content
+        if self.last_checkpoint is not None:
+            # only go back to the latest checkpoint, so the transaction can be resumed from there later
+            self.pos.close()
+            self._restore_checkpoint()
+            for idx in self.idxs:
+                idx.close()
+        else:
+            self.bin.truncate(self.start_pos) # remove appended content
+            self.pos.close()
+            for idx in self.idxs:
+                idx.rollback()
+            if self.wrote_dict:
+                os.remove(self.lookup._dict_path)
+                self.lookup._zdict = None
         if fcntl:
             fcntl.lockf(self.bin, fcntl.LOCK_UN)
         self.bin.close()
         self.bin = None
-        self.pos.close()
         self.pos = None
-        for idx in self.idxs:
-            idx.close()
         self.idxs = None
+        self.block = None
+        self.dict_samples = None
+
+    def checkpoint(self):
+        """
+        Writes out everything added so far, such that if this transaction is interrupted, a later
+        transaction on the same store resumes from here (skipping the first source_pos records of the
+        source is up to the caller). After a checkpoint, rollback() only goes back to the checkpoint.
+        """
+        if self.dict_samples is not None:
+            return # records are held back until there's enough to train the dictionary
+        if self.block:
+            self._flush_block()
+        self.bin.flush()
+        self.pos.commit()
+        self.last_checkpoint = {
+            'source_pos': self.source_pos,
+            'bin_size': self.bin.tell(),
+            'pos_count': os.path.getsize(self.lookup._pos_path) // 8 if os.path.exists(self.lookup._pos_path) else 0,
+            'runs': [idx.checkpoint() for idx in self.idxs],
+            'dense_first': self.dense_first,
+            'dense_next': self.dense_next,
+        }
+        with ir_datasets.util.finialized_file(self.lookup._checkpoint_path, 'wt') as f:
+            json.dump(self.last_checkpoint, f)
+        self.checkpoint_pos = self.source_pos
+
+    def _restore_checkpoint(self):
+        # drop anything written after the last checkpoint
+        checkpoint = self.last_checkpoint
+        self.bin.truncate(checkpoint['bin_size'])
+        self.bin.seek(0, io.SEEK_END) # tell() doesn't follow a truncate
+        if os.path.exists(self.lookup._pos_path):
+            os.truncate(self.lookup._pos_path, checkpoint['pos_count'] * 8)
+        for idx, run_count in zip(self.idxs, checkpoint['runs']):
+            idx.resume(run_count)
+
+    def _count_added(self, count):
+        self.source_pos += count
+        if self.checkpoint_every and self.source_pos - self.checkpoint_pos >= self.checkpoint_every:
+            self.checkpoint()
 
     def add(self, record):
-        bin_pos = self.bin.tell()
+        self._add(record)
+        self._count_added(1)
+
+    def _add(self, record):
+        if self.dict_samples is not None:
+            self.dict_samples.append(record)
+            if len(self.dict_samples) >= DICT_SAMPLE_COUNT:
+                self._train_dict()
+            return
+        if self.block is not None:
+            # blocks are written back-to-back, so the current block will start at the end of the file
+            bin_pos = (self.bin.tell() << BLOCK_SLOT_BITS) | len(self.block)
+        else:
+            bin_pos = self.bin.tell()
         self.pos.add(bin_pos)
-        for idx, field in zip(self.idxs, self.lookup._index_fields):
-            value = getattr(record, field)
-            # remove long doc_id prefixes to cut down on storage
-            if field == self.lookup._key_field and self.lookup._key_field_prefix:
-                assert value.startswith(self.lookup._key_field_prefix)
-                value = value[len(self.lookup._key_field_prefix):]
+        self._add_index([getattr(record, field) for field in self.lookup._index_fields], bin_pos)
+        if self.block is not None:
+            self.block.append(pickle.dumps(tuple(record)))
+            if len(self.block) >= self.lookup._block_size:
+                self._flush_block()
+        else:
+            _write_next(self.bin, record)
+
+    def add_all(self, records, workers=None, batch_size=1024, max_in_flight=None):
+        """
+        Adds all records from the iterable. When workers > 1, the records are pickled and compressed
+        in batches by a pool of worker processes, while this process appends the finished frames (in
+        the original order) and fills the indices. At most max_in_flight batches (default: 2 per worker)
+        are held in memory at a time.
+        """
+        if workers is None or workers <= 1:
+            for record in records:
+                self.add(record)
+            return
+        records = iter(records)
+        if self.dict_samples is not None:
+            # the dictionary needs to be trained before workers can compress anything
+            for record in records:
+                self.add(record)
+                if self.dict_samples is None:
+                    break
+        if self.block:
+            self._flush_block() # workers start from fresh blocks
+        block_size = self.lookup._block_size
+        if block_size is not None:
+            batch_size = max(batch_size // block_size, 1) * block_size # align batches to blocks
+        field_idxs = [self.lookup._doc_cls._fields.index(f) for f in self.lookup._index_fields]
+        semaphore = Semaphore(max_in_flight or workers * 2)
+        def it_in():
+            # pool.imap is greedy; only release a batch when there's room for it
+            while semaphore.acquire():
+                batch = [tuple(r) for r in itertools.islice(records, batch_size)]
+                if not batch:
+                    break
+                yield batch
+
+        with multiprocessing.Pool(workers, initializer=_init_encode_worker, initargs=(field_idxs, block_size, self.zdict)) as pool:
+            for values, frames in pool.imap(_encode_batch, it_in()):
+                semaphore.release()
+                values = iter(values)
+                for frame, count in frames:
+                    offset = self.bin.tell()
+                    for slot in range(count):
+                        bin_pos = (offset << BLOCK_SLOT_BITS) | slot if block_size is not None else offset
+                        self.pos.add(bin_pos)
+                        self._add_index(next(values), bin_pos)
+                    self.bin.write(frame)
+                self._count_added(sum(count for _, count in frames))
+
+    def _add_index(self, values, bin_pos):
+        for idx, field, value in zip(self.idxs, self.lookup._index_fields, values):
+            if field == self.lookup._key_field:
+                # remove long doc_id prefixes to cut down on storage
+                if self.lookup._key_field_prefix:
+                    assert value.startswith(self.lookup._key_field_prefix)
+                    value = value[len(self.lookup._key_field_prefix):]
+                if self.dense_next is not None:
+                    self._check_dense(value)
+                    if self.lookup._dense_keys is True:
+                        continue # the key index will not be used
             idx.add(value, bin_pos)
-        _write_next(self.bin, record)
+
+    def _check_dense(self, value):
+        if self.dense_next == -1:
+            first = _parse_dense_key(value, 0)
+            if first != -1:
+                self.dense_first = first
+                self.dense_next = first + 1
+                return
+        elif value == str(self.dense_next):
+            self.dense_next += 1
+            return
+        if self.dense_base is not None or self.lookup._dense_keys is True:
+            raise ValueError(f'{self.lookup._key_field}={value!r} breaks the sequence of dense integer keys in {self.path}')
+        self.dense_next = None
+
+    def _flush_block(self):
+        _write_block(self.bin, self.block, self.zdict)
+        self.block = []
+
+    def _train_dict(self):
+        records, self.dict_samples = self.dict_samples, None
+        self.zdict = _train_dict([pickle.dumps(tuple(r)) for r in records])
+        with ir_datasets.util.finialized_file(self.lookup._dict_path, 'wb') as f:
+            f.write(self.zdict)
+        self.wrote_dict = True
+        for record in records:
+            self._add(record)
 
 
 class PickleLz4FullStore(Docstore):
-    def __init__(self, path, init_iter_fn, data_cls, lookup_field, index_fields, key_field_prefix=None, size_hint=None, count_hint=None):
+    def __init__(self, path, init_iter_fn, data_cls, lookup_field, index_fields, key_field_prefix=None, size_hint=None, count_hint=None, block_size=None, build_workers=None, use_mmap=None, hash_index=False, dense_keys=None, column_groups=None, read_gap=64*1024, checkpoint_every=None, shards=None, shard_by='hash', readahead=None):
         super().__init__(data_cls, lookup_field)
         self.path = path
         self.init_iter_fn = init_iter_fn
-        self.lookup = Lz4PickleLookup(path, data_cls, lookup_field, index_fields, key_field_prefix)
+        # block_size: pack this many records into each compressed block (with a dictionary trained on a sample
+        # of the records), rather than compressing each record on its own. Much better for short records.
+        # use_mmap: serve lookups from a memory mapping of the bin file. Defaults to IR_DATASETS_DOCSTORE_MMAP.
+        # hash_index: look up keys through a static hash table rather than binary search over the sorted keys.
+        # dense_keys: whether keys are consecutive integers in corpus order (see Lz4PickleLookup); detected by default.
+        # read_gap: lookups of records that start within this many bytes of one another are merged into one read.
+        # column_groups: store these groups of fields in separate columns (see Lz4ColumnLookup), so that
+        #   reads of some fields only touch the columns they are in. Other layout options do not apply.
+        # shards: split the store into this many shards (in subdirectories of path), or into shards at these paths
+        #   (e.g., on different disks), assigned by key hash or by ordinal range (shard_by; see Lz4ShardedLookup).
+        # readahead: chunks of the store read & decompressed ahead on a background thread when iterating over it
+        #   (see Lz4PickleLookup). Defaults to IR_DATASETS_DOCSTORE_READAHEAD (or 0, i.e., disabled).
+        if use_mmap is None:
+            use_mmap = os.environ.get('IR_DATASETS_DOCSTORE_MMAP', 'false').lower() == 'true'
+        if readahead is None:
+            readahead = int(os.environ.get('IR_DATASETS_DOCSTORE_READAHEAD', '0'))
+        if column_groups is not None:
+            from .lz4_columns import Lz4ColumnLookup
+            self.lookup = Lz4ColumnLookup(path, data_cls, lookup_field, index_fields, key_field_prefix, column_groups=column_groups)
+        elif shards is not None:
+            from .lz4_shards import Lz4ShardedLookup
+            if isinstance(shards, int):
+                shards = [os.path.join(path, f'shard{i}') for i in range(shards)]
+            self.lookup = Lz4ShardedLookup(path, data_cls, lookup_field, index_fields, key_field_prefix, shard_paths=shards, shard_by=shard_by, block_size=block_size, use_mmap=use_mmap, hash_index=hash_index, read_gap=read_gap)
+        else:
+            self.lookup = Lz4PickleLookup(path, data_cls, lookup_field, index_fields, key_field_prefix, block_size=block_size, use_mmap=use_mmap, hash_index=hash_index, dense_keys=dense_keys, read_gap=read_gap, readahead=readahead)
         self.size_hint = size_hint
         self.count_hint = count_hint
+        # build_workers: number of processes used to pickle & compress records when building. Defaults
+        # to IR_DATASETS_DOCSTORE_BUILD_WORKERS (or 1, i.e., build in this process).
+        if build_workers is None:
+            build_workers = int(os.environ.get('IR_DATASETS_DOCSTORE_BUILD_WORKERS', '1'))
+        self.build_workers = build_workers
+        # checkpoint_every: commit the progress of a build every this many records, so that an interrupted
+        # build resumes from there. Defaults to IR_DATASETS_DOCSTORE_CHECKPOINT (or 1000000); 0 disables.
+        if checkpoint_every is None:
+            checkpoint_every = int(os.environ.get('IR_DATASETS_DOCSTORE_CHECKPOINT', '1000000'))
+        self.checkpoint_every = checkpoint_every
+
+    def get_many_iter(self, keys, ordered=False):
+        # ordered: yield the documents in the order of keys, rather than the order they are stored in
+        self.build()
+        if not ordered:
+            yield from self.lookup[keys]
+        else:
+            docs = {doc[self._id_field_idx]: doc for doc in self.lookup[keys]}
+            for key in dict.fromkeys(keys):
+                if key in docs:
+                    yield docs[key]
 
-    def get_many_iter(self, keys):
+    def get_many_fields_iter(self, keys, fields):
         self.build()
-        yield from self.lookup[keys]
+        yield from self.lookup.get_fields(keys, fields)
+
+    def scan(self, start=None, stop=None, prefix=None):
+        self.build()
+        yield from self.lookup.scan(start, stop, prefix)
+
+    def lookup_by(self, field, values):
+        self.build()
+        if field not in self.lookup._index_fields:
+            with _logger.duration(f'building {field} index'):
+                self.lookup.build_index(field)
+        yield from self.lookup.lookup_by(field, values)
 
     def build(self):
         if not self.built():
             if self.size_hint:
                 ir_datasets.util.check_disk_free(self.path, self.size_hint)
-            with self.lookup.transaction() as trans, _logger.duration('building docstore'):
+            with self.lookup.transaction(checkpoint_every=self.checkpoint_every) as trans, _logger.duration('building docstore'):
                 count_hint = self.count_hint # either a callable or int or None
                 if callable(count_hint):
                     count_hint = count_hint() # allows for deferred loading of metadata; should return an int or None
-                for doc in _logger.pbar(self.init_iter_fn(), 'docs_iter', unit='doc', total=count_hint):
-                    trans.add(doc)
+                it = self.init_iter_fn()
+                if trans.source_pos:
+                    _logger.info(f'resuming from checkpoint after {trans.source_pos} docs')
+                    if isinstance(it, ir_datasets.util.DocstoreSplitter):
+                        it = it.it # its slices would read from this docstore, which isn't built yet
+                    if ir_datasets.util.is_seekable(it):
+                        it = it[trans.source_pos:] # many docs_iter implementations can skip ahead quickly
+                    else:
+                        it = itertools.islice(it, trans.source_pos, None)
+                trans.add_all(_logger.pbar(it, 'docs_iter', unit='doc', total=count_hint, initial=trans.source_pos), workers=self.build_workers)
 
     def built(self):
-        return len(self.lookup) > 0
+        return len(self.lookup) > 0 and not self.lookup.has_checkpoint()
+
+    def handle(self):
+        self.build()
+        self.lookup.preload()
+        return self
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.built():
+            state['init_iter_fn'] = None # not needed once built (and often not picklable, e.g., a lambda)
+        return state
 
     def clear_cache(self):
         self.lookup.clear()
@@ -0,0 +1,447 @@
+import os
+import zlib
+import queue
+import itertools
+from collections import deque
+from threading import Lock, Thread
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+import ir_datasets
+from .lz4_pickle import Lz4PickleLookup
+
+
+_logger = ir_datasets.log.easy()
+
+
+WINDOW_SIZE = 4096 # records read from the shards at a time when iterating
+MAX_SHARDS = 256 # shard numbers are stored in a byte
+
+
+def _shard_of_key(key, count):
+    # stable across processes and runs (unlike hash())
+    return zlib.crc32(key.encode('utf8')) % count
+
+
+def _take(it, count):
+    return list(itertools.islice(it, count))
+
+
+def _drain(pool, it, future, chunk_size):
+    while True:
+        chunk = future.result()
+        if not chunk:
+            return
+        future = pool.submit(_take, it, chunk_size)
+        yield from chunk
+
+
+def _prefetch(pool, it, chunk_size=1024):
+    # yields the items of it, reading the next chunk of them in the background (starting right away)
+    it = iter(it)
+    return _drain(pool, it, pool.submit(_take, it, chunk_size), chunk_size)
+
+
+class Lz4ShardedIter:
+    def __init__(self, lookup, slice):
+        self.lookup = lookup
+        self.slice = slice
+        self.it = None
+
+    def __next__(self):
+        if self.slice.start >= self.slice.stop:
+            raise StopIteration
+        if self.it is None:
+            self.it = self.lookup._iter_slice(self.slice)
+        result = next(self.it)
+        self.slice = slice(self.slice.start + (self.slice.step or 1), self.slice.stop, self.slice.step)
+        return result
+
+    def __iter__(self):
+        return self
+
+    def take(self, ordinals):
+        # yields the records at the (sorted) ordinals of this slice, each read from its shard through the pos index
+        step = self.slice.step or 1
+        idxs = [self.slice.start + o * step for o in ordinals]
+        idxs = [i for i in idxs if i < self.slice.stop]
+        if idxs:
+            yield from self.lookup._take(idxs)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            # it[start:stop:step]
+            new_slice = ir_datasets.util.apply_sub_slice(self.slice, key)
+            return Lz4ShardedIter(self.lookup, new_slice)
+        elif isinstance(key, int):
+            # it[index]
+            new_slice = ir_datasets.util.slice_idx(self.slice, key)
+            new_it = Lz4ShardedIter(self.lookup, new_slice)
+            try:
+                return next(new_it)
+            except StopIteration as e:
+                raise IndexError(e)
+        raise TypeError('key must be int or slice')
+
+
+class Lz4ShardedLookup:
+    """
+    Splits the records of a store across several Lz4PickleLookup shards, each in its own directory (e.g., on
+    different disks). Records are assigned to shards either by a hash of their key (shard_by='hash') or by
+    their ordinal, in ranges of shard_range records dealt out to the shards in turn (shard_by='range').
+
+    Shards are read in parallel (by a pool of threads) and written concurrently. In hash mode, the shard of
+    each record is kept in a routing file (a byte per record) so that records can still be iterated in the
+    order they were added; key lookups only touch the shard of the key. In range mode, the shard of a record
+    follows from its ordinal, but key lookups check every shard.
+    """
+    def __init__(self, path, doc_cls, key_field, index_fields, key_field_prefix=None, shard_paths=None, shard_by='hash', shard_range=WINDOW_SIZE, **lookup_kwargs):
+        self._path = path
+        self._key_field = key_field
+        self._key_idx = doc_cls._fields.index(key_field)
+        self._doc_cls = doc_cls
+        self._shards_path = os.path.join(self._path, 'bin.shards')
+        self._route_path = os.path.join(self._path, 'bin.route')
+        self._route = None
+        self._route_counts = None
+        self._pool = None
+        self._shards = []
+        self._lock = Lock() # guards lazy initialization of the pool
+
+        # the layout of an existing store takes precedence over the requested one
+        if os.path.exists(self._shards_path):
+            with open(self._shards_path, 'rt') as f:
+                shard_by, shard_range, *shard_paths = f.read().split('\n')
+                shard_range = int(shard_range)
+        assert shard_by in ('hash', 'range'), "shard_by must be hash or range"
+        assert shard_paths and len(shard_paths) <= MAX_SHARDS, f"must have between 1 and {MAX_SHARDS} shards"
+        self._shard_by = shard_by
+        self._shard_range = shard_range
+        self._shard_paths = list(shard_paths)
+        # ordinals within a shard aren't the keys, so dense keys don't apply
+        lookup_kwargs['dense_keys'] = False
+        self._shards = [Lz4PickleLookup(p, doc_cls, key_field, index_fields, key_field_prefix, **lookup_kwargs) for p in self._shard_paths]
+        self._index_fields = self._shards[0]._index_fields
+
+    def route(self):
+        # the shard of each record (hash mode)
+        if self._route is None:
+            np = ir_datasets.lazy_libs.numpy()
+            if os.path.exists(self._route_path) and os.path.getsize(self._route_path) > 0:
+                self._route = np.memmap(self._route_path, dtype='uint8', mode='r')
+            else:
+                self._route = np.zeros(0, dtype='uint8')
+        return self._route
+
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=len(self._shards))
+        return self._pool
+
+    def shard_of(self, key, ordinal):
+        if self._shard_by == 'hash':
+            return _shard_of_key(key, len(self._shards))
+        return (ordinal // self._shard_range) % len(self._shards)
+
+    def preload(self):
+        for shard in self._shards:
+            shard.preload()
+        self.route()
+
+    def close(self):
+        for shard in self._shards:
+            shard.close()
+        if self._route is not None:
+            del self._route
+            self._route = None
+        self._route_counts = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def clear(self):
+        self.close()
+        for shard in self._shards:
+            shard.clear()
+        for path in [self._route_path, self._shards_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __del__(self):
+        self.close()
+
+    def __getstate__(self):
+        # see Lz4PickleLookup.__getstate__
+        state = dict(self.__dict__)
+        del state['_lock']
+        state['_pool'] = None
+        state['_route'] = None
+        state['_route_counts'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def has_checkpoint(self):
+        return False
+
+    @contextmanager
+    def transaction(self, checkpoint_every=None):
+        # checkpoint_every: accepted for compatibility with Lz4PickleLookup; sharded stores do not support checkpoints
+        if not os.path.exists(self._path):
+            os.makedirs(self._path, exist_ok=True)
+        if not os.path.exists(self._shards_path):
+            with open(self._shards_path, 'wt') as f:
+                f.write('\n'.join([self._shard_by, str(self._shard_range)] + self._shard_paths))
+
+        with Lz4ShardedTransaction(self) as trans:
+            yield trans
+
+    def _fan_out(self, fn, shard_args):
+        # calls fn(shard, arg) for each (shard number, arg) in parallel, returning the results in order
+        if len(shard_args) == 1:
+            s, arg = shard_args[0]
+            return [fn(self._shards[s], arg)]
+        futures = [self.pool().submit(fn, self._shards[s], arg) for s, arg in shard_args]
+        return [future.result() for future in futures]
+
+    def _route_keys(self, values):
+        if isinstance(values, str):
+            values = (values,)
+        if self._shard_by == 'range':
+            values = list(values)
+            return [(s, values) for s in range(len(self._shards))]
+        by_shard = {}
+        for value in values:
+            by_shard.setdefault(_shard_of_key(value, len(self._shards)), []).append(value)
+        return sorted(by_shard.items())
+
+    def __getitem__(self, values):
+        for records in self._fan_out(lambda shard, vals: list(shard[vals]), self._route_keys(values)):
+            yield from records
+
+    def get_fields(self, values, fields):
+        for results in self._fan_out(lambda shard, vals: list(shard.get_fields(vals, fields)), self._route_keys(values)):
+            yield from results
+
+    def lookup_by(self, field, values):
+        # Yields the records where field has any of the given values; see Lz4PickleLookup.lookup_by
+        if field == self._key_field:
+            yield from self[values]
+            return
+        values = list(values) if not isinstance(values, str) else [values]
+        args = [(s, values) for s in range(len(self._shards))]
+        for records in self._fan_out(lambda shard, vals: list(shard.lookup_by(field, vals)), args):
+            yield from records
+
+    def scan(self, start=None, stop=None, prefix=None):
+        # Yields the records with keys in [start, stop) or that start with prefix, shard by shard (each in the order
+        # they are stored). All the shards are read ahead in parallel.
+        its = [_prefetch(self.pool(), shard.scan(start, stop, prefix)) for shard in self._shards]
+        for it in its:
+            yield from it
+
+    def build_index(self, field):
+        self._fan_out(lambda shard, _: shard.build_index(field), [(s, None) for s in range(len(self._shards))])
+        self._index_fields = self._shards[0]._index_fields
+
+    def _locate_windows(self, start, stop, step):
+        # yields (shards, shard ordinals) arrays for the records in windows of range(start, stop, step)
+        np = ir_datasets.lazy_libs.numpy()
+        count = len(self._shards)
+        if self._shard_by == 'hash':
+            route = self.route()
+            # number of records in each shard before the current window
+            counts = np.bincount(route[:start], minlength=count).astype('int64')
+        for a in range(start, stop, WINDOW_SIZE * step):
+            b = min(a + WINDOW_SIZE * step, stop)
+            if self._shard_by == 'hash':
+                shards = np.asarray(route[a:b])
+                ordinals = np.empty(b - a, dtype='int64')
+                for s in range(count):
+                    mask = shards == s
+                    shard_count = int(mask.sum())
+                    ordinals[mask] = counts[s] + np.arange(shard_count)
+                    counts[s] += shard_count
+            else:
+                ordinals = np.arange(a, b, dtype='int64')
+                shards = (ordinals // self._shard_range) % count
+                ordinals = (ordinals // (self._shard_range * count)) * self._shard_range + ordinals % self._shard_range
+            yield shards[::step], ordinals[::step]
+
+    def _window_route_counts(self):
+        # (hash mode) the number of records in each shard before each window of WINDOW_SIZE records
+        if self._route_counts is None:
+            np = ir_datasets.lazy_libs.numpy()
+            route = self.route()
+            counts = np.zeros((route.shape[0] // WINDOW_SIZE + 1, len(self._shards)), dtype='int64')
+            for w in range(1, counts.shape[0]):
+                counts[w] = counts[w-1] + np.bincount(route[(w-1)*WINDOW_SIZE:w*WINDOW_SIZE], minlength=len(self._shards))
+            self._route_counts = counts
+        return self._route_counts
+
+    def _locate(self, ordinals):
+        # (shards, shard ordinals) arrays of the records at the given ordinals
+        np = ir_datasets.lazy_libs.numpy()
+        ordinals = np.asarray(ordinals, dtype='int64')
+        count = len(self._shards)
+        if self._shard_by == 'hash':
+            route = self.route()
+            counts = self._window_route_counts()
+            shards = np.asarray(route[ordinals]).astype('int64')
+            shard_ordinals = np.empty_like(ordinals)
+            for i, (ordinal, s) in enumerate(zip(ordinals.tolist(), shards.tolist())):
+                # records of the shard before this window, plus those in this window before the record
+                window_start = (ordinal // WINDOW_SIZE) * WINDOW_SIZE
+                shard_ordinals[i] = counts[ordinal // WINDOW_SIZE, s] + np.count_nonzero(route[window_start:ordinal] == s)
+            return shards, shard_ordinals
+        shards = (ordinals // self._shard_range) % count
+        shard_ordinals = (ordinals // (self._shard_range * count)) * self._shard_range + ordinals % self._shard_range
+        return shards, shard_ordinals
+
+    def _take(self, ordinals):
+        # yields the records at the given (sorted) ordinals, a window at a time
+        for i in range(0, len(ordinals), WINDOW_SIZE):
+            yield from self._read_window(*self._locate(ordinals[i:i+WINDOW_SIZE]))
+
+    def _read_window(self, shards, ordinals):
+        np = ir_datasets.lazy_libs.numpy()
+        result = [None for _ in range(shards.shape[0])]
+        for s, shard in enumerate(self._shards):
+            idxs = np.flatnonzero(shards == s)
+            if idxs.shape[0] == 0:
+                continue
+            # records in a shard are stored in the order they were added, so these are read sequentially
+            poss = shard.pos()[ordinals[idxs].tolist()]
+            for i, record in zip(idxs.tolist(), shard._read_poss(poss)):
+                result[i] = record
+        return result
+
+    def _iter_slice(self, slc):
+        # yields the records in the slice (by ordinal), with up to one window per shard read ahead in parallel
+        windows = self._locate_windows(slc.start, slc.stop, slc.step or 1)
+        pool = self.pool()
+        futures = deque(pool.submit(self._read_window, *window) for window in itertools.islice(windows, len(self._shards)))
+        while futures:
+            records = futures.popleft().result()
+            for window in itertools.islice(windows, 1):
+                futures.append(pool.submit(self._read_window, *window))
+            yield from records
+
+    def path(self, force=True):
+        return self._path
+
+    def __iter__(self):
+        return Lz4ShardedIter(self, slice(0, len(self), 1))
+
+    def __len__(self):
+        # number of keys
+        return sum(len(shard) for shard in self._shards)
+
+
+class Lz4ShardedTransaction:
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self.stack = None
+        self.transactions = None
+        self.route = None
+        self.next_ordinal = None
+        self.source_pos = 0
+
+    def __enter__(self):
+        self.stack = ExitStack()
+        self.transactions = [self.stack.enter_context(shard.transaction()) for shard in self.lookup._shards]
+        self.next_ordinal = len(self.lookup)
+        self.route = bytearray()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.transactions is not None:
+            if not exc_val:
+                self.commit()
+            else:
+                self.rollback()
+
+    def commit(self):
+        for trans in self.transactions:
+            trans.commit()
+        if self.lookup._shard_by == 'hash':
+            with open(self.lookup._route_path, 'ab') as f:
+                f.write(self.route)
+        self._release()
+
+    def rollback(self):
+        for trans in self.transactions:
+            trans.rollback()
+        self._release()
+
+    def _release(self):
+        self.stack.close() # the transactions of the shards are already finished, so this just exits them
+        self.stack = None
+        self.transactions = None
+        self.route = None
+        self.lookup.close() # any open shards and routes are now stale
+
+    def _shard_of(self, record):
+        shard = self.lookup.shard_of(record[self.lookup._key_idx], self.next_ordinal)
+        self.next_ordinal += 1
+        if self.lookup._shard_by == 'hash':
+            self.route.append(shard)
+        return shard
+
+    def add(self, record):
+        self.transactions[self._shard_of(record)].add(record)
+
+    def add_all(self, records, workers=None, batch_size=1024, max_in_flight=16):
+        """
+        Adds all records from the iterable. Each shard is written by its own thread (which, when workers > 1,
+        uses its own pool of encoding processes; see Lz4PickleTransaction.add_all), so that shards on different
+        disks are written concurrently. Records are passed to the threads in batches of batch_size, with up to
+        max_in_flight batches waiting per shard.
+        """
+        queues = [queue.Queue(max_in_flight) for _ in self.transactions]
+        errors = []
+
+        def write(trans, q):
+            done = False
+            def batches():
+                nonlocal done
+                while True:
+                    batch = q.get()
+                    if batch is None:
+                        done = True
+                        return
+                    yield from batch
+            try:
+                trans.add_all(batches(), workers=workers)
+            except BaseException as ex:
+                errors.append(ex)
+                while not done: # keep taking batches, so that the records are never blocked on this shard
+                    done = q.get() is None
+
+        threads = [Thread(target=write, args=(trans, q), daemon=True) for trans, q in zip(self.transactions, queues)]
+        for thread in threads:
+            thread.start()
+        pending = [[] for _ in self.transactions]
+        completed = False
+        try:
+            for record in records:
+                if errors:
+                    break
+                shard = self._shard_of(record)
+                pending[shard].append(record)
+                if len(pending[shard]) >= batch_size:
+                    queues[shard].put(pending[shard])
+                    pending[shard] = []
+            completed = True
+        finally:
+            for q, batch in zip(queues, pending):
+                if batch and completed:
+                    q.put(batch)
+                q.put(None)
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
@@ -1,11 +1,63 @@
 import os
+import shutil
 import ir_datasets
 
 
+HASH_EMPTY = 0xFFFFFFFF
+FNV_OFFSET = 0xcbf29ce484222325
+FNV_PRIME = 0x100000001b3
+
+
+def _fnv1a(np, keys):
+    # vectorized 64-bit FNV-1a over fixed-width byte keys (including padding, which is the same for equal keys)
+    data = keys.view('u1').reshape(keys.shape[0], keys.dtype.itemsize)
+    result = np.full(keys.shape[0], FNV_OFFSET, dtype='uint64')
+    prime = np.uint64(FNV_PRIME)
+    for col in range(data.shape[1]):
+        result ^= data[:, col]
+        result *= prime
+    return result
+
+
+def _prefix_stop(prefix):
+    # the smallest byte string greater than all strings that start with prefix (None if there isn't one)
+    prefix = prefix.rstrip(b'\xff')
+    if not prefix:
+        return None
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
 class NumpySortedIndex:
-    def __init__(self, path):
+    def __init__(self, path, max_run_size=None, merge_chunk_size=None, hash_index=False, tiered=False, max_tiers=16, unique=True):
+        # max_run_size: number of keys to hold in memory before spilling a sorted run to disk. Defaults to
+        #   IR_DATASETS_INDEX_RUN_SIZE (or 1048576); lower it to build the indices of docstores with less memory.
+        # merge_chunk_size: number of keys to read from each run at a time when merging runs. Defaults to
+        #   IR_DATASETS_INDEX_MERGE_CHUNK (or 65536).
+        # hash_index: also maintain a static open-addressing hash table over the keys ({path}.hash), giving
+        #   single-probe lookups (on average) instead of O(log n) binary search over the key file.
+        # tiered: commit new keys as a small sorted tier ({path}.tier*) rather than rewriting the whole index.
+        #   A tier is merged with the one before it once it's at least as large (or there are more than
+        #   max_tiers), so a commit costs amortized O(log n) per new key rather than O(n). Lookups check the
+        #   tiers newest-first. (Tiers on disk are always read; a non-tiered commit merges them all.)
+        # unique: each key maps to a single position (the last one added). Otherwise, all (key, position) pairs
+        #   are kept, and get_all() returns every position of a key.
+        assert unique or not hash_index, "hash_index requires unique keys"
         self.path = path
+        self.unique = unique
+        self.hash_index = hash_index
+        self.tiered = tiered
+        self.max_tiers = max_tiers
+        self.tiers = None
+        self.tiers_len = None
+        self.mmap_hash = None
         self.transaction = None
+        self.runs = []
+        if max_run_size is None:
+            max_run_size = int(os.environ.get('IR_DATASETS_INDEX_RUN_SIZE', str(1024*1024)))
+        self.max_run_size = max_run_size
+        if merge_chunk_size is None:
+            merge_chunk_size = int(os.environ.get('IR_DATASETS_INDEX_MERGE_CHUNK', str(64*1024)))
+        self.merge_chunk_size = merge_chunk_size
         self.mmap_keys = None
         self.mmap_poss = None
         self.doccount = None
@@ -14,33 +66,251 @@ class NumpySortedIndex:
 
     def add(self, key, idx):
         if self.transaction is None:
-            self.transaction = {}
-        self.transaction[key] = idx
+            self.transaction = {} if self.unique else []
+        if self.unique:
+            self.transaction[key] = idx
+        else:
+            self.transaction.append((key, idx))
+        if len(self.transaction) >= self.max_run_size:
+            self._spill()
+
+    def _sorted_transaction(self):
+        items = self.transaction.items() if self.unique else self.transaction
+        keys = [k.encode('utf8') for k, _ in items]
+        keys = self.np.array(keys, dtype=f'S{max(max(len(k) for k in keys), 1)}')
+        poss = self.np.fromiter((v for _, v in items), dtype='int64', count=len(keys))
+        order = self.np.argsort(keys, kind='stable')
+        return keys[order], poss[order]
+
+    def _runs_path(self):
+        return f'{self.path}.runs'
+
+    def _spill(self):
+        # write the current transaction as a sorted run, to be merged on commit
+        self._lazy_load()
+        keys, poss = self._sorted_transaction()
+        os.makedirs(self._runs_path(), exist_ok=True)
+        run_path = os.path.join(self._runs_path(), str(len(self.runs)))
+        self.np.save(f'{run_path}.key.npy', keys)
+        self.np.save(f'{run_path}.pos.npy', poss)
+        self.runs.append(run_path)
+        self.transaction = None
+
+    def checkpoint(self):
+        # spills any pending keys, so that everything added so far is on disk; returns the number of runs
+        if self.transaction is not None:
+            self._spill()
+        return len(self.runs)
+
+    def resume(self, run_count):
+        # picks up the runs written by checkpoint() in an interrupted transaction, discarding any later ones
+        self.transaction = None
+        self.runs = []
+        runs_path = self._runs_path()
+        if os.path.exists(runs_path):
+            for i in range(run_count):
+                run_path = os.path.join(runs_path, str(i))
+                if not (os.path.exists(f'{run_path}.key.npy') and os.path.exists(f'{run_path}.pos.npy')):
+                    break
+                self.runs.append(run_path)
+            for file in os.listdir(runs_path):
+                if int(file.split('.')[0]) >= len(self.runs):
+                    os.remove(os.path.join(runs_path, file))
+
+    def _discard_runs(self):
+        self.runs = []
+        if os.path.exists(self._runs_path()):
+            shutil.rmtree(self._runs_path())
 
     def commit(self):
         self._lazy_load()
-        if self.transaction is None:
+        if self.transaction is None and not self.runs:
             return
-        transaction = sorted(self.transaction.items())
-        transaction = [(x[0].encode('utf8'), x[1]) for x in transaction]
-        if self._exists():
-            transaction += [(k, p) for k, p in zip(self.mmap_keys, self.mmap_poss) if (k.decode() not in self.transaction)]
-            transaction = sorted(transaction)
-        keys = [x[0] for x in transaction]
-        poss = [x[1] for x in transaction]
-        self.keylen = max(len(k) for k in keys)
-        self.doccount = len(keys)
+        # Each source is a sorted array of unique keys; later sources take priority over earlier ones.
+        sources = []
+        for run_path in self.runs:
+            sources.append((self.np.load(f'{run_path}.key.npy', mmap_mode='r'), self.np.load(f'{run_path}.pos.npy', mmap_mode='r')))
+        if self.transaction is not None:
+            sources.append(self._sorted_transaction())
+        if self.tiered and self._exists():
+            name = max([t[0] for t in self.tiers], default=-1) + 1
+            keylen, count = self._write_merged(sources, self._tier_path(name))
+            del sources
+            self.tiers.append(self._load_tier(name, keylen, count))
+            self._compact_tiers()
+        else:
+            sources = self._tier_sources() + sources
+            if self._exists():
+                sources.insert(0, (self.mmap_keys, self.mmap_poss))
+            tiers = self.tiers
+            self._write_base(sources)
+            del sources
+            self.tiers = tiers
+            self._write_tiers([])
+        self.transaction = None
+        self._discard_runs()
+        self._lazy_load()
+
+    def _write_merged(self, sources, path):
+        # merges the sources into {path}.key and {path}.pos; returns (keylen, count)
+        keylen = max(keys.dtype.itemsize for keys, _ in sources)
+        count = 0
+        with open(f'{path}.key.tmp', 'wb') as f_keys, open(f'{path}.pos.tmp', 'wb') as f_poss:
+            for keys, poss in self._merge(sources, keylen):
+                f_keys.write(keys.tobytes())
+                f_poss.write(poss.tobytes())
+                count += keys.shape[0]
+        os.replace(f'{path}.key.tmp', f'{path}.key')
+        os.replace(f'{path}.pos.tmp', f'{path}.pos')
+        return keylen, count
+
+    def _write_base(self, sources):
+        # written to temporary files first, since the sources can include the current base
+        keylen, doccount = self._write_merged(sources, f'{self.path}.new')
+        del sources
+        self.close()
+        os.replace(f'{self.path}.new.key', f'{self.path}.key')
+        os.replace(f'{self.path}.new.pos', f'{self.path}.pos')
+        self.keylen = keylen
+        self.doccount = doccount
         # Use zero-terminated bytes here (S) rather than unicode type (U) because U includes a ton
         # of extra padding (for longer unicode formats), which can inflate the size of the index greatly.
-        keys = self.np.array(keys, dtype=f'S{self.keylen}')
-        poss = self.np.array(poss, dtype='int64')
-        self.mmap_keys = self.np.memmap(f'{self.path}.key', dtype=keys.dtype, mode='w+', shape=keys.shape)
-        self.mmap_keys[:] = keys[:]
-        self.mmap_poss = self.np.memmap(f'{self.path}.pos', dtype=poss.dtype, mode='w+', shape=poss.shape)
-        self.mmap_poss[:] = poss[:]
         with ir_datasets.util.finialized_file(f'{self.path}.meta', 'wt') as f:
             f.write(f'{self.keylen} {self.doccount}')
-        self.transaction = None
+        if os.path.exists(f'{self.path}.hash'):
+            os.remove(f'{self.path}.hash') # stale; re-built by _lazy_load if needed
+
+    def _tier_path(self, name):
+        return f'{self.path}.tier{name}'
+
+    def _tier_sources(self):
+        return [(keys, poss) for _, _, _, keys, poss in self.tiers]
+
+    def _load_tier(self, name, keylen, count):
+        keys = self.np.memmap(f'{self._tier_path(name)}.key', dtype=f'S{keylen}', mode='r', shape=(count,))
+        poss = self.np.memmap(f'{self._tier_path(name)}.pos', dtype='int64', mode='r', shape=(count,))
+        return (name, keylen, count, keys, poss)
+
+    def _write_tiers(self, tiers):
+        # updates the list of tiers on disk and removes the files of tiers no longer in it
+        old_names = {t[0] for t in self.tiers}
+        if tiers:
+            with ir_datasets.util.finialized_file(f'{self.path}.tiers', 'wt') as f:
+                f.write(''.join(f'{name} {keylen} {count}\n' for name, keylen, count, _, _ in tiers))
+        elif os.path.exists(f'{self.path}.tiers'):
+            os.remove(f'{self.path}.tiers')
+        self.tiers = tiers
+        self.tiers_len = None
+        for name in old_names - {t[0] for t in tiers}:
+            for ext in ['key', 'pos']:
+                os.remove(f'{self._tier_path(name)}.{ext}')
+
+    def _compact_tiers(self):
+        tiers = list(self.tiers)
+        while tiers:
+            prev_count = tiers[-2][2] if len(tiers) > 1 else self.doccount
+            if tiers[-1][2] < prev_count and len(tiers) <= self.max_tiers:
+                break
+            if len(tiers) > 1:
+                # merge the two newest tiers into a new one
+                name = max(t[0] for t in self.tiers) + 1
+                keylen, count = self._write_merged([t[3:] for t in tiers[-2:]], self._tier_path(name))
+                tiers[-2:] = [self._load_tier(name, keylen, count)]
+                self.tiers.append(tiers[-1]) # so that its files are cleaned up if it's merged again
+            else:
+                # merge the only remaining tier into the base
+                all_tiers = self.tiers
+                self._write_base([(self.mmap_keys, self.mmap_poss), tiers[0][3:]])
+                self.tiers = all_tiers
+                self._lazy_load()
+                tiers = []
+        self._write_tiers(tiers)
+
+    def _build_hash(self, chunk_size=1024*1024):
+        # Linear probing over a power-of-two bucket array with a load factor of at most 0.5. Each bucket
+        # holds the row of the key in the key/pos files (or HASH_EMPTY).
+        np = self.np
+        assert self.doccount < HASH_EMPTY, "too many keys for hash_index"
+        capacity = 1
+        while capacity < self.doccount * 2:
+            capacity *= 2
+        mask = np.uint64(capacity - 1)
+        buckets = np.full(capacity, HASH_EMPTY, dtype='uint32')
+        for start in range(0, self.doccount, chunk_size):
+            rows = np.arange(start, min(start + chunk_size, self.doccount), dtype='uint32')
+            slots = _fnv1a(np, np.asarray(self.mmap_keys[start:start+chunk_size])) & mask
+            while rows.shape[0] > 0:
+                free = np.flatnonzero(buckets[slots] == HASH_EMPTY)
+                # when multiple keys want the same free bucket, the first one gets it
+                free_slots, first = np.unique(slots[free], return_index=True)
+                buckets[free_slots] = rows[free[first]]
+                placed = np.zeros(rows.shape[0], dtype=bool)
+                placed[free[first]] = True
+                rows, slots = rows[~placed], (slots[~placed] + np.uint64(1)) & mask
+        with ir_datasets.util.finialized_file(f'{self.path}.hash', 'wb') as f:
+            f.write(buckets.tobytes())
+        self.mmap_hash = np.memmap(f'{self.path}.hash', dtype='uint32', mode='r')
+
+    def _hash_lookup(self, keys):
+        np = self.np
+        mask = np.uint64(self.mmap_hash.shape[0] - 1)
+        slots = _fnv1a(np, keys) & mask
+        result = np.full(keys.shape[0], -1, dtype='int64')
+        active = np.arange(keys.shape[0])
+        while active.shape[0] > 0:
+            rows = self.mmap_hash[slots]
+            occupied = rows != HASH_EMPTY # empty bucket: key not present
+            active, slots, rows = active[occupied], slots[occupied], rows[occupied]
+            # verify against the stored key, since different keys can share a bucket
+            match = self.mmap_keys[rows] == keys[active]
+            result[active[match]] = self.mmap_poss[rows[match]]
+            active, slots = active[~match], (slots[~match] + np.uint64(1)) & mask
+        return result
+
+    def _merge(self, sources, keylen):
+        # k-way merge of sorted (keys, poss) sources, merge_chunk_size keys from each source at a time.
+        # Yields sorted (keys, poss) chunks, keeping the value from the latest source for duplicate keys.
+        np = self.np
+        dtype = f'S{keylen}'
+        cursors = [0 for _ in sources]
+        while True:
+            chunks = []
+            pivot = None
+            for (keys, poss), cursor in zip(sources, cursors):
+                if cursor < keys.shape[0]:
+                    chunk_keys = keys[cursor:cursor+self.merge_chunk_size]
+                    chunks.append(chunk_keys)
+                    if cursor + self.merge_chunk_size < keys.shape[0]:
+                        # this source has more keys beyond the chunk, so only keys up to its last one are safe to emit
+                        last_key = chunk_keys[-1]
+                        if pivot is None or last_key < pivot:
+                            pivot = last_key
+                else:
+                    chunks.append(None)
+            if all(c is None for c in chunks):
+                break
+            merge_keys, merge_poss, merge_prio = [], [], []
+            for prio, ((keys, poss), chunk_keys) in enumerate(zip(sources, chunks)):
+                if chunk_keys is None:
+                    continue
+                count = chunk_keys.shape[0] if pivot is None else int(np.searchsorted(chunk_keys, pivot, side='right'))
+                if count == 0:
+                    continue
+                merge_keys.append(np.asarray(chunk_keys[:count], dtype=dtype))
+                merge_poss.append(np.asarray(poss[cursors[prio]:cursors[prio]+count]))
+                merge_prio.append(np.full(count, prio, dtype='int32'))
+                cursors[prio] += count
+            merge_keys = np.concatenate(merge_keys)
+            merge_poss = np.concatenate(merge_poss)
+            order = np.lexsort((np.concatenate(merge_prio), merge_keys))
+            merge_keys, merge_poss = merge_keys[order], merge_poss[order]
+            if not self.unique:
+                yield merge_keys, merge_poss.astype('int64')
+                continue
+            # keep the last (highest priority) entry of each key
+            mask = np.ones(merge_keys.shape[0], dtype=bool)
+            mask[:-1] = merge_keys[:-1] != merge_keys[1:]
+            yield merge_keys[mask], merge_poss[mask].astype('int64')
 
     def _exists(self):
         return os.path.exists(f'{self.path}.key')
@@ -48,12 +318,24 @@ class NumpySortedIndex:
     def _lazy_load(self):
         if self.np is None:
             self.np = ir_datasets.lazy_libs.numpy()
+        if self.tiers is None:
+            self.tiers = []
+            if os.path.exists(f'{self.path}.tiers'):
+                with open(f'{self.path}.tiers', 'rt') as f:
+                    for line in f:
+                        self.tiers.append(self._load_tier(*(int(v) for v in line.split())))
         if self.mmap_keys is None and self._exists():
-            with open(f'{self.path}.meta', 'rt') as f:
-                self.keylen, self.doccount = f.read().split()
-                self.keylen, self.doccount = int(self.keylen), int(self.doccount)
+            if self.keylen is None: # already known when unpickled
+                with open(f'{self.path}.meta', 'rt') as f:
+                    self.keylen, self.doccount = f.read().split()
+                    self.keylen, self.doccount = int(self.keylen), int(self.doccount)
             self.mmap_keys = self.np.memmap(f'{self.path}.key', dtype=f'S{self.keylen}', mode='r', shape=(self.doccount,))
             self.mmap_poss = self.np.memmap(f'{self.path}.pos', dtype='int64', mode='r', shape=(self.doccount,))
+            if self.hash_index:
+                if os.path.exists(f'{self.path}.hash'):
+                    self.mmap_hash = self.np.memmap(f'{self.path}.hash', dtype='uint32', mode='r')
+                else:
+                    self._build_hash() # index built before hash_index was enabled
 
     def __getitem__(self, keys):
         self._lazy_load()
@@ -61,11 +343,85 @@ class NumpySortedIndex:
             keys = (keys,)
         if not self._exists():
             return [-1 for _ in keys]
-        keys = self.np.array([key.encode('utf8') for key in keys], dtype=f'S{self.keylen}')
-        locs = self.np.searchsorted(self.mmap_keys, keys)
-        locs[locs >= self.mmap_keys.shape[0]] = self.mmap_keys.shape[0] - 1 # could be placed AFTER existing keys
-        mask = self.mmap_keys[locs] == keys
-        return ((self.mmap_poss[locs] * mask) + (~mask * -1)).tolist()
+        keys = [key.encode('utf8') for key in keys]
+        result = self._lookup(keys, self.mmap_keys, self.mmap_poss, self.keylen, use_hash=True)
+        for _, keylen, _, tier_keys, tier_poss in self.tiers:
+            tier_result = self._lookup(keys, tier_keys, tier_poss, keylen)
+            result = self.np.where(tier_result != -1, tier_result, result) # newer tiers take priority
+        return result.tolist()
+
+    def get_all(self, keys):
+        # returns a sorted list of all the positions of each key
+        self._lazy_load()
+        if isinstance(keys, str):
+            keys = (keys,)
+        if not self._exists():
+            return [[] for _ in keys]
+        keys = [key.encode('utf8') for key in keys]
+        result = [[] for _ in keys]
+        segments = [(self.keylen, self.mmap_keys, self.mmap_poss)] + [(keylen, tier_keys, tier_poss) for _, keylen, _, tier_keys, tier_poss in self.tiers]
+        for keylen, mmap_keys, mmap_poss in segments:
+            too_long = [len(key) > keylen for key in keys]
+            np_keys = self.np.array(keys, dtype=f'S{keylen}')
+            starts = self.np.searchsorted(mmap_keys, np_keys, side='left')
+            ends = self.np.searchsorted(mmap_keys, np_keys, side='right')
+            for i, (start, end) in enumerate(zip(starts, ends)):
+                if start < end and not too_long[i]:
+                    result[i].extend(mmap_poss[start:end].tolist())
+        return [sorted(r) for r in result]
+
+    def scan(self, start=None, stop=None, prefix=None):
+        """
+        Returns (keys, positions) arrays of the keys k where start <= k < stop (either can be None for
+        unbounded) or that start with prefix, in key order. Keys are returned as utf8-encoded bytes.
+        """
+        self._lazy_load()
+        np = self.np
+        if prefix is not None:
+            assert start is None and stop is None, "specify either prefix or start/stop"
+            start = prefix.encode('utf8')
+            stop = _prefix_stop(start)
+        else:
+            start = start.encode('utf8') if start is not None else None
+            stop = stop.encode('utf8') if stop is not None else None
+        if not self._exists():
+            return np.array([], dtype='S1'), np.array([], dtype='int64')
+        segments = [(self.mmap_keys, self.mmap_poss)] + self._tier_sources()
+        slices = [self._scan_segment(keys, poss, start, stop) for keys, poss in segments]
+        if len(slices) == 1:
+            return np.asarray(slices[0][0]), np.asarray(slices[0][1])
+        # keys in tiers need to be merged (with the newer ones taking priority)
+        keylen = max(keys.dtype.itemsize for keys, _ in slices)
+        merged = list(self._merge(slices, keylen))
+        if not merged:
+            return np.array([], dtype=f'S{keylen}'), np.array([], dtype='int64')
+        return np.concatenate([k for k, _ in merged]), np.concatenate([p for _, p in merged])
+
+    def _scan_segment(self, keys, poss, start, stop):
+        keylen = keys.dtype.itemsize
+        lo, hi = 0, keys.shape[0]
+        # Bounds longer than keylen get truncated. Since no key is longer than keylen, a key is >= start (or < stop)
+        # iff it's > (or <=) the truncated bound.
+        if start is not None:
+            lo = int(self.np.searchsorted(keys, self.np.array(start, dtype=f'S{keylen}'), side='right' if len(start) > keylen else 'left'))
+        if stop is not None:
+            hi = int(self.np.searchsorted(keys, self.np.array(stop, dtype=f'S{keylen}'), side='right' if len(stop) > keylen else 'left'))
+        hi = max(lo, hi)
+        return keys[lo:hi], poss[lo:hi]
+
+    def _lookup(self, keys, mmap_keys, mmap_poss, keylen, use_hash=False):
+        # keys longer than any in the index would otherwise be truncated to a (potentially matching) prefix
+        too_long = self.np.array([len(key) > keylen for key in keys], dtype=bool)
+        keys = self.np.array(keys, dtype=f'S{keylen}')
+        if use_hash and self.mmap_hash is not None:
+            result = self._hash_lookup(keys)
+        else:
+            locs = self.np.searchsorted(mmap_keys, keys)
+            locs[locs >= mmap_keys.shape[0]] = mmap_keys.shape[0] - 1 # could be placed AFTER existing keys
+            mask = mmap_keys[locs] == keys
+            result = (mmap_poss[locs] * mask) + (~mask * -1)
+        result[too_long] = -1
+        return result
 
     def close(self):
         if self.mmap_keys is not None:
@@ -74,11 +430,36 @@ class NumpySortedIndex:
         if self.mmap_poss is not None:
             del self.mmap_poss
             self.mmap_poss = None
+        if self.mmap_hash is not None:
+            del self.mmap_hash
+            self.mmap_hash = None
+        self.keylen = None
+        self.doccount = None
+        self.tiers = None
+        self.tiers_len = None
         self.data = None
 
+    def __getstate__(self):
+        # Pickles to a cheap handle (e.g., for worker processes): the parsed metadata is kept, but the memory maps
+        # are re-opened lazily over the same files, so the processes share their pages through the OS page cache.
+        assert self.transaction is None and not self.runs, "cannot pickle an index with uncommitted keys"
+        self._lazy_load() # so that workers don't each need to parse the metadata (or build the hash table)
+        state = dict(self.__dict__)
+        for attr in ['mmap_keys', 'mmap_poss', 'mmap_hash', 'tiers', 'tiers_len', 'np']:
+            state[attr] = None
+        return state
+
+    def rollback(self):
+        self.transaction = None
+        self._discard_runs()
+        self.close()
+
     def clear(self):
+        self.rollback()
+        self._lazy_load()
+        self._write_tiers([])
         self.close()
-        for file in ['meta', 'key', 'pos']:
+        for file in ['meta', 'key', 'pos', 'hash']:
             path = f'{self.path}.{file}'
             if os.path.exists(path):
                 os.remove(path)
@@ -90,16 +471,30 @@ class NumpySortedIndex:
         # iterates keys
         self._lazy_load()
         if self._exists():
-            for i in range(len(self)):
-                yield self.mmap_keys[i].decode('utf8')
+            if self.tiers:
+                for keys, _ in self._merge_tiers():
+                    for key in keys:
+                        yield key.decode('utf8')
+            else:
+                for i in range(len(self)):
+                    yield self.mmap_keys[i].decode('utf8')
 
     def __len__(self):
         # number of keys
         self._lazy_load()
         if self._exists():
+            if self.tiers:
+                if self.tiers_len is None:
+                    # keys can appear in multiple tiers, so they need to be merged to count them
+                    self.tiers_len = sum(keys.shape[0] for keys, _ in self._merge_tiers())
+                return self.tiers_len
             return self.doccount
         return 0
 
+    def _merge_tiers(self):
+        keylen = max([self.keylen] + [t[1] for t in self.tiers])
+        return self._merge([(self.mmap_keys, self.mmap_poss)] + self._tier_sources(), keylen)
+
 
 class NumpyPosIndex:
     def __init__(self, path):
@@ -132,6 +527,11 @@ class NumpyPosIndex:
     def _exists(self):
         return os.path.exists(self.path)
 
+    def __getstate__(self):
+        # see NumpySortedIndex.__getstate__
+        assert self.transaction is None, "cannot pickle an index with uncommitted positions"
+        return {'path': self.path, 'transaction': None, 'mmap': None, 'np': None}
+
     def _lazy_load(self):
         if self.np is None:
             self.np = ir_datasets.lazy_libs.numpy()
@@ -141,13 +541,15 @@ class NumpyPosIndex:
 
     def __getitem__(self, idxs):
         self._lazy_load()
+        if isinstance(idxs, slice):
+            return self.mmap[idxs].tolist() if self._exists() else []
         if isinstance(idxs, int):
             idxs = (idxs,)
         if not self._exists():
             return [-1 for _ in idxs]
-        idxs = self.np.array(idxs)
-        mask = idxs > 0 & idxs < self.mmap.shape[0]
-        return ((self.mmap[idxs] * mask) + (~mask * -1)).tolist()
+        idxs = self.np.array(idxs, dtype='int64')
+        mask = (idxs >= 0) & (idxs < self.mmap.shape[0])
+        return ((self.mmap[idxs * mask] * mask) + (~mask * -1)).tolist()
 
     def close(self):
         if self.mmap is not None:
@@ -0,0 +1,263 @@
+import os
+import pickle
+import socket
+import struct
+import itertools
+import threading
+import socketserver
+import ir_datasets
+from .base import Docstore
+
+
+_logger = ir_datasets.log.easy()
+
+
+STREAM_CHUNK_SIZE = 1024 # documents per message when streaming a slice of the corpus
+
+
+# Messages are [8-byte length][pickle] frames. Since pickles are trusted, the server's socket is only accessible
+# to the user that started it.
+
+def _send(sock, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(struct.pack('<Q', len(data)))
+    sock.sendall(data)
+
+
+def _recv_exact(sock, length):
+    buf = bytearray(length)
+    view = memoryview(buf)
+    received = 0
+    while received < length:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            return None # connection closed
+        received += count
+    return buf
+
+
+def _recv(sock):
+    # returns None if the connection was closed
+    header = _recv_exact(sock, 8)
+    if header is None:
+        return None
+    data = _recv_exact(sock, struct.unpack('<Q', header)[0])
+    if data is None:
+        return None
+    return pickle.loads(data)
+
+
+def _result(message):
+    if message is None:
+        raise ConnectionError('docstore server closed the connection')
+    status, value = message
+    if status == 'error':
+        raise RuntimeError(f'docstore server: {value}')
+    return value
+
+
+class RemoteDocstore(Docstore):
+    """
+    Looks up documents through a docstore server (see ``ir_datasets serve``), which keeps the docstores of
+    datasets open for all the processes on a machine. Selected by docs_store() when IR_DATASETS_DOCSTORE_SERVER
+    is set to the path of the server's socket.
+    """
+    def __init__(self, path, dataset_id, doc_cls, id_field='doc_id'):
+        super().__init__(doc_cls, id_field)
+        self.path = path
+        self.dataset_id = dataset_id
+        self._local = threading.local() # one connection per thread (and process)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self.path))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _call(self, op, *args):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn[0] != os.getpid(): # don't share a connection inherited from a parent process
+            conn = self._local.conn = (os.getpid(), self._connect())
+        sock = conn[1]
+        try:
+            _send(sock, (op, self.dataset_id, args))
+            message = _recv(sock)
+        except OSError:
+            self._local.conn = None
+            sock.close()
+            raise
+        if message is None:
+            self._local.conn = None
+            sock.close()
+        return _result(message)
+
+    def _stream(self, op, *args):
+        # a dedicated connection, since the caller may not consume the whole stream
+        sock = self._connect()
+        try:
+            _send(sock, (op, self.dataset_id, args))
+            while True:
+                chunk = _result(_recv(sock))
+                if chunk is None:
+                    break
+                yield from chunk
+        finally:
+            sock.close()
+
+    def get_many_iter(self, doc_ids):
+        yield from self._call('get_many', list(doc_ids))
+
+    def get_many_fields_iter(self, doc_ids, fields):
+        # only the requested fields are sent by the server
+        yield from self._call('get_many_fields', list(doc_ids), list(fields))
+
+    def count(self):
+        return self._call('count')
+
+    def served(self):
+        # whether the server has this dataset
+        return self._call('served')
+
+    def __iter__(self):
+        return RemoteDocsIter(self)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+
+class RemoteDocsIter:
+    # Streams documents in corpus order from a RemoteDocstore. Like Lz4PickleIter, supports slicing (e.g.,
+    # iter(docstore)[1000:2000]), which is carried out on the server.
+    def __init__(self, docstore, docs_range=None):
+        self.docstore = docstore
+        self.docs_range = docs_range
+        self._it = None
+
+    def __next__(self):
+        if self._it is None:
+            if self.docs_range is None:
+                self._it = self.docstore._stream('iter', None, None)
+            else:
+                self._it = self.docstore._stream('iter', self.docs_range.start, self.docs_range.stop)
+        return next(self._it)
+
+    def __iter__(self):
+        return self
+
+    def __getitem__(self, key):
+        docs_range = self.docs_range if self.docs_range is not None else range(self.docstore.count())
+        if isinstance(key, slice):
+            docs_range = docs_range[key]
+            assert docs_range.step == 1, "slices with steps are not supported"
+            return RemoteDocsIter(self.docstore, docs_range)
+        if isinstance(key, int):
+            idx = docs_range[key]
+            return next(RemoteDocsIter(self.docstore, range(idx, idx + 1)))
+        raise TypeError('key must be int or slice')
+
+
+class _DocstoreRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = _recv(self.request)
+            except OSError:
+                break
+            if request is None:
+                break
+            op, dataset_id, args = request
+            try:
+                if op == 'iter':
+                    for chunk in self.server.iter_docs(dataset_id, *args):
+                        _send(self.request, ('ok', chunk))
+                    _send(self.request, ('ok', None))
+                else:
+                    _send(self.request, ('ok', self.server.call(op, dataset_id, *args)))
+            except OSError:
+                break # client went away
+            except Exception as ex:
+                _logger.debug(f'error handling {op} for {dataset_id}: {ex!r}')
+                try:
+                    _send(self.request, ('error', repr(ex)))
+                except OSError:
+                    break
+
+
+class DocstoreServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves the docstores of datasets ({dataset_id: dataset}) to RemoteDocstore clients over a Unix domain socket
+    at path. Each docstore is opened once and shared by all the connections (which are each handled in a thread).
+    """
+    daemon_threads = True
+
+    def __init__(self, path, datasets):
+        self.datasets = datasets
+        self._docstores = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            os.remove(path) # left over from a server that didn't shut down cleanly
+        super().__init__(str(path), _DocstoreRequestHandler)
+
+    def server_bind(self):
+        # only the current user can connect (requests and responses are pickled)
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+    def docstore(self, dataset_id):
+        if dataset_id not in self.datasets:
+            raise KeyError(f'{dataset_id} is not served')
+        if dataset_id not in self._docstores:
+            with self._lock:
+                if dataset_id not in self._docstores:
+                    self._docstores[dataset_id] = self.datasets[dataset_id].docs_store()
+        return self._docstores[dataset_id]
+
+    def call(self, op, dataset_id, *args):
+        if op == 'served':
+            return dataset_id in self.datasets
+        if op == 'get_many':
+            doc_ids, = args
+            return list(self.docstore(dataset_id).get_many_iter(doc_ids))
+        if op == 'get_many_fields':
+            doc_ids, fields = args
+            return list(self.docstore(dataset_id).get_many_fields_iter(doc_ids, fields))
+        if op == 'count':
+            docstore = self.docstore(dataset_id)
+            if hasattr(docstore, 'count'):
+                return docstore.count()
+            return self.datasets[dataset_id].docs_count()
+        raise ValueError(f'unknown operation {op!r}')
+
+    def iter_docs(self, dataset_id, start, stop):
+        # yields chunks of the documents in [start:stop] of the corpus
+        if dataset_id not in self.datasets:
+            raise KeyError(f'{dataset_id} is not served')
+        it = self.datasets[dataset_id].docs_iter()
+        if start is not None or stop is not None:
+            if ir_datasets.util.is_seekable(it):
+                it = it[start:stop]
+            else:
+                it = itertools.islice(it, start, stop)
+        it = iter(it)
+        while True:
+            chunk = list(itertools.islice(it, STREAM_CHUNK_SIZE))
+            if not chunk:
+                break
+            yield chunk
@@ -109,3 +109,16 @@ def unlzw3():
         import unlzw3
         _cache['unlzw3'] = unlzw3
     return _cache['unlzw3']
+
+def pyarrow():
+    if 'pyarrow' not in _cache:
+        import pyarrow
+        import pyarrow.ipc
+        _cache['pyarrow'] = pyarrow
+    return _cache['pyarrow']
+
+def pyarrow_parquet():
+    if 'pyarrow_parquet' not in _cache:
+        import pyarrow.parquet
+        _cache['pyarrow_parquet'] = pyarrow.parquet
+    return _cache['pyarrow_parquet']
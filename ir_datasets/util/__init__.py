@@ -2,6 +2,7 @@ import re
 import os
 import math
 import functools
+import itertools
 import shutil
 from contextlib import contextmanager
 from threading import Lock
@@ -73,15 +74,19 @@ class Lazy:
 
 
 def apply_sub_slice(orig_slice: slice, new_slice: slice):
+    # new_slice indexes the items of orig_slice (i.e., positions orig_slice.start, orig_slice.start + orig_step, ...)
+    orig_step = orig_slice.step or 1
+    def length():
+        return len(range(orig_slice.start, orig_slice.stop, orig_step))
     start, stop, step = None, None, None
     if new_slice.start is not None:
         if isinstance(new_slice.start, int):
             if new_slice.start < 0:
                 if orig_slice.stop is None:
                     raise ValueError('start cannot be negative with unknown size')
-                start = orig_slice.stop + new_slice.start
+                start = orig_slice.start + max(length() + new_slice.start, 0) * orig_step
             else:
-                start = orig_slice.start + new_slice.start
+                start = orig_slice.start + new_slice.start * orig_step
         elif isinstance(new_slice.start, float):
             if orig_slice.stop is None:
                 raise ValueError('start cannot be float with unknown size')
@@ -100,9 +105,11 @@ def apply_sub_slice(orig_slice: slice, new_slice: slice):
             if new_slice.stop < 0:
                 if orig_slice.stop is None:
                     raise ValueError('stop cannot be negative with unknown size')
-                stop = orig_slice.stop + new_slice.stop
+                stop = orig_slice.start + max(length() + new_slice.stop, 0) * orig_step
             else:
-                stop = min(orig_slice.start + new_slice.stop, orig_slice.stop)
+                stop = orig_slice.start + new_slice.stop * orig_step
+            if orig_slice.stop is not None:
+                stop = min(stop, orig_slice.stop)
         elif isinstance(new_slice.stop, float):
             if orig_slice.stop is None:
                 raise ValueError('stop cannot be float with unknown size')
@@ -127,14 +134,75 @@ def apply_sub_slice(orig_slice: slice, new_slice: slice):
         step = orig_slice.step
     return slice(start, stop, step)
 
+
 def slice_idx(orig_slice: slice, index: int):
-    if index >= 0:
-        index = orig_slice.start + index
-    else:
-        index = orig_slice.stop + index
+    orig_step = orig_slice.step or 1
+    if index < 0:
+        index += len(range(orig_slice.start, orig_slice.stop, orig_step))
+    index = orig_slice.start + index * orig_step if index >= 0 else orig_slice.stop
     return slice(index, min(index + 1, orig_slice.stop))
 
 
+def batch_columns(rows, fields, field_idxs):
+    # transposes rows (tuples of values) into column-oriented {field: [values...]} for the fields at field_idxs
+    columns = list(zip(*rows))
+    return {field: list(columns[idx]) for field, idx in zip(fields, field_idxs)}
+
+
+def iter_batches(it, cls, batch_size=1024, fields=None):
+    """
+    Yields column-oriented batches ({field: [values...]}) of up to batch_size records (of type cls) from it,
+    with only the given fields (default: all). Iterators that can produce batches directly (without building
+    a record object for each) provide an iter_batches(batch_size, fields) method, which is used when available.
+    """
+    if hasattr(it, 'iter_batches'):
+        yield from it.iter_batches(batch_size, fields)
+        return
+    fields = list(fields or cls._fields)
+    field_idxs = [cls._fields.index(f) for f in fields]
+    it = iter(it)
+    while True:
+        rows = list(itertools.islice(it, batch_size))
+        if not rows:
+            return
+        yield batch_columns(rows, fields, field_idxs)
+
+
+def is_seekable(it):
+    # whether it can be sliced (it[start:stop]) to skip ahead. Iterators that can only do so in some cases (e.g., with
+    # a line index) say whether they can with a seekable attribute.
+    return hasattr(it, '__getitem__') and getattr(it, 'seekable', True)
+
+
+TAKE_MAX_SKIP = 100 # when taking ordinals from an iterator, re-slice it rather than skip over more items than this
+
+
+def take_ordinals(it, ordinals):
+    """
+    Yields the items of it at the given ordinals (sorted, without duplicates) in a single forward pass.
+    Iterators that can jump to items directly (e.g., from docstore indices or through checkpoints) provide a
+    take(ordinals) method, which is used when available. Otherwise, it is re-sliced (it[ordinal:]) to jump
+    over large gaps if it's seekable (see is_seekable), or iterated in full if it isn't.
+    """
+    if hasattr(it, 'take'):
+        yield from it.take(ordinals)
+        return
+    sub_it, next_ordinal = None, None
+    seekable = is_seekable(it)
+    if not seekable:
+        sub_it, next_ordinal = iter(it), 0
+    for ordinal in ordinals:
+        if sub_it is None or (ordinal - next_ordinal > TAKE_MAX_SKIP and seekable):
+            sub_it, next_ordinal = iter(it[ordinal:]), ordinal
+        for _ in range(ordinal - next_ordinal):
+            next(sub_it)
+        result = next(sub_it, StopIteration)
+        if result is StopIteration:
+            return
+        next_ordinal = ordinal + 1
+        yield result
+
+
 class DocstoreSplitter:
     def __init__(self, it, docs_store):
         self.it = it
@@ -149,6 +217,9 @@ class DocstoreSplitter:
     def __getitem__(self, key):
         return iter(self.docs_store)[key]
 
+    def take(self, ordinals):
+        return take_ordinals(iter(self.docs_store), ordinals)
+
 
 def use_docstore(fn):
     # For use as an @annotation
@@ -159,7 +230,10 @@ def use_docstore(fn):
         docs_store = self.docs_store()
         if docs_store.built():
             return iter(docs_store) # iterate from the docstore -- really fast
-        return DocstoreSplitter(fn(self), docs_store) # avoid building docstore if not needed
+        it = fn(self)
+        if getattr(it, 'seekable', False):
+            return it # can be sliced without the docstore (e.g., with a line index)
+        return DocstoreSplitter(it, docs_store) # avoid building docstore if not needed
     return wrapper
 
 
@@ -0,0 +1,124 @@
+import random
+import tempfile
+import unittest
+import ir_datasets
+from ir_datasets.datasets.base import Dataset
+from ir_datasets.formats import GenericDoc, TsvDocs
+
+
+class ListDocs:
+    def __init__(self, count):
+        self.count = count
+
+    def docs_handler(self):
+        return self
+
+    def docs_iter(self):
+        return [GenericDoc(str(i), f'text {i}') for i in range(self.count)]
+
+    def docs_count(self):
+        return self.count
+
+    def docs_cls(self):
+        return GenericDoc
+
+    def docs_lang(self):
+        return 'en'
+
+
+class CountedTsvDocs(TsvDocs):
+    # a use_docstore handler that knows its count before the docstore is built
+    def __init__(self, docs_dlc, count):
+        super().__init__(docs_dlc)
+        self.count = count
+
+    def docs_count(self):
+        return self.count
+
+
+class TestBetaApi(unittest.TestCase):
+    def test_docs_iter_parallel(self):
+        dataset = Dataset(ListDocs(1050))
+        expected = list(dataset.docs_iter())
+        self.assertEqual(list(dataset.docs.iter_parallel(workers=3, chunk_size=100)), expected)
+        self.assertEqual(sorted(dataset.docs.iter_parallel(workers=3, ordered=False, chunk_size=100), key=lambda d: int(d.doc_id)), expected)
+        self.assertEqual(list(dataset.docs.iter_parallel(workers=1)), expected)
+        # stopping part-way shuts down the workers
+        it = dataset.docs.iter_parallel(workers=2, chunk_size=10, max_in_flight=2)
+        self.assertEqual([next(it) for _ in range(25)], expected[:25])
+        it.close()
+
+    def test_docs_iter_parallel_docstore(self):
+        docs = [GenericDoc(str(i), f'text {i}') for i in range(1050)]
+        with tempfile.TemporaryDirectory() as d:
+            with open(f'{d}/docs.tsv', 'wt') as f:
+                f.writelines(f'{doc.doc_id}\t{doc.text}\n' for doc in docs)
+            dataset = Dataset(CountedTsvDocs(ir_datasets.util.LocalDownload(f'{d}/docs.tsv'), len(docs)))
+            self.assertIsInstance(dataset.docs_iter(), ir_datasets.util.DocstoreSplitter)
+            self.assertEqual(list(dataset.docs.iter_parallel(workers=3, chunk_size=100)), docs)
+            store = dataset.docs_store()
+            self.assertTrue(store.built())
+            self.assertEqual(store.count(), len(docs)) # built once
+            store.lookup.close()
+
+    def test_docs_repr(self):
+        self.assertEqual(repr(Dataset(ListDocs(5)).docs), "BetaPythonApiDocs(Dataset(provides=['docs']))")
+
+    def test_docs_iter_batches(self):
+        dataset = Dataset(ListDocs(25))
+        batches = list(dataset.docs.iter_batches(10, fields=['text']))
+        self.assertEqual([len(b['text']) for b in batches], [10, 10, 5])
+        self.assertEqual(batches[2], {'text': [f'text {i}' for i in range(20, 25)]})
+
+    def test_docs_iter_shuffled(self):
+        dataset = Dataset(ListDocs(1050))
+        docs = list(dataset.docs_iter())
+        shuffled = list(dataset.docs.iter_shuffled(seed=42, block_size=100, buffer_size=50))
+        self.assertEqual(sorted(shuffled, key=lambda d: int(d.doc_id)), docs)
+        self.assertNotEqual(shuffled, docs)
+        self.assertEqual(list(dataset.docs.iter_shuffled(seed=42, block_size=100, buffer_size=50)), shuffled)
+        self.assertNotEqual(list(dataset.docs.iter_shuffled(seed=43, block_size=100, buffer_size=50)), shuffled)
+        # ranks get disjoint shares of the blocks
+        shards = [list(dataset.docs.iter_shuffled(seed=42, block_size=100, buffer_size=50, rank=r, world_size=3)) for r in range(3)]
+        self.assertEqual(sorted(sum(shards, []), key=lambda d: int(d.doc_id)), docs)
+        self.assertEqual(sorted(len(s) for s in shards), [300, 350, 400])
+        # without slicing, the blocks are split across ranks in corpus order
+        handler = ListDocs(1050)
+        handler.docs_iter = lambda: iter(docs)
+        dataset = Dataset(handler)
+        shards = [list(dataset.docs.iter_shuffled(seed=42, block_size=100, rank=r, world_size=2)) for r in range(2)]
+        self.assertEqual(sorted(sum(shards, []), key=lambda d: int(d.doc_id)), docs)
+
+    def test_docs_iter_shuffled_docstore(self):
+        docs = [GenericDoc(str(i), f'text {i}') for i in range(1050)]
+        with tempfile.TemporaryDirectory() as d:
+            with open(f'{d}/docs.tsv', 'wt') as f:
+                f.writelines(f'{doc.doc_id}\t{doc.text}\n' for doc in docs)
+            dataset = Dataset(TsvDocs(ir_datasets.util.LocalDownload(f'{d}/docs.tsv')))
+            self.assertIsNone(dataset.docs_count()) # unknown until the docstore is built
+            # the blocks are the same whether or not the docstore was already built
+            shard0 = list(dataset.docs.iter_shuffled(seed=42, block_size=100, rank=0, world_size=2))
+            self.assertTrue(dataset.docs_store().built())
+            self.assertEqual(list(dataset.docs.iter_shuffled(seed=42, block_size=100, rank=0, world_size=2)), shard0)
+            shard1 = list(dataset.docs.iter_shuffled(seed=42, block_size=100, rank=1, world_size=2))
+            self.assertEqual(sorted(shard0 + shard1, key=lambda d: int(d.doc_id)), docs)
+            dataset.docs_store().lookup.close()
+
+    def test_docs_sample(self):
+        dataset = Dataset(ListDocs(1000))
+        docs = list(dataset.docs_iter())
+        sample = dataset.docs.sample(50, seed=42)
+        self.assertEqual(sample, [docs[o] for o in sorted(random.Random(42).sample(range(1000), 50))])
+        self.assertEqual(dataset.docs.sample(50, seed=42, in_sample_order=True), [docs[o] for o in random.Random(42).sample(range(1000), 50)])
+        self.assertNotEqual(dataset.docs.sample(50, seed=43), sample)
+        sample = dataset.docs.sample(2000, seed=1, replace=True)
+        self.assertEqual(len(sample), 2000)
+        self.assertLess(len(set(sample)), 2000)
+        with self.assertRaises(ValueError):
+            dataset.docs.sample(1001)
+        # iterators without slicing are read through once
+        self.assertEqual(list(ir_datasets.util.take_ordinals(iter(docs), [3, 500, 998, 999])), [docs[3], docs[500], docs[998], docs[999]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -111,6 +111,38 @@ class TestTsv(unittest.TestCase):
         self.assertEqual(docpairs.docpairs_path(), 'MOCK')
         self.assertEqual(list(docpairs.docpairs_iter()), expected_results)
 
+    def test_iter_batches(self):
+        class data_type(NamedTuple):
+            doc_id: str
+            field1: str
+            field2: str
+        mock_file = StringFile('''
+1\ta\tb
+2\tc\td
+
+3\te\tf
+'''.lstrip())
+        queries = TsvQueries(mock_file, data_type)
+        self.assertEqual(list(queries.queries_iter().iter_batches(2)), [
+            {'doc_id': ['1', '2'], 'field1': ['a', 'c'], 'field2': ['b', 'd']},
+            {'doc_id': ['3'], 'field1': ['e'], 'field2': ['f']},
+        ])
+        self.assertEqual(list(queries.queries_iter().iter_batches(10, fields=['field2', 'doc_id'])), [
+            {'field2': ['b', 'd', 'f'], 'doc_id': ['1', '2', '3']},
+        ])
+
+    def test_step_slices(self):
+        mock_file = StringFile(''.join(f'{i}\ttext {i}\n' for i in range(20)))
+        queries = TsvQueries(mock_file)
+        ids = lambda it: [q.query_id for q in it]
+        self.assertEqual(ids(queries.queries_iter()[::2][:5]), ['0', '2', '4', '6', '8'])
+        self.assertEqual(ids(queries.queries_iter()[::2][1:]), [str(i) for i in range(2, 20, 2)])
+        self.assertEqual(ids(queries.queries_iter()[3::3][1:4:2]), ['6', '12'])
+        self.assertEqual(ids(queries.queries_iter()[2:15][::4][1:]), ['6', '10', '14'])
+        it = queries.queries_iter()[18:]
+        self.assertEqual(ids(it), ['18', '19'])
+        self.assertEqual(ids(it), []) # can be called again once exhausted
+
     def tearDown(self):
         if os.path.exists('MOCK.pklz4'):
             shutil.rmtree('MOCK.pklz4')
@@ -0,0 +1,110 @@
+import os
+import pickle
+import tempfile
+import unittest
+from typing import NamedTuple, Tuple
+from unittest import mock
+from ir_datasets.datasets.base import Dataset
+from ir_datasets.indices import ArrowDocstore, PickleLz4FullStore, LruDocstore
+from ir_datasets.indices.arrow_docstore import parse_format_spec
+from ir_datasets.formats import GenericDoc
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class TaggedDoc(NamedTuple):
+    doc_id: str
+    text: str
+    url: str
+    tags: Tuple[str, ...]
+
+
+class FakeDocs:
+    def __init__(self, path, docs):
+        self.docs = docs
+        self.store = PickleLz4FullStore(path, lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'], count_hint=len(docs))
+
+    def dataset_id(self):
+        return 'fake/docs'
+
+    def docs_handler(self):
+        return self
+
+    def docs_cls(self):
+        return GenericDoc
+
+    def docs_store(self):
+        return self.store
+
+
+class TestArrowDocstore(unittest.TestCase):
+    def test_parse_format_spec(self):
+        self.assertEqual(parse_format_spec('parquet', 'msmarco-passage'), 'parquet')
+        self.assertEqual(parse_format_spec('msmarco-*=arrow,c4/*=parquet', 'msmarco-passage'), 'arrow')
+        self.assertEqual(parse_format_spec('msmarco-*=arrow,c4/*=parquet', 'c4/en-noclean-tr'), 'parquet')
+        self.assertEqual(parse_format_spec('msmarco-*=arrow,*=lz4', 'c4/en-noclean-tr'), None)
+        self.assertEqual(parse_format_spec('msmarco-*=arrow', 'c4/en-noclean-tr'), None)
+        with self.assertRaises(ValueError):
+            parse_format_spec('orc', 'msmarco-passage')
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow not installed')
+    def test_arrow_docstore(self):
+        docs = [TaggedDoc(f'id{i}', f'some text {i}', f'http://{i % 7}', tuple(f't{j}' for j in range(i % 3))) for i in range(1000)]
+        for fmt in ['arrow', 'parquet']:
+            with self.subTest(fmt), tempfile.TemporaryDirectory() as d:
+                store = ArrowDocstore(f'{d}/docs', lambda: iter(docs), TaggedDoc, 'doc_id', ['doc_id'], format=fmt, row_group_size=128)
+                self.assertFalse(store.built())
+                self.assertEqual(store.count(), 1000)
+                self.assertTrue(os.path.exists(store.data_path))
+                self.assertEqual(store.get('id500'), docs[500])
+                self.assertEqual(store.get_many(['id3', 'id999', 'missing']), {'id3': docs[3], 'id999': docs[999]})
+                self.assertEqual(store.get_many(['id3', 'id130'], field='url'), {'id3': 'http://3', 'id130': 'http://4'})
+                self.assertEqual(list(store), docs)
+                self.assertEqual(list(iter(store)[120:300]), docs[120:300])
+                self.assertEqual(list(iter(store)[5:900:50]), docs[5:900:50])
+                self.assertEqual(iter(store)[-1], docs[-1])
+                self.assertEqual(list(iter(store)[100:].take([0, 1, 300, 899, 900])), [docs[100], docs[101], docs[400], docs[999]])
+                batches = list(iter(store)[100:400].iter_batches(batch_size=64, fields=['doc_id', 'tags']))
+                self.assertEqual([len(b['doc_id']) for b in batches], [64, 64, 64, 64, 44])
+                self.assertEqual(sum((b['tags'] for b in batches), []), [d.tags for d in docs[100:400]])
+                self.assertEqual(list(store.lookup_by('url', 'http://3')), [d for d in docs if d.url == 'http://3'])
+                self.assertEqual([d.doc_id for d in store.scan(prefix='id99')], [f'id{i}' for i in range(99, 1000) if str(i).startswith('99')])
+                # the data file can be read by pyarrow directly
+                if fmt == 'arrow':
+                    table = pyarrow.ipc.open_file(store.data_path).read_all()
+                else:
+                    table = pyarrow.parquet.read_table(store.data_path)
+                self.assertEqual(table.column('text').to_pylist(), [d.text for d in docs])
+                self.assertEqual(pickle.loads(pickle.dumps(store.handle())).get('id42'), docs[42])
+                store.close()
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow not installed')
+    def test_docstore_format_env(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i}') for i in range(100)]
+        with tempfile.TemporaryDirectory() as d:
+            dataset = Dataset(FakeDocs(f'{d}/docs.pklz4', docs))
+            with mock.patch.dict(os.environ, {'IR_DATASETS_DOCSTORE_FORMAT': 'fake/*=parquet'}):
+                store = dataset.docs_store()
+                self.assertIsInstance(store, ArrowDocstore)
+                self.assertEqual(store.path, f'{d}/docs.parquet')
+                self.assertEqual(store.get('id42'), docs[42])
+                store.close()
+            self.assertIsInstance(Dataset(dataset).docs_store(), PickleLz4FullStore)
+            self.assertFalse(dataset.docs_store().built())
+            # with a cache too, the format applies to the store under the cache
+            with mock.patch.dict(os.environ, {'IR_DATASETS_DOCSTORE_FORMAT': 'fake/*=arrow', 'IR_DATASETS_DOCSTORE_CACHE': '10'}):
+                store = Dataset(Dataset(dataset)).docs_store()
+                self.assertIsInstance(store, LruDocstore)
+                self.assertIsInstance(store.docstore, ArrowDocstore)
+                self.assertEqual(store.docstore.path, f'{d}/docs.arrow')
+                self.assertEqual(store.get('id42'), docs[42])
+                store.docstore.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from ir_datasets.indices import BloomFilter, CacheDocstore, PickleLz4FullStore, WarcIndexFile
+from ir_datasets.formats import GenericDoc
+from ir_datasets.datasets.clueweb12 import ClueWeb12Docs
+from ir_datasets.util import LocalDownload
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_bloom_filter(self):
+        with tempfile.TemporaryDirectory() as d:
+            bloom = BloomFilter(f'{d}/bloom', false_positive_rate=0.01)
+            self.assertFalse(bloom.built())
+            self.assertEqual(bloom.filter(['a', 'b']), ['a', 'b']) # not built yet; can't rule anything out
+            keys = [f'doc{i}' for i in range(10000)]
+            bloom.build(iter(keys), count=len(keys), chunk_size=3000)
+            self.assertTrue(bloom.built())
+            self.assertEqual(bloom.filter(keys), keys) # no false negatives
+            self.assertIn('doc123', bloom)
+            others = [f'other{i}' for i in range(10000)]
+            self.assertLess(len(bloom.filter(others)), 300)
+            bloom.close()
+            bloom = BloomFilter(f'{d}/bloom')
+            self.assertEqual(bloom.filter(keys[:100] + ['']), keys[:100])
+            bloom.clear()
+            self.assertFalse(bloom.built())
+            bloom.build([]) # empty sets are fine too
+            self.assertEqual(bloom.filter(['doc1']), [])
+            bloom.close()
+
+    def test_cache_docstore_valid_ids(self):
+        docs = [GenericDoc(f'doc{i}', f'text {i}') for i in range(100)]
+        requested = []
+        class RecordingStore(PickleLz4FullStore):
+            def get_many_iter(self, keys):
+                requested.extend(keys)
+                return super().get_many_iter(keys)
+        with tempfile.TemporaryDirectory() as d:
+            full = RecordingStore(f'{d}/full', lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'])
+            listed = []
+            def valid_ids():
+                listed.append(True)
+                return (doc.doc_id for doc in docs)
+            cache = CacheDocstore(full, f'{d}/cache', valid_ids_fn=valid_ids, valid_ids_count=len(docs))
+            # the filter isn't built on lookups, so they go to the full store until build_filter() is run
+            self.assertEqual(cache.get_many(['doc1', 'missing']), {'doc1': docs[1]})
+            self.assertEqual((sorted(requested), listed), (['doc1', 'missing'], []))
+            requested.clear()
+            self.assertTrue(cache.build_filter())
+            self.assertEqual(cache.get_many(['doc1', 'doc5', 'missing', 'doc999']), {'doc1': docs[1], 'doc5': docs[5]})
+            self.assertEqual(cache.get_many(['doc1', 'doc7'], field='text'), {'doc1': 'text 1', 'doc7': 'text 7'})
+            self.assertEqual(sorted(requested), ['doc5', 'doc7'])
+            # IR_DATASETS_DOCSTORE_ID_FILTER=false opts out of the filter
+            requested.clear()
+            with mock.patch.dict(os.environ, {'IR_DATASETS_DOCSTORE_ID_FILTER': 'false'}):
+                cache = CacheDocstore(full, f'{d}/cache', valid_ids_fn=valid_ids, valid_ids_count=len(docs))
+                self.assertFalse(cache.build_filter())
+                self.assertEqual(cache.get_many(['doc1', 'missing']), {'doc1': docs[1]})
+                self.assertEqual(requested, ['missing'])
+            self.assertFalse(CacheDocstore(full, f'{d}/cache2', valid_ids_fn=lambda: None).build_filter()) # ids can't be listed
+            self.assertEqual(len(listed), 1)
+            cache.clear_cache()
+            full.lookup.close()
+
+    def test_clueweb_ids_checked_against_checkpoints(self):
+        with tempfile.TemporaryDirectory() as d:
+            os.makedirs(f'{d}/docs/recordcounts')
+            with open(f'{d}/docs/recordcounts/ClueWeb12_00_counts.txt', 'wt') as f:
+                f.write('./0000tw/0000tw-00.warc.gz 10\n./0000tw/0000tw-01.warc.gz 10\n')
+            os.makedirs(f'{d}/chk/ClueWeb12_00/0000tw')
+            # 0000tw-00 is numbered sequentially; 0000tw-01 skips 00003
+            irregular = [f'clueweb12-0000tw-01-{i:05d}' for i in range(11) if i != 3]
+            for part, doc_ids in [('00', [f'clueweb12-0000tw-00-{i:05d}' for i in range(10)]), ('01', irregular)]:
+                with open(f'{d}/chk/ClueWeb12_00/0000tw/0000tw-{part}.warc.gz.chk.lz4', 'wb') as f, WarcIndexFile(f, 'wb') as f_chk:
+                    for doc_idx in [4, 8]:
+                        f_chk.write(doc_ids[doc_idx], doc_idx, (bytes(32 * 1024), 0, 0), 0, 0)
+            read_files = []
+            def read_ids(source_file):
+                read_files.append(os.path.basename(source_file))
+                return [GenericDoc(doc_id, '') for doc_id in irregular]
+            docs = ClueWeb12Docs(LocalDownload(f'{d}/docs'), LocalDownload(f'{d}/chk'))
+            with mock.patch.object(docs, '_docs_ctxt_iter_warc', read_ids):
+                doc_ids = list(docs._docs_ids_iter())
+            self.assertEqual(read_files, ['0000tw-01.warc.gz']) # only the irregular file is read
+            self.assertEqual(doc_ids, [f'clueweb12-0000tw-00-{i:05d}' for i in range(10)] + irregular)
+            self.assertIsNone(ClueWeb12Docs(LocalDownload(f'{d}/docs'))._docs_ids_iter()) # no checkpoints to check against
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import gzip
+import json
+import tempfile
+import unittest
+from unittest import mock
+from ir_datasets.formats import GenericDoc, TsvDocs, JsonlDocs, JsonlQueries
+from ir_datasets.indices import LineOffsetIndex, PickleLz4FullStore
+from ir_datasets.util import LocalDownload, GzipExtract, is_seekable, take_ordinals
+
+
+class TestLineOffsetIndex(unittest.TestCase):
+    def test_line_offset_index(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(f'{d}/file.txt', 'wb') as f:
+                f.write(b'a\n\nbb\nccc\n\n')
+            idx = LineOffsetIndex(f'{d}/file.txt')
+            self.assertFalse(idx.built())
+            idx.build()
+            self.assertTrue(idx.built())
+            self.assertEqual(len(idx), 5)
+            self.assertEqual([idx[i] for i in range(5)], [0, 2, 3, 6, 10])
+            idx = LineOffsetIndex(f'{d}/file.txt', skip_blank=True)
+            idx.build()
+            self.assertEqual([idx[i] for i in range(len(idx))], [0, 3, 6])
+            with open(f'{d}/file.txt', 'ab') as f:
+                f.write(b'dddd\n')
+            self.assertFalse(idx.built()) # rebuilt when the file changes
+            with open(f'{d}/file.txt', 'wb') as f:
+                f.write(b'a\r\nb\n')
+            idx.build()
+            self.assertFalse(idx.usable())
+
+    def test_tsv_docs_line_index(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i}') for i in range(500)]
+        with tempfile.TemporaryDirectory() as d:
+            with open(f'{d}/docs.tsv', 'wt') as f:
+                f.write('doc_id\ttext\n')
+                for i, doc in enumerate(docs):
+                    f.write(f'{doc.doc_id}\t{doc.text}\n')
+                    if i % 100 == 0:
+                        f.write('\n')
+            with gzip.open(f'{d}/docs.tsv.gz', 'wt') as f:
+                f.write('doc_id\ttext\n' + ''.join(f'{doc.doc_id}\t{doc.text}\n' for doc in docs))
+            with mock.patch.dict(os.environ, {'IR_DATASETS_LINE_INDEX': 'true'}):
+                tsv = TsvDocs(LocalDownload(f'{d}/docs.tsv'), skip_first_line=True)
+                self.assertEqual(tsv.docs_count(), 500)
+                self.assertEqual(list(tsv.docs_iter()), docs)
+                self.assertEqual(list(tsv.docs_iter()[250:260]), docs[250:260])
+                self.assertEqual(list(tsv.docs_iter()[10:400:97]), docs[10:400:97])
+                self.assertEqual(tsv.docs_iter()[499], docs[499])
+                self.assertFalse(tsv.docs_store().built()) # slicing doesn't need the docstore
+                # compressed files aren't indexed
+                tsv = TsvDocs(GzipExtract(LocalDownload(f'{d}/docs.tsv.gz')), skip_first_line=True)
+                self.assertIsNone(tsv.docs_count())
+                self.assertEqual(list(tsv.docs_iter()), docs)
+            self.assertFalse(os.path.exists(f'{d}/docs.tsv.gz.nonblank.lines'))
+
+    def test_jsonl_docs_line_index(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i}') for i in range(300)]
+        with tempfile.TemporaryDirectory() as d:
+            for name, part in [('a', docs[:120]), ('b', docs[120:])]:
+                with open(f'{d}/{name}.jsonl', 'wt') as f:
+                    for doc in part:
+                        f.write(json.dumps(doc._asdict()) + '\n')
+            with mock.patch.dict(os.environ, {'IR_DATASETS_LINE_INDEX': 'true'}):
+                jsonl = JsonlDocs([LocalDownload(f'{d}/a.jsonl'), LocalDownload(f'{d}/b.jsonl')])
+                self.assertEqual(jsonl.docs_count(), 300)
+                self.assertEqual(list(jsonl.docs_iter()), docs)
+                self.assertEqual(list(jsonl.docs_iter()[100:140]), docs[100:140])
+                self.assertEqual(list(jsonl.docs_iter()[5:290:37]), docs[5:290:37])
+                self.assertEqual(jsonl.docs_iter()[-1], docs[-1])
+                self.assertEqual(sum((b['doc_id'] for b in jsonl.docs_iter()[110:130].iter_batches(8)), []), [d.doc_id for d in docs[110:130]])
+                self.assertFalse(jsonl.docs_store().built())
+
+    def test_jsonl_without_line_index(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i}') for i in range(300)]
+        with tempfile.TemporaryDirectory() as d:
+            with open(f'{d}/docs.jsonl', 'wt') as f:
+                for doc in docs:
+                    f.write(json.dumps(doc._asdict()) + '\n')
+            # without a line index, slicing isn't supported, so skipping ahead falls back on reading through
+            it = JsonlQueries(LocalDownload(f'{d}/docs.jsonl'), GenericDoc).queries_iter()
+            self.assertFalse(is_seekable(it))
+            self.assertEqual(list(take_ordinals(it, [5, 250, 299])), [docs[5], docs[250], docs[299]])
+            store = PickleLz4FullStore(f'{d}/docs.pklz4', None, GenericDoc, 'doc_id', ['doc_id'], checkpoint_every=100)
+            def interrupted_iter():
+                yield from docs[:150]
+                raise RuntimeError("interrupted")
+            store.init_iter_fn = interrupted_iter
+            with self.assertRaises(RuntimeError):
+                store.build()
+            store.init_iter_fn = JsonlQueries(LocalDownload(f'{d}/docs.jsonl'), GenericDoc).queries_iter
+            store.build() # resumes by reading through the first records
+            self.assertEqual(list(iter(store)), docs)
+            store.lookup.close()
+            with mock.patch.dict(os.environ, {'IR_DATASETS_LINE_INDEX': 'true'}):
+                it = JsonlQueries(LocalDownload(f'{d}/docs.jsonl'), GenericDoc).queries_iter()
+                self.assertTrue(is_seekable(it))
+                self.assertEqual(list(take_ordinals(it, [5, 250, 299])), [docs[5], docs[250], docs[299]])
+
+
+if __name__ == '__main__':
+    unittest.main()
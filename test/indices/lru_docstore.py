@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from ir_datasets.datasets.base import Dataset
+from ir_datasets.indices import LruDocstore, PickleLz4FullStore
+from ir_datasets.indices.lru_docstore import parse_cache_size
+from ir_datasets.formats import GenericDoc
+
+
+class TestLruDocstore(unittest.TestCase):
+    def test_lru_docstore(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i}') for i in range(100)]
+        with tempfile.TemporaryDirectory() as d:
+            inner = PickleLz4FullStore(d, lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'])
+            store = LruDocstore(inner, max_docs=10)
+            self.assertEqual(store.get('id5'), docs[5])
+            self.assertEqual(store.stats()['misses'], 1)
+            self.assertEqual(store.get('id5'), docs[5])
+            self.assertEqual(store.stats()['hits'], 1)
+            self.assertEqual(store.get_many(['id1', 'id2', 'missing']), {'id1': docs[1], 'id2': docs[2]})
+            self.assertEqual(store.get_many(['id1', 'id2'], field='text'), {'id1': 'some text 1', 'id2': 'some text 2'})
+            self.assertEqual(store.stats()['hits'], 3)
+            self.assertEqual(store.count(), 100) # passed through to the wrapped docstore
+            store.get_many([f'id{i}' for i in range(50, 70)])
+            self.assertEqual(store.stats()['docs'], 10)
+            store.get_many([f'id{i}' for i in range(10)])
+            with ThreadPoolExecutor(4) as pool:
+                results = list(pool.map(lambda i: store.get(f'id{i % 10}'), range(200)))
+            self.assertEqual(results, [docs[i % 10] for i in range(200)])
+            self.assertEqual(store.stats()['hits'], 203)
+            self.assertEqual(store.stats()['misses'], 34)
+
+            store = LruDocstore(inner, max_bytes=500)
+            store.get_many([f'id{i}' for i in range(20)])
+            self.assertTrue(0 < store.stats()['bytes'] <= 500)
+            inner.lookup.close()
+
+    def test_docstore_cache_env(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i}') for i in range(100)]
+        class FakeDocs:
+            def __init__(self, path):
+                self.store = PickleLz4FullStore(path, lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'])
+            def docs_handler(self):
+                return self
+            def docs_store(self):
+                return self.store
+        with tempfile.TemporaryDirectory() as d, mock.patch.dict(os.environ, {'IR_DATASETS_DOCSTORE_CACHE': '10'}):
+            handler = FakeDocs(d)
+            dataset = Dataset(Dataset(Dataset(handler)), None)
+            store = dataset.docs_store()
+            self.assertIs(dataset.docs_store(), store) # shared across calls
+            # only the outermost dataset adds a cache
+            self.assertIsInstance(store, LruDocstore)
+            self.assertIs(store.docstore, handler.store)
+            self.assertEqual(store.get('id5'), docs[5])
+            self.assertEqual(store.get('id5'), docs[5])
+            self.assertEqual((store.stats()['hits'], store.stats()['misses']), (1, 1))
+            handler.store.lookup.close()
+
+    def test_parse_cache_size(self):
+        self.assertEqual(parse_cache_size('10000'), (10000, None))
+        self.assertEqual(parse_cache_size('512MB'), (None, 512000000))
+        self.assertEqual(parse_cache_size(' 2 gb'), (None, 2000000000))
+        with self.assertRaises(ValueError):
+            parse_cache_size('lots')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from typing import NamedTuple
+from ir_datasets.indices import Lz4ColumnLookup, PickleLz4FullStore
+
+
+class WebDoc(NamedTuple):
+    doc_id: str
+    url: str
+    title: str
+    body: bytes
+
+
+class TestLz4ColumnLookup(unittest.TestCase):
+    def test_lz4_column_lookup(self):
+        with tempfile.TemporaryDirectory() as d:
+            idx = Lz4ColumnLookup(d, WebDoc, 'doc_id', ['doc_id'], column_groups=[('doc_id', 'url', 'title'), ('body',)])
+            self.assertEqual(tuple(idx['id3', 'id2']), tuple())
+            with idx.transaction() as trans:
+                for i in range(10):
+                    trans.add(WebDoc(f'id{i}', f'http://{i}/', f'title {i}', b'<html>' * i))
+            self.assertEqual(len(idx), 10)
+            self.assertEqual(list(idx['id4']), [WebDoc('id4', 'http://4/', 'title 4', b'<html>' * 4)])
+            self.assertEqual([d.doc_id for d in idx['id9', 'missing', 'id1']], ['id1', 'id9'])
+            self.assertEqual(list(idx.get_fields(['id9', 'missing', 'id1'], ['title', 'url'])), [('id1', ('title 1', 'http://1/')), ('id9', ('title 9', 'http://9/'))])
+            self.assertEqual(list(idx.get_fields(['id2'], ['body'])), [('id2', (b'<html>' * 2,))])
+            self.assertEqual([d.doc_id for d in iter(idx)], [f'id{i}' for i in range(10)])
+            self.assertEqual([d.doc_id for d in iter(idx)[3:8:2]], ['id3', 'id5', 'id7'])
+
+            with idx.transaction() as trans:
+                trans.add(WebDoc('id1', 'http://new/', 'new title', b''))
+                trans.rollback()
+            self.assertEqual(list(idx.get_fields(['id1'], ['url'])), [('id1', ('http://1/',))])
+            with idx.transaction() as trans:
+                trans.add(WebDoc('id1', 'http://new/', 'new title', b''))
+            self.assertEqual(list(idx.get_fields(['id1'], ['url'])), [('id1', ('http://new/',))])
+            idx.close()
+
+            # layout is detected from an existing store
+            idx = Lz4ColumnLookup(d, WebDoc, 'doc_id', ['doc_id'])
+            self.assertEqual(idx._groups, [('doc_id', 'url', 'title'), ('body',)])
+            idx.close()
+
+    def test_pickle_lz4_full_store_fields(self):
+        docs = [WebDoc(f'id{i}', f'http://{i}/', f'title {i}', b'<html>' * i) for i in range(10)]
+        for column_groups in [None, [('doc_id',), ('url', 'title'), ('body',)]]:
+            with tempfile.TemporaryDirectory() as d:
+                store = PickleLz4FullStore(d, lambda: iter(docs), WebDoc, 'doc_id', ['doc_id'], column_groups=column_groups)
+                self.assertEqual(list(iter(store)), docs)
+                self.assertEqual(store.get_many(['id3', 'id5'], field='url'), {'id3': 'http://3/', 'id5': 'http://5/'})
+                self.assertEqual(store.get_many(['id3', 'id5'], fields=['title', 'url']), {'id3': ('title 3', 'http://3/'), 'id5': ('title 5', 'http://5/')})
+                self.assertEqual(store.get('id7'), docs[7])
+                self.assertEqual(store.get('id7', 'title'), 'title 7')
+                store.lookup.close()
+
+    def test_pickle_lz4_full_store_lookup_by(self):
+        docs = [WebDoc(f'id{i}', f'http://{i % 3}/', f'title {i % 4}', b'<html>' * i) for i in range(20)]
+        for column_groups, block_size in [(None, None), (None, 4), ([('doc_id',), ('url', 'title'), ('body',)], None)]:
+            with tempfile.TemporaryDirectory() as d:
+                store = PickleLz4FullStore(d, lambda: iter(docs), WebDoc, 'doc_id', ['doc_id', 'url'], column_groups=column_groups, block_size=block_size)
+                self.assertEqual(list(store.lookup_by('url', ['http://1/', 'missing'])), [docs[i] for i in range(1, 20, 3)])
+                self.assertEqual(list(store.lookup_by('url', 'http://2/')), [docs[i] for i in range(2, 20, 3)])
+                self.assertEqual(list(store.lookup_by('doc_id', ['id4'])), [docs[4]])
+                self.assertEqual(list(store.scan(prefix='id1')), [docs[1]] + docs[10:20])
+                self.assertEqual(list(store.scan(start='id18', stop='id3')), [docs[2]] + docs[18:20]) # in storage order
+                # title isn't indexed yet; the index is built on first use
+                self.assertEqual(list(store.lookup_by('title', ['title 3', 'title 0'])), [docs[i] for i in range(20) if i % 4 in (0, 3)])
+                # both indices are kept up to date, including in a new instance
+                store.lookup.close()
+                store = PickleLz4FullStore(d, lambda: iter(docs), WebDoc, 'doc_id', ['doc_id', 'url'], column_groups=column_groups, block_size=block_size)
+                with store.lookup.transaction() as trans:
+                    trans.add(WebDoc('new', 'http://1/', 'title 3', b''))
+                self.assertEqual(list(store.lookup_by('url', ['http://1/']))[-1], WebDoc('new', 'http://1/', 'title 3', b''))
+                self.assertEqual(list(store.lookup_by('title', ['title 3']))[-1], WebDoc('new', 'http://1/', 'title 3', b''))
+                store.clear_cache()
+                self.assertEqual([f for f in os.listdir(d) if f.startswith('idx.')], [])
+                store.lookup.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,25 @@
+import os
+import pickle
 import tempfile
 import unittest
+import multiprocessing
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from ir_datasets.indices import Lz4PickleLookup
-from ir_datasets.formats import GenericDoc
+from ir_datasets.indices import Lz4PickleLookup, PickleLz4FullStore
+from ir_datasets.indices.lz4_pickle import _dense_scan_ranges
+from ir_datasets.formats import GenericDoc, TsvDocs
+from ir_datasets.util import LocalDownload
+
+
+class Interrupted(Exception):
+    pass
 
 
 class TestLz4PickleLookup(unittest.TestCase):
     def test_lz4_pickle_lookup(self):
         with tempfile.TemporaryDirectory() as d:
-            idx = Lz4PickleLookup(d, GenericDoc)
+            idx = Lz4PickleLookup(d, GenericDoc, 'doc_id', ['doc_id'])
             self.assertEqual(tuple(idx['id3', 'id2', 'id1', 'id4']), tuple())
             self.assertEqual(tuple(iter(idx)), tuple())
             with idx.transaction() as trans:
@@ -45,6 +56,261 @@ class TestLz4PickleLookup(unittest.TestCase):
 
             idx.close()
 
+    def test_lz4_pickle_lookup_blocks(self):
+        with tempfile.TemporaryDirectory() as d:
+            idx = Lz4PickleLookup(d, GenericDoc, 'doc_id', ['doc_id'], block_size=3)
+            self.assertTrue(idx.block_mode())
+            with idx.transaction() as trans:
+                for i in range(10):
+                    trans.add(GenericDoc(f'id{i}', f'some text {i}'))
+            self.assertEqual(len(idx), 10)
+            self.assertEqual(list(idx['id0']), [GenericDoc('id0', 'some text 0')])
+            self.assertEqual(list(idx['id4']), [GenericDoc('id4', 'some text 4')])
+            results = tuple(idx['id9', 'id1', 'missing', 'id5'])
+            self.assertEqual(results, (GenericDoc('id1', 'some text 1'), GenericDoc('id5', 'some text 5'), GenericDoc('id9', 'some text 9')))
+            self.assertEqual(list(iter(idx)), [GenericDoc(f'id{i}', f'some text {i}') for i in range(10)])
+            self.assertEqual(list(iter(idx)[2:9:3]), [GenericDoc(f'id{i}', f'some text {i}') for i in [2, 5, 8]])
+            self.assertEqual(iter(idx)[7], GenericDoc('id7', 'some text 7'))
+
+            with idx.transaction() as trans:
+                trans.add(GenericDoc('id3', 'new text'))
+                trans.add(GenericDoc('id10', 'new doc'))
+            self.assertEqual(list(idx['id3']), [GenericDoc('id3', 'new text')])
+            self.assertEqual(list(idx['id10']), [GenericDoc('id10', 'new doc')])
+            self.assertEqual(list(idx['id2']), [GenericDoc('id2', 'some text 2')])
+            idx.close()
+
+            # the layout of an existing store is detected, regardless of the requested block_size
+            idx = Lz4PickleLookup(d, GenericDoc, 'doc_id', ['doc_id'])
+            self.assertTrue(idx.block_mode())
+            self.assertEqual(list(idx['id8']), [GenericDoc('id8', 'some text 8')])
+            idx.close()
+
+    def test_pickle_lz4_full_store_parallel_build(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i} ' * (i % 7)) for i in range(10000)]
+        for block_size in [None, 16]:
+            with tempfile.TemporaryDirectory() as d:
+                store = PickleLz4FullStore(d, lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'], block_size=block_size, build_workers=2)
+                store.build()
+                self.assertEqual(store.count(), len(docs))
+                self.assertEqual(list(iter(store)), docs)
+                self.assertEqual(store.get('id1234'), docs[1234])
+                self.assertEqual(store.get_many(['id7', 'id9999', 'missing']), {'id7': docs[7], 'id9999': docs[9999]})
+                store.lookup.close()
+
+    def test_lz4_pickle_lookup_mmap(self):
+        for block_size, hash_index in [(None, False), (3, True)]:
+            with tempfile.TemporaryDirectory() as d:
+                idx = Lz4PickleLookup(d, GenericDoc, 'doc_id', ['doc_id'], block_size=block_size, use_mmap=True, hash_index=hash_index)
+                self.assertEqual(tuple(idx['id1', 'id2']), tuple())
+                with idx.transaction() as trans:
+                    for i in range(10):
+                        trans.add(GenericDoc(f'id{i}', f'some text {i}'))
+                self.assertEqual(list(idx['id4']), [GenericDoc('id4', 'some text 4')])
+                results = tuple(idx['id9', 'id1', 'missing', 'id5'])
+                self.assertEqual(results, (GenericDoc('id1', 'some text 1'), GenericDoc('id5', 'some text 5'), GenericDoc('id9', 'some text 9')))
+                with idx.transaction() as trans:
+                    trans.add(GenericDoc('id10', 'new doc'))
+                self.assertEqual(list(idx['id10', 'id0']), [GenericDoc('id0', 'some text 0'), GenericDoc('id10', 'new doc')])
+                idx.close()
+
+    def test_lz4_pickle_lookup_dense_keys(self):
+        with tempfile.TemporaryDirectory() as d:
+            idx = Lz4PickleLookup(d, GenericDoc, 'doc_id', ['doc_id'], dense_keys=None)
+            with idx.transaction() as trans:
+                for i in range(1, 11):
+                    trans.add(GenericDoc(str(i), f'some text {i}'))
+            self.assertEqual(idx.dense_base(), 1)
+            self.assertEqual(len(idx.idx()), 0) # no sorted key index
+            self.assertEqual(list(idx['3']), [GenericDoc('3', 'some text 3')])
+            results = tuple(idx['10', '1', '0', '11', '03', '-1', 'x', '5'])
+            self.assertEqual(results, (GenericDoc('1', 'some text 1'), GenericDoc('5', 'some text 5'), GenericDoc('10', 'some text 10')))
+            with idx.transaction() as trans:
+                trans.add(GenericDoc('11', 'some text 11'))
+            self.assertEqual(list(idx['11']), [GenericDoc('11', 'some text 11')])
+            with self.assertRaises(ValueError):
+                with idx.transaction() as trans:
+                    trans.add(GenericDoc('13', 'out of sequence'))
+            self.assertEqual(len(idx), 11)
+            idx.close()
+
+        with tempfile.TemporaryDirectory() as d:
+            idx = Lz4PickleLookup(d, GenericDoc, 'doc_id', ['doc_id'], dense_keys=None)
+            with idx.transaction() as trans:
+                for i in [0, 1, 2, 4, 3]:
+                    trans.add(GenericDoc(str(i), f'some text {i}'))
+            self.assertEqual(idx.dense_base(), None)
+            self.assertEqual(list(idx['4', '2']), [GenericDoc('2', 'some text 2'), GenericDoc('4', 'some text 4')])
+            idx.close()
+
+    def test_lz4_pickle_lookup_threads(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i} ' * (i % 7)) for i in range(2000)]
+        for block_size, use_mmap in [(None, False), (16, False), (16, True)]:
+            with tempfile.TemporaryDirectory() as d:
+                idx = Lz4PickleLookup(d, GenericDoc, 'doc_id', ['doc_id'], block_size=block_size, use_mmap=use_mmap)
+                with idx.transaction() as trans:
+                    for doc in docs:
+                        trans.add(doc)
+                def lookup(i):
+                    doc_ids = [f'id{(i * 37 + j) % len(docs)}' for j in range(50)]
+                    return {doc.doc_id: doc for doc in idx[doc_ids]}, doc_ids
+                # a fresh lookup, so the handles are also lazily opened concurrently
+                with ThreadPoolExecutor(max_workers=8) as pool:
+                    for result, doc_ids in pool.map(lookup, range(200)):
+                        self.assertEqual(result, {doc_id: docs[int(doc_id[2:])] for doc_id in doc_ids})
+                idx.close()
+
+    def test_lz4_pickle_lookup_coalesced_reads(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i} ' * (i % 500)) for i in range(1000)]
+        doc_ids = [f'id{i}' for i in [999, 3, 4, 5, 500, 7, 998, 250]] + ['missing', 'id3']
+        for block_size in [None, 4]:
+            results = []
+            for read_gap in [0, 256, 1024*1024]:
+                with tempfile.TemporaryDirectory() as d:
+                    store = PickleLz4FullStore(d, lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'], block_size=block_size, read_gap=read_gap)
+                    store.build()
+                    reads = []
+                    read_range = store.lookup._read_range
+                    store.lookup._read_range = lambda pos, length: reads.append(length) or read_range(pos, length)
+                    results.append(list(store.get_many_iter(doc_ids)))
+                    if read_gap == 1024*1024:
+                        self.assertLessEqual(len(reads), 3) # one range, plus extension(s) for the long last frame
+                    self.assertEqual(list(store.get_many_iter(doc_ids, ordered=True)), [docs[int(i[2:])] for i in dict.fromkeys(doc_ids) if i != 'missing'])
+                    store.lookup.close()
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(results[0], results[2])
+            self.assertEqual(sorted(set(results[0]), key=lambda d: int(d.doc_id[2:])), [docs[i] for i in [3, 4, 5, 7, 250, 500, 998, 999]])
+
+    def test_pickle_lz4_full_store_resume(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i} ' * (i % 7)) for i in range(10000)]
+        def interrupted_iter():
+            for i, doc in enumerate(docs):
+                if i == 9550: # after the dictionary is trained in block mode
+                    raise Interrupted()
+                yield doc
+        for block_size, build_workers in [(None, 1), (16, 1), (16, 2)]:
+            with tempfile.TemporaryDirectory() as d:
+                store = PickleLz4FullStore(d, interrupted_iter, GenericDoc, 'doc_id', ['doc_id'], block_size=block_size, build_workers=build_workers, checkpoint_every=1000)
+                with self.assertRaises(Interrupted):
+                    store.build()
+                self.assertFalse(store.built())
+                self.assertTrue(store.lookup.has_checkpoint())
+                store = PickleLz4FullStore(d, lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'], block_size=block_size, build_workers=build_workers, checkpoint_every=1000)
+                store.build()
+                self.assertTrue(store.built())
+                self.assertFalse(store.lookup.has_checkpoint())
+                self.assertEqual(list(iter(store)), docs)
+                self.assertEqual(store.get_many(['id0', 'id8999', 'id9000', 'id9999']), {'id0': docs[0], 'id8999': docs[8999], 'id9000': docs[9000], 'id9999': docs[9999]})
+                store.lookup.close()
+
+    def test_pickle_lz4_full_store_scan(self):
+        for doc_ids, key_field_prefix, block_size in [
+                ([f'seg{i // 10}-{i % 10:02d}' for i in range(50)], None, None),
+                ([f'clueweb-seg{i // 10}-{i % 10:02d}' for i in range(50)], 'clueweb-', 4),
+                ([str(i) for i in range(50)], None, None)]: # dense keys
+            docs = [GenericDoc(doc_id, f'text {doc_id}') for doc_id in doc_ids]
+            with tempfile.TemporaryDirectory() as d:
+                store = PickleLz4FullStore(d, lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'], key_field_prefix=key_field_prefix, block_size=block_size)
+                for kwargs in [{'prefix': doc_ids[23][:-2]}, {'prefix': doc_ids[23][:-1]}, {'prefix': ''}, {'prefix': 'x'},
+                               {'start': doc_ids[12], 'stop': doc_ids[31]}, {'start': doc_ids[45]}, {'stop': doc_ids[3]}, {'start': 'a', 'stop': 'zzz'}]:
+                    expected = [doc for doc in docs if (doc.doc_id.startswith(kwargs['prefix']) if 'prefix' in kwargs else kwargs.get('start', '') <= doc.doc_id < kwargs.get('stop', '\uffff'))]
+                    self.assertEqual(list(store.scan(**kwargs)), expected, kwargs)
+                store.lookup.close()
+
+    def test_pickle_lz4_full_store_resume_use_docstore(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i}') for i in range(5000)]
+        def interrupted_iter(it):
+            for i, doc in enumerate(it):
+                if i == 3500:
+                    raise Interrupted()
+                yield doc
+        with tempfile.TemporaryDirectory() as d, mock.patch.dict(os.environ, {'IR_DATASETS_DOCSTORE_CHECKPOINT': '1000'}):
+            with open(f'{d}/docs.tsv', 'wt') as f:
+                for doc in docs:
+                    f.write(f'{doc.doc_id}\t{doc.text}\n')
+            tsv = TsvDocs(LocalDownload(f'{d}/docs.tsv'))
+            store = tsv.docs_store()
+            store.init_iter_fn = lambda: interrupted_iter(tsv.docs_iter())
+            with self.assertRaises(Interrupted):
+                store.build()
+            self.assertTrue(store.lookup.has_checkpoint())
+            store.lookup.close()
+            store = tsv.docs_store()
+            store.build() # resumes from the source, through docs_iter (a DocstoreSplitter)
+            self.assertTrue(store.built())
+            self.assertEqual(list(iter(store)), docs)
+            store.lookup.close()
+
+    def test_dense_scan_ranges(self):
+        for base, count in [(0, 1234), (7, 1200), (95, 10), (0, 0)]:
+            keys = [str(base + i) for i in range(count)]
+            for kwargs in [{'prefix': '1'}, {'prefix': '10'}, {'prefix': '0'}, {'prefix': '99'}, {'prefix': ''}, {'prefix': 'x'},
+                           {'start': '2', 'stop': '35'}, {'start': '995'}, {'stop': '100'}, {'start': '1000', 'stop': '1000'},
+                           {'start': '10a', 'stop': '9'}, {'start': '', 'stop': '\uffff'}]:
+                if 'prefix' in kwargs:
+                    expected = [i for i, key in enumerate(keys) if key.startswith(kwargs['prefix'])]
+                else:
+                    expected = [i for i, key in enumerate(keys) if kwargs.get('start', '') <= key < kwargs.get('stop', '\uffff')]
+                ranges = _dense_scan_ranges(base, count, kwargs.get('start'), kwargs.get('stop'), kwargs.get('prefix'))
+                self.assertLessEqual(len(ranges), 4) # at most one per number of digits
+                self.assertEqual([i for lo, hi in ranges for i in range(lo, hi)], expected, (base, kwargs))
+
+    def test_lz4_pickle_iter_batches(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i}') for i in range(100)]
+        for block_size in [None, 16]:
+            with tempfile.TemporaryDirectory() as d:
+                idx = Lz4PickleLookup(d, GenericDoc, 'doc_id', ['doc_id'], block_size=block_size)
+                with idx.transaction() as trans:
+                    for doc in docs:
+                        trans.add(doc)
+                batches = list(iter(idx).iter_batches(30))
+                self.assertEqual([len(b['doc_id']) for b in batches], [30, 30, 30, 10])
+                self.assertEqual(batches[1], {'doc_id': [d.doc_id for d in docs[30:60]], 'text': [d.text for d in docs[30:60]]})
+                self.assertEqual(list(iter(idx)[5:50:10].iter_batches(2, fields=['text'])), [{'text': ['some text 5', 'some text 15']}, {'text': ['some text 25', 'some text 35']}, {'text': ['some text 45']}])
+                self.assertEqual(list(iter(idx)[10:90:2].take([0, 3, 39, 40])), [docs[10], docs[16], docs[88]])
+                idx.close()
+
+    def test_pickle_lz4_full_store_handle(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i} ' * (i % 7)) for i in range(500)]
+        doc_ids = ['id3', 'id499', 'missing', 'id250']
+        for block_size, hash_index in [(None, False), (16, True)]:
+            with tempfile.TemporaryDirectory() as d:
+                store = PickleLz4FullStore(d, lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'], block_size=block_size, hash_index=hash_index)
+                handle = store.handle()
+                data = pickle.dumps(handle)
+                self.assertLess(len(data), 2048) # the indices aren't copied
+                copy = pickle.loads(data)
+                self.assertIsNotNone(copy.lookup._idx.keylen) # metadata is not re-parsed
+                self.assertIsNone(copy.lookup._idx.mmap_keys)
+                self.assertEqual(copy.get_many(doc_ids), store.get_many(doc_ids))
+                with multiprocessing.get_context('spawn').Pool(2) as pool:
+                    results = pool.starmap(PickleLz4FullStore.get, [(handle, doc_id) for doc_id in doc_ids if doc_id != 'missing'])
+                self.assertEqual(results, [docs[3], docs[499], docs[250]])
+                copy.lookup.close()
+                store.lookup.close()
+
+    def test_lz4_pickle_iter_readahead(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i} ' * (i % 7)) for i in range(1000)]
+        for block_size in [None, 16]:
+            with tempfile.TemporaryDirectory() as d, mock.patch('ir_datasets.indices.lz4_pickle.READAHEAD_CHUNK', 512):
+                idx = Lz4PickleLookup(d, GenericDoc, 'doc_id', ['doc_id'], block_size=block_size, readahead=2)
+                with idx.transaction() as trans:
+                    for doc in docs:
+                        trans.add(doc)
+                it = iter(idx)
+                self.assertEqual(list(it), docs)
+                self.assertIsNotNone(it.readahead)
+                self.assertEqual(list(iter(idx)[103:871]), docs[103:871])
+                self.assertEqual(list(iter(idx)[5:50:10]), docs[5:50:10])
+                self.assertEqual(sum((b['doc_id'] for b in iter(idx)[7:500].iter_batches(64)), []), [d.doc_id for d in docs[7:500]])
+                # abandoned part-way
+                it = iter(idx)
+                self.assertEqual(next(it), docs[0])
+                thread = it.readahead.thread
+                del it
+                thread.join(5)
+                self.assertFalse(thread.is_alive())
+                idx.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,88 @@
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+from ir_datasets.indices import Lz4ShardedLookup, PickleLz4FullStore
+from ir_datasets.formats import GenericDoc
+from ir_datasets.util import take_ordinals
+
+
+class Interrupted(Exception):
+    pass
+
+
+class TestLz4ShardedLookup(unittest.TestCase):
+    def test_lz4_sharded_lookup(self):
+        for shard_by in ['hash', 'range']:
+            with tempfile.TemporaryDirectory() as d:
+                idx = Lz4ShardedLookup(d, GenericDoc, 'doc_id', ['doc_id'], shard_paths=[f'{d}/a', f'{d}/b', f'{d}/c'], shard_by=shard_by, shard_range=4)
+                self.assertEqual(tuple(idx['id3', 'id2']), tuple())
+                with idx.transaction() as trans:
+                    for i in range(30):
+                        trans.add(GenericDoc(f'id{i}', f'text {i}'))
+                self.assertEqual(len(idx), 30)
+                self.assertTrue(all(len(shard) > 0 for shard in idx._shards))
+                self.assertEqual(list(idx['id4']), [GenericDoc('id4', 'text 4')])
+                self.assertEqual(sorted(d.doc_id for d in idx['id9', 'missing', 'id1', 'id25']), ['id1', 'id25', 'id9'])
+                self.assertEqual(sorted(idx.get_fields(['id9', 'id1'], ['text'])), [('id1', ('text 1',)), ('id9', ('text 9',))])
+                self.assertEqual([d.doc_id for d in iter(idx)], [f'id{i}' for i in range(30)])
+                self.assertEqual([d.doc_id for d in iter(idx)[3:20:4]], ['id3', 'id7', 'id11', 'id15', 'id19'])
+                self.assertEqual(iter(idx)[-2].doc_id, 'id28')
+                self.assertEqual(sorted(d.doc_id for d in idx.scan(prefix='id2')), ['id2'] + [f'id{i}' for i in range(20, 30)])
+
+                with idx.transaction() as trans:
+                    trans.add(GenericDoc('id30', 'text 30'))
+                    trans.rollback()
+                with self.assertRaises(Interrupted):
+                    with idx.transaction() as trans:
+                        trans.add(GenericDoc('id31', 'text 31'))
+                        raise Interrupted()
+                self.assertEqual(len(idx), 30)
+                with idx.transaction() as trans:
+                    trans.add_all(GenericDoc(f'id{i}', f'text {i}') for i in range(30, 5000))
+                self.assertEqual([d.doc_id for d in iter(idx)], [f'id{i}' for i in range(5000)])
+                self.assertEqual([d.doc_id for d in iter(idx)[4090:4100]], [f'id{i}' for i in range(4090, 4100)])
+                # take() reads each record from its shard directly, rather than iterating up to it
+                ordinals = [0, 1, 7, 4095, 4096, 4097, 4999, 5000]
+                with mock.patch.object(idx, '_iter_slice', side_effect=AssertionError('iterated')):
+                    self.assertEqual([d.doc_id for d in iter(idx).take(ordinals)], [f'id{i}' for i in ordinals[:-1]])
+                    self.assertEqual([d.doc_id for d in iter(idx)[100::3].take([0, 2, 1500, 1633])], ['id100', 'id106', 'id4600', 'id4999'])
+                    self.assertEqual([d.doc_id for d in take_ordinals(iter(idx), range(0, 5000, 97))], [f'id{i}' for i in range(0, 5000, 97)])
+                idx.close()
+
+                # layout is detected from an existing store
+                idx = Lz4ShardedLookup(d, GenericDoc, 'doc_id', ['doc_id'])
+                self.assertEqual(idx._shard_by, shard_by)
+                self.assertEqual(list(idx['id4321']), [GenericDoc('id4321', 'text 4321')])
+                idx.clear()
+                self.assertFalse(os.path.exists(f'{d}/bin.shards'))
+                self.assertEqual(len(idx), 0)
+                idx.close()
+
+    def test_pickle_lz4_full_store_shards(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i} ' * (i % 7)) for i in range(3000)]
+        def interrupted_iter():
+            for i, doc in enumerate(docs):
+                if i == 2000:
+                    raise Interrupted()
+                yield doc
+        for block_size, build_workers in [(None, 1), (16, 2)]:
+            with tempfile.TemporaryDirectory() as d:
+                store = PickleLz4FullStore(d, interrupted_iter, GenericDoc, 'doc_id', ['doc_id'], block_size=block_size, build_workers=build_workers, shards=4)
+                with self.assertRaises(Interrupted):
+                    store.build()
+                self.assertFalse(store.built())
+                store = PickleLz4FullStore(d, lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'], block_size=block_size, build_workers=build_workers, shards=4)
+                self.assertEqual(store.get_many(['id0', 'id1234', 'id2999', 'missing']), {'id0': docs[0], 'id1234': docs[1234], 'id2999': docs[2999]})
+                self.assertEqual(list(iter(store)), docs)
+                self.assertEqual(store.count(), 3000)
+                self.assertEqual(sorted(d.doc_id for d in store.lookup_by('text', ['some text 5 ' * 5])), sorted(doc.doc_id for doc in docs if doc.text == 'some text 5 ' * 5))
+                copy = pickle.loads(pickle.dumps(store.handle()))
+                self.assertEqual(copy.get('id42'), docs[42])
+                copy.lookup.close()
+                store.lookup.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
+import os
 import tempfile
 import unittest
+from unittest import mock
 import numpy as np
-from ir_datasets.indices import NumpySortedIndex
+from ir_datasets.indices import NumpySortedIndex, PickleLz4FullStore
+from ir_datasets.formats import GenericDoc
 
 
 class TestNumpySortedIndex(unittest.TestCase):
@@ -48,6 +51,157 @@ class TestNumpySortedIndex(unittest.TestCase):
 
             idx.close()
 
+    def test_numpy_sorted_index_runs_env(self):
+        docs = [GenericDoc(f'id{i}', f'text {i % 13}') for i in range(500)]
+        spills = []
+        orig_spill = NumpySortedIndex._spill
+        def spill(self):
+            spills.append(len(self.transaction))
+            return orig_spill(self)
+        env = {'IR_DATASETS_INDEX_RUN_SIZE': '64', 'IR_DATASETS_INDEX_MERGE_CHUNK': '16'}
+        with tempfile.TemporaryDirectory() as d, mock.patch.dict(os.environ, env), mock.patch.object(NumpySortedIndex, '_spill', spill):
+            self.assertEqual((NumpySortedIndex(f'{d}/idx').max_run_size, NumpySortedIndex(f'{d}/idx').merge_chunk_size), (64, 16))
+            # the settings reach the indices that docstores build
+            store = PickleLz4FullStore(f'{d}/docs', lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id', 'text'])
+            store.build()
+            self.assertTrue(spills)
+            self.assertLessEqual(max(spills), 64)
+            self.assertEqual(store.get_many(['id0', 'id499', 'missing']), {'id0': docs[0], 'id499': docs[499]})
+            self.assertEqual(len(list(store.lookup_by('text', 'text 3'))), 39)
+            store.lookup.close()
+
+    def test_numpy_sorted_index_runs(self):
+        rng = np.random.RandomState(42)
+        expected = {}
+        with tempfile.TemporaryDirectory() as d:
+            idx = NumpySortedIndex(f'{d}/idx', max_run_size=7, merge_chunk_size=3)
+            for commit in range(3):
+                for i in range(50):
+                    key = f'key{rng.randint(100)}' * rng.randint(1, 3)
+                    value = int(rng.randint(1000))
+                    idx.add(key, value)
+                    expected[key] = value
+                idx.commit()
+                self.assertEqual(len(idx), len(expected))
+                self.assertEqual(tuple(iter(idx)), tuple(sorted(expected)))
+                keys = sorted(expected) + ['missing']
+                self.assertEqual(idx[keys], [expected.get(k, -1) for k in keys])
+            idx.add('rolled back', 1)
+            idx.add('rolled back 2', 1)
+            idx.rollback()
+            self.assertEqual(idx[['rolled back']], [-1])
+            self.assertEqual(len(idx), len(expected))
+            idx.close()
+
+    def test_numpy_sorted_index_hash(self):
+        rng = np.random.RandomState(42)
+        expected = {}
+        with tempfile.TemporaryDirectory() as d:
+            idx = NumpySortedIndex(f'{d}/idx', hash_index=True)
+            self.assertEqual(idx['key', 'missing'], [-1, -1])
+            for commit in range(3):
+                for i in range(500):
+                    key = f'key{rng.randint(1000)}'
+                    value = int(rng.randint(1000))
+                    idx.add(key, value)
+                    expected[key] = value
+                idx.commit()
+                keys = sorted(expected) + ['missing', 'key', 'key1000', 'key10000', '']
+                self.assertEqual(idx[keys], [expected.get(k, -1) for k in keys])
+            idx.close()
+            # an index built without hash_index gets a hash table on first use, and vice versa
+            idx = NumpySortedIndex(f'{d}/idx2')
+            for key, value in expected.items():
+                idx.add(key, value)
+            idx.commit()
+            idx.close()
+            idx = NumpySortedIndex(f'{d}/idx2', hash_index=True)
+            self.assertEqual(idx[keys], [expected.get(k, -1) for k in keys])
+            idx.close()
+            idx = NumpySortedIndex(f'{d}/idx', hash_index=False)
+            self.assertEqual(idx[keys], [expected.get(k, -1) for k in keys])
+            idx.close()
+
+    def test_numpy_sorted_index_tiered(self):
+        rng = np.random.RandomState(42)
+        expected = {}
+        with tempfile.TemporaryDirectory() as d:
+            idx = NumpySortedIndex(f'{d}/idx', hash_index=True, tiered=True, max_tiers=4)
+            max_tiers = 0
+            for commit in range(100):
+                for i in range(rng.randint(1, 20)):
+                    key = f'key{rng.randint(1000)}' * rng.randint(1, 3)
+                    value = int(rng.randint(1000))
+                    idx.add(key, value)
+                    expected[key] = value
+                idx.commit()
+                max_tiers = max(max_tiers, len(idx.tiers))
+                self.assertLessEqual(len(idx.tiers), 4)
+                keys = sorted(expected) + ['missing', 'key', '']
+                self.assertEqual(idx[keys], [expected.get(k, -1) for k in keys])
+            self.assertGreater(max_tiers, 1)
+            self.assertGreater(len(expected), idx.doccount) # not everything was merged into the base
+            self.assertEqual(len(idx), len(expected))
+            self.assertEqual(tuple(iter(idx)), tuple(sorted(expected)))
+            idx.close()
+            # tiers are read when re-opened, and merged into the base by a non-tiered commit
+            idx = NumpySortedIndex(f'{d}/idx')
+            self.assertEqual(idx[keys], [expected.get(k, -1) for k in keys])
+            idx.add('new', 1)
+            expected['new'] = 1
+            idx.commit()
+            self.assertEqual(idx.tiers, [])
+            self.assertEqual(idx.doccount, len(expected))
+            self.assertEqual(idx[keys + ['new']], [expected.get(k, -1) for k in keys + ['new']])
+            idx.clear()
+            self.assertEqual(len(idx), 0)
+            idx.close()
+
+    def test_numpy_sorted_index_multi(self):
+        with tempfile.TemporaryDirectory() as d:
+            for tiered in [False, True]:
+                idx = NumpySortedIndex(f'{d}/idx{tiered}', unique=False, tiered=tiered, max_run_size=3, merge_chunk_size=2)
+                self.assertEqual(idx.get_all(['a']), [[]])
+                for i in range(10):
+                    idx.add(f'k{i % 3}', i)
+                idx.add('k', 100)
+                idx.commit()
+                self.assertEqual(idx.get_all(['k0', 'k1', 'k', 'missing', 'k00']), [[0, 3, 6, 9], [1, 4, 7], [100], [], []])
+                idx.add('k1', 10)
+                idx.add('k3', 11)
+                idx.commit()
+                self.assertEqual(idx.get_all(['k1', 'k3']), [[1, 4, 7, 10], [11]])
+                self.assertEqual(len(idx), 13)
+                idx.close()
+
+    def test_numpy_sorted_index_scan(self):
+        keys = ['a', 'ab', 'abc', 'abd', 'b', 'ba', 'c']
+        with tempfile.TemporaryDirectory() as d:
+            for tiered in [False, True]:
+                idx = NumpySortedIndex(f'{d}/idx{tiered}', tiered=tiered)
+                keys_found, poss = idx.scan(prefix='a')
+                self.assertEqual(len(keys_found), 0)
+                for i, key in enumerate(keys[:4]):
+                    idx.add(key, i)
+                idx.commit()
+                for i, key in enumerate(keys[4:], start=4):
+                    idx.add(key, i)
+                idx.commit()
+                def scan(**kwargs):
+                    keys_found, poss = idx.scan(**kwargs)
+                    self.assertEqual(poss.tolist(), [keys.index(k.decode()) for k in keys_found])
+                    return [k.decode() for k in keys_found]
+                self.assertEqual(scan(prefix='ab'), ['ab', 'abc', 'abd'])
+                self.assertEqual(scan(prefix='b'), ['b', 'ba'])
+                self.assertEqual(scan(prefix='abcdef'), [])
+                self.assertEqual(scan(prefix=''), keys)
+                self.assertEqual(scan(start='ab', stop='b'), ['ab', 'abc', 'abd'])
+                self.assertEqual(scan(start='abcdef'), ['abd', 'b', 'ba', 'c'])
+                self.assertEqual(scan(stop='abcdef'), ['a', 'ab', 'abc'])
+                self.assertEqual(scan(start='b', stop='a'), [])
+                self.assertEqual(scan(), keys)
+                idx.close()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,101 @@
+import os
+import pickle
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from ir_datasets.datasets.base import Dataset
+from ir_datasets.indices import DocstoreServer, PickleLz4FullStore, RemoteDocstore
+from ir_datasets.formats import GenericDoc
+
+
+class FakeDocs:
+    def __init__(self, path, docs):
+        self.docs = docs
+        self.store = PickleLz4FullStore(path, lambda: iter(docs), GenericDoc, 'doc_id', ['doc_id'])
+
+    def dataset_id(self):
+        return 'fake'
+
+    def docs_handler(self):
+        return self
+
+    def docs_cls(self):
+        return GenericDoc
+
+    def docs_iter(self):
+        return iter(self.store)
+
+    def docs_store(self):
+        return self.store
+
+    def docs_count(self):
+        return len(self.docs)
+
+
+class FakeSubsetDocs(FakeDocs):
+    def __init__(self, path, docs, dataset_id):
+        super().__init__(path, docs)
+        self._dataset_id = dataset_id
+
+    def dataset_id(self):
+        return self._dataset_id
+
+
+class TestRemoteDocstore(unittest.TestCase):
+    def test_remote_docstore(self):
+        docs = [GenericDoc(f'id{i}', f'some text {i}') for i in range(3000)]
+        with tempfile.TemporaryDirectory() as d:
+            dataset = Dataset(FakeDocs(f'{d}/docs', docs))
+            server = DocstoreServer(f'{d}/docstore.sock', {'fake': dataset})
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                remote = RemoteDocstore(f'{d}/docstore.sock', 'fake', GenericDoc)
+                self.assertEqual(remote.get('id5'), docs[5])
+                self.assertEqual(remote.get_many(['id1', 'id2999', 'missing']), {'id1': docs[1], 'id2999': docs[2999]})
+                self.assertEqual(remote.get_many(['id1', 'id7'], field='text'), {'id1': 'some text 1', 'id7': 'some text 7'})
+                self.assertEqual(remote.count(), 3000)
+                self.assertEqual(list(iter(remote)), docs)
+                self.assertEqual(list(iter(remote)[1000:2500]), docs[1000:2500])
+                self.assertEqual(list(iter(remote)[1000:2500][-3:]), docs[2497:2500])
+                self.assertEqual(iter(remote)[-1], docs[-1])
+                # abandoning a stream part-way doesn't affect other requests
+                it = iter(remote)
+                self.assertEqual(next(it), docs[0])
+                self.assertEqual(remote.get('id10'), docs[10])
+                del it
+                self.assertEqual(pickle.loads(pickle.dumps(remote)).get('id11'), docs[11])
+                with self.assertRaises(RuntimeError):
+                    RemoteDocstore(f'{d}/docstore.sock', 'other', GenericDoc).get('id1')
+                with mock.patch.dict(os.environ, {'IR_DATASETS_DOCSTORE_SERVER': f'{d}/docstore.sock'}):
+                    store = dataset.docs_store()
+                    self.assertIsInstance(store, RemoteDocstore)
+                    self.assertEqual(store.get('id42'), docs[42])
+                self.assertIsInstance(Dataset(dataset).docs_store(), PickleLz4FullStore)
+                with mock.patch.dict(os.environ, {'IR_DATASETS_DOCSTORE_SERVER': f'{d}/docstore.sock'}):
+                    self.assertTrue(remote.served())
+                    self.assertFalse(RemoteDocstore(f'{d}/docstore.sock', 'other', GenericDoc).served())
+                    # datasets that aren't served use their local docstore
+                    other = Dataset(FakeSubsetDocs(f'{d}/other', docs[:10], 'other'))
+                    self.assertIsInstance(other.docs_store(), PickleLz4FullStore)
+                    # subsets use the docstore of their corpus
+                    server.datasets['antique'] = dataset
+                    subset = Dataset(FakeSubsetDocs(f'{d}/subset', docs[:10], 'antique/test'))
+                    store = subset.docs_store()
+                    self.assertIsInstance(store, RemoteDocstore)
+                    self.assertEqual(store.dataset_id, 'antique')
+                    self.assertEqual(store.get('id42'), docs[42])
+                # the local docstore is used when the server isn't running
+                with mock.patch.dict(os.environ, {'IR_DATASETS_DOCSTORE_SERVER': f'{d}/missing.sock'}):
+                    self.assertIsInstance(Dataset(FakeSubsetDocs(f'{d}/other', docs[:10], 'other')).docs_store(), PickleLz4FullStore)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            self.assertFalse(os.path.exists(f'{d}/docstore.sock'))
+            dataset.docs_store().lookup.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
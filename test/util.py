@@ -20,6 +20,20 @@ class TestUtil(unittest.TestCase):
     	self.assertEqual(ass(slice(0, 100), slice(1/3, 2/3)), slice(33, 66))
     	self.assertEqual(ass(slice(0, 100), slice(2/3, 3/3)), slice(66, 100))
 
+    def test_apply_sub_slice_step(self):
+        ass = ir_datasets.util.apply_sub_slice
+        # the new slice indexes the items of the stepped slice
+        self.assertEqual(ass(slice(0, 100, 2), slice(0, 5)), slice(0, 10, 2))
+        self.assertEqual(ass(slice(0, 100, 2), slice(1, None)), slice(2, 100, 2))
+        self.assertEqual(ass(slice(3, 100, 2), slice(2, 4, 3)), slice(7, 11, 6))
+        self.assertEqual(ass(slice(0, 99, 2), slice(-2, None)), slice(96, 99, 2))
+        self.assertEqual(ass(slice(0, 99, 2), slice(None, -48)), slice(0, 4, 2))
+        self.assertEqual(ir_datasets.util.slice_idx(slice(1, 99, 3), 2), slice(7, 8))
+        self.assertEqual(ir_datasets.util.slice_idx(slice(1, 99, 3), -1), slice(97, 98))
+        items = list(range(100))
+        for orig, new in [(slice(0, 100, 2), slice(0, 5)), (slice(5, 97, 3), slice(-4, -1, 2)), (slice(0, 100, 7), slice(20, None))]:
+            self.assertEqual(items[ass(orig, new)], items[orig][new])
+
     def test_corpus_id(self):
         # typical
         self.assertEqual(ir_datasets.corpus_id("msmarco-document/trec-dl-2019/judged"), "msmarco-document")